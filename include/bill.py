@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+import os
+import re
+import html
+import logging
+import zipfile
+import tempfile
+import threading
+
+# Line of a bill of arrecadacao: 4 blocks of 11 digits, each one followed by its verification digit
+LINE = re.compile(rb'(8\d{10})[ -]?(\d)\s+(\d{11})[ -]?(\d)\s+(\d{11})[ -]?(\d)\s+(\d{11})[ -]?(\d)')
+DUE_DATE = re.compile(rb'(?:vencimento|pagar este documento at.)\D{0,40}?(\d{2}/\d{2}/\d{4})', re.IGNORECASE)
+TAGS = re.compile(rb'<[^>]*>')
+_prompt_lock = threading.Lock()
+
+# Calculate the verification digit of a block in module 10
+#----------------------------------------------------------------------------------------------------------------------
+def _module10(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        product = int(digit) * (2 if position % 2 == 0 else 1)
+        total += product // 10 + product % 10
+    return (10 - total % 10) % 10
+
+# Calculate the verification digit of a block in module 11
+#----------------------------------------------------------------------------------------------------------------------
+def _module11(digits):
+    total = sum(int(digit) * (position % 8 + 2) for position, digit in enumerate(reversed(digits)))
+    remainder = total % 11
+    return 0 if remainder in (0, 1) else 11 - remainder
+
+# Calculate the verification digit of a block (the third digit of the barcode chooses the module)
+#----------------------------------------------------------------------------------------------------------------------
+def _verification_digit(barcode, digits):
+    return _module10(digits) if barcode[2] in '67' else _module11(digits)
+
+# Build the line of a bill from its barcode of 44 digits
+#----------------------------------------------------------------------------------------------------------------------
+def barcode_line(barcode):
+    blocks = [barcode[i:i + 11] for i in range(0, 44, 11)]
+    return ' '.join('%s-%d' %(block, _verification_digit(barcode, block)) for block in blocks)
+
+# Extract the barcode and the fields of a bill document, html or pdf without compression (return a dict with barcode,
+# line, value and due_date, None if the line is not found or its verification digits are wrong)
+#----------------------------------------------------------------------------------------------------------------------
+def extract_fields(content):
+    logging.debug('Extracting the fields of the bill...')
+    text = html.unescape(TAGS.sub(b' ', content).decode('latin-1')).encode('latin-1', 'replace')
+    match = LINE.search(text)
+    if (match is None):
+        logging.warning('Line of the bill not found!')
+        return None
+    blocks = [block.decode('ascii') for block in match.groups()]
+    barcode = ''.join(blocks[0::2])
+    if (any(int(blocks[i + 1]) != _verification_digit(barcode, blocks[i]) for i in range(0, 8, 2))):
+        logging.warning('Line of the bill with wrong verification digits!')
+        return None
+    fields = {'barcode': barcode, 'line': barcode_line(barcode), 'value': None, 'due_date': None}
+    if (barcode[2] in '68'):
+        fields['value'] = int(barcode[4:15]) / 100
+    due_date = DUE_DATE.search(text)
+    if (due_date is not None):
+        fields['due_date'] = due_date.group(1).decode('ascii')
+    return fields
+
+# Mask a cpf for the records and the logs (only its last 2 digits are kept)
+#----------------------------------------------------------------------------------------------------------------------
+def mask_cpf(cpf):
+    digits = re.sub(r'\D', '', cpf)
+    return '*' * (len(digits) - 2) + digits[-2:]
+
+# Get a name for the bill of a cpf and period that is not used yet in a directory (darf-<cpf>-<yyyymm>[-n].<extension>)
+#----------------------------------------------------------------------------------------------------------------------
+def bill_path(directory, cpf, date, extension):
+    base = os.path.join(directory, 'darf-%s-%s' %(re.sub(r'\D', '', cpf), date.strftime('%Y%m')))
+    path = base + extension
+    number = 1
+    while (os.path.exists(path)):
+        number += 1
+        path = '%s-%d%s' %(base, number, extension)
+    return path
+
+# Save the document returned by the government system as a bill (return (path, fields))
+#----------------------------------------------------------------------------------------------------------------------
+def save_bill(directory, cpf, date, content, content_type=''):
+    logging.debug('Saving the bill of %s...', cpf)
+    extension = '.pdf' if 'pdf' in content_type or content.startswith(b'%PDF') else '.html'
+    path = bill_path(directory, cpf, date, extension)
+    # The name is reserved with the exclusive mode, so concurrent bills of the same cpf and period never overwrite
+    while True:
+        try:
+            with open(path, 'xb') as f:
+                f.write(content)
+            break
+        except FileExistsError:
+            path = bill_path(directory, cpf, date, extension)
+    return path, extract_fields(content)
+
+# Ask the captcha of a bill to the user in the console. The image is saved in a file of its own in the directory (the
+# jobs generating bills in parallel never overwrite the image of each other) and the prompts are asked one at a time.
+#----------------------------------------------------------------------------------------------------------------------
+def ask_captcha(directory, cpf, date, image):
+    logging.debug('Asking the captcha of %s...', cpf)
+    descriptor, path = tempfile.mkstemp('.jpg', 'captcha-%s-%s-' %(re.sub(r'\D', '', cpf), date.strftime('%Y%m')),
+        directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(image)
+        with _prompt_lock:
+            return input("Enter the captcha of %s (%s): " %(date.strftime('%m/%Y'), path))
+    finally:
+        os.remove(path)
+
+# Export the bills of a month of a directory in a single zip archive (return the number of bills exported)
+#----------------------------------------------------------------------------------------------------------------------
+def export_month(directory, month, year, archive):
+    logging.debug('Exporting the bills of %d-%d...', month, year)
+    pattern = re.compile(r'^darf-\d+-%d%02d(-\d+)?\.(pdf|html)$' %(year, month))
+    names = sorted(name for name in os.listdir(directory) if pattern.match(name))
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as output:
+        for name in names:
+            output.write(os.path.join(directory, name), name)
+    logging.debug('%d bills exported!', len(names))
+    return len(names)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -5,29 +5,92 @@ import time
 import base64
 import logging
 import datetime
+import threading
 from shutil import copy
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
+from include import bill
+from include.session_pool import SessionPool
+
+ENDPOINT = "http://www31.receita.fazenda.gov.br/SicalcWeb/UF.asp?AP=P&Person=N&TipTributo=1&FormaPagto=1"
+_driver_lock = threading.Lock()
+
+# Selenium is imported by the first generator, so importing this module does not load the browser stack
+webdriver = By = Keys = expected_conditions = WebDriverWait = TimeoutException = None
+
+# Import selenium in the globals of the module (only once)
+#----------------------------------------------------------------------------------------------------------------------
+def _import_selenium():
+    global webdriver, By, Keys, expected_conditions, WebDriverWait, TimeoutException
+    if (webdriver is None):
+        logging.debug('Importing selenium...')
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException
+
+# Start a new headless chrome session (the driver is copied to /tmp only once)
+#----------------------------------------------------------------------------------------------------------------------
+def new_session():
+    logging.debug('Starting a new headless chrome session...')
+    _import_selenium()
+    with _driver_lock:
+        if (not os.path.exists("/tmp/chromedriver")):
+            copy(os.path.dirname(__file__) + "/../libs/chromedriver", "/tmp/chromedriver")
+            os.chmod("/tmp/chromedriver", 0o775)
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    return webdriver.Chrome(executable_path="/tmp/chromedriver", options=options)
 
 class DarfGenerator:
 
-# Initialize the class with its properties
+# Initialize the class with its properties (the browser sessions are taken from the given pool, so many generators
+# or concurrent calls of generate share warm browsers, else from a private pool of one session)
 #----------------------------------------------------------------------------------------------------------------------
-    def __init__(self, debug=False):
-        self.__endpoint = "http://www31.receita.fazenda.gov.br/SicalcWeb/UF.asp?AP=P&Person"\
-            + "=N&TipTributo=1&FormaPagto=1"
-        copy(os.path.dirname(__file__) + "/../libs/chromedriver", "/tmp/chromedriver")
-        os.chmod("/tmp/chromedriver", 0o775)
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')
-        self.__web = webdriver.Chrome(executable_path="/tmp/chromedriver", options=options)
+    def __init__(self, debug=False, pool=None, endpoint=ENDPOINT, timeout=30.0, alert_timeout=2.0):
+        _import_selenium()
+        self.__endpoint = endpoint
+        self.__timeout = timeout
+        self.__alert_timeout = alert_timeout
+        self.__own_pool = pool is None
+        self.__pool = SessionPool(new_session, 1, debug) if pool is None else pool
+        self.__local = threading.local()
+        self.__downloads = os.path.dirname(__file__) + "/../downloads"
         self.__debug = debug
 
+# Get the browser session used by the current thread
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def __web(self):
+        return self.__local.web
+
+# Get the time spent in each step of the last darf generated by the current thread
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def timings(self):
+        logging.debug('Returning the timings of the last darf...')
+        return getattr(self.__local, 'timings', None)
+
+# Wait until a condition is true for the session of the current thread (return the value of the condition)
+#----------------------------------------------------------------------------------------------------------------------
+    def __wait(self, condition, timeout=None):
+        return WebDriverWait(self.__web, self.__timeout if timeout is None else timeout).until(condition)
+
+# Run a step of the generation recording the time spent on it
+#----------------------------------------------------------------------------------------------------------------------
+    def __step(self, name, function, *args):
+        logging.debug('Executing the step %s...', name)
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.__local.timings['steps'][name] = time.perf_counter() - start
+
 # Find html option in a list of options
 #----------------------------------------------------------------------------------------------------------------------
     def __find_option(self, option):
         logging.debug('Finding the option %s...', option)
-        options = self.__web.find_element_by_tag_name('select')
+        options = self.__wait(expected_conditions.presence_of_element_located((By.TAG_NAME, 'select')))
         for possible_option in options.find_elements_by_tag_name('option'):
             if possible_option.text == option:
                 possible_option.click()
@@ -38,13 +101,14 @@ class DarfGenerator:
 #----------------------------------------------------------------------------------------------------------------------
     def __proceed_next_step(self, button=2):
         logging.debug('Proceeding to next step clicking in continue button...')
-        self.__web.find_element_by_xpath('//*[@id="botoes"]/input[%d]'%button).click()
+        button = (By.XPATH, '//*[@id="botoes"]/input[%d]'%button)
+        self.__wait(expected_conditions.element_to_be_clickable(button)).click()
 
 # Insert government code
 #----------------------------------------------------------------------------------------------------------------------
     def __insert_government_code(self):
         logging.debug('Inserting government code...')
-        self.__web.find_element_by_name('CodReceita').send_keys('6015')
+        self.__wait(expected_conditions.presence_of_element_located((By.NAME, 'CodReceita'))).send_keys('6015')
         self.__proceed_next_step()
 
 # Insert darf period and value
@@ -53,13 +117,13 @@ class DarfGenerator:
         logging.debug('Inserting darf period and value...')
         #handle alert if it appears
         try:
-            self.__web.switch_to.alert.accept()
-        except:
+            self.__wait(expected_conditions.alert_is_present(), self.__alert_timeout).accept()
+        except TimeoutException:
             logging.debug("Alerta nao apareceu!")
 
         logging.debug('Inserting period...')
         date = period.strftime("%m%Y")
-        self.__web.find_element_by_name('PA').send_keys(date)
+        self.__wait(expected_conditions.presence_of_element_located((By.NAME, 'PA'))).send_keys(date)
         logging.debug('Inserting value...')
         self.__web.find_element_by_name('TxtValRec').send_keys("%.2f" %value)
         self.__proceed_next_step(3)
@@ -77,10 +141,10 @@ class DarfGenerator:
 #----------------------------------------------------------------------------------------------------------------------
     def __fill_cpf(self, cpf):
         logging.debug('Filling the cpf number...')
-        self.__web.find_element_by_name('Num_Princ').send_keys(cpf[:9])
+        self.__wait(expected_conditions.presence_of_element_located((By.NAME, 'Num_Princ'))).send_keys(cpf[:9])
         self.__web.find_element_by_name('Num_DV').send_keys(cpf[-2:])
 
-# Download the captcha
+# Download the captcha (return the image in memory)
 #----------------------------------------------------------------------------------------------------------------------
     def __download_captcha(self):
         logging.debug('Downloading the captcha...')
@@ -90,9 +154,8 @@ class DarfGenerator:
             cnv.width = ele.width; cnv.height = ele.height;
             cnv.getContext('2d').drawImage(ele, 0, 0);
             return cnv.toDataURL('captcha/jpeg').substring(22);    
-            """, self.__web.find_element_by_id("img_captcha_serpro_gov_br"))
-        with open(r"../downloads/captcha.jpg", 'wb') as f:
-            f.write(base64.b64decode(captcha))
+            """, self.__wait(expected_conditions.visibility_of_element_located((By.ID, "img_captcha_serpro_gov_br"))))
+        return base64.b64decode(captcha)
 
 # Solving the captcha
 #----------------------------------------------------------------------------------------------------------------------
@@ -100,51 +163,95 @@ class DarfGenerator:
         logging.debug('Solving the captcha...')
         solved = False
         while (not solved):
-            self.__download_captcha()
-            captcha_answer = input("Enter the solved captcha: ")
-            self.__web.find_element_by_id("txtTexto_captcha_serpro_gov_br").send_keys(captcha_answer)
+            image = self.__download_captcha()
+            start = time.perf_counter()
+            captcha_answer = self.__local.captcha_solver(image)
+            self.__local.timings['captcha_input'] += time.perf_counter() - start
+            field = self.__wait(expected_conditions.presence_of_element_located((By.ID,
+                "txtTexto_captcha_serpro_gov_br")))
+            field.send_keys(captcha_answer)
             self.__proceed_next_step()
-            try:
-                time.sleep(2)
-                self.__web.find_element_by_id("txtTexto_captcha_serpro_gov_br")
+            # The form is submitted: the captcha is right if the next page has no captcha field
+            self.__wait(expected_conditions.staleness_of(field))
+            self.__wait(lambda web: web.execute_script('return document.readyState') == 'complete')
+            if (self.__web.find_elements_by_id("txtTexto_captcha_serpro_gov_br")):
                 logging.error('Captcha wrong. Try again!')
-            except:
+            else:
                 solved = True
 
-# Save darf bill
+# Save darf bill (the document of the new window is printed to pdf by chrome, and saved with a name per cpf and period)
 #----------------------------------------------------------------------------------------------------------------------
-    def __save_bill(self, name):
+    def __save_bill(self, cpf, date):
         logging.debug('Saving the darf bill...')
+        windows = len(self.__web.window_handles)
         self.__proceed_next_step()
-        time.sleep(2)
+        self.__wait(expected_conditions.number_of_windows_to_be(windows + 1))
         self.__web.switch_to.window(window_name=self.__web.window_handles[-1])
-        time.sleep(2)
-        self.__web.save_screenshot(os.path.dirname(__file__) + "/../downloads/%s" %name)
+        self.__wait(lambda web: web.execute_script('return document.readyState') == 'complete')
+        document = self.__web.execute_cdp_cmd('Page.printToPDF', {'printBackground': True})
+        content = base64.b64decode(document['data'])
+        self.__local.timings['bill'], _ = bill.save_bill(self.__downloads, cpf, date, content, 'application/pdf')
+        # The pdf is compressed, so the fields are read from the page
+        self.__local.timings['fields'] = bill.extract_fields(self.__web.page_source.encode('utf-8'))
 
-# Generate the darf using governement system
+# Generate the darf using governement system (return the structured record of the time spent in each step, with the
+# masked cpf and the path and the fields of the bill saved). The captcha_solver receives the captcha image and returns
+# its text, asking the user if not given.
 #----------------------------------------------------------------------------------------------------------------------
-    def generate(self, cpf, date, value):
+    def generate(self, cpf, date, value, captcha_solver=None):
         logging.debug('Generating the darf for user %s...', cpf)
+        # Without a solver, the captcha of this bill is asked in the console with an image of its own
+        self.__local.captcha_solver = captcha_solver or (lambda image: bill.ask_captcha(self.__downloads, cpf, date,
+            image))
+        self.__local.timings = {'cpf': bill.mask_cpf(cpf), 'period': date.strftime("%m/%Y"), 'steps': {},
+            'captcha_input': 0.0, 'total': 0.0, 'error': None, 'bill': None, 'fields': None}
+        start = time.perf_counter()
+        try:
+            with self.__pool.session() as web:
+                self.__local.web = web
+                try:
+                    self.__generate(cpf, date, value)
+                finally:
+                    self.__local.web = None
+        except Exception as error:
+            self.__local.timings['error'] = '%s: %s' %(type(error).__name__, error)
+            raise
+        finally:
+            self.__local.timings['total'] = time.perf_counter() - start
+            logging.debug('Darf timings: %s', self.__local.timings)
+        return self.__local.timings
+
+# Fill the forms of the government system with the session of the current thread
+#----------------------------------------------------------------------------------------------------------------------
+    def __generate(self, cpf, date, value):
         #Navigate to the government system
-        self.__web.get(self.__endpoint)
+        self.__step('navigate', self.__web.get, self.__endpoint)
         #Select state and city
-        self.__select_state_and_city("SP - SAO PAULO", "SAO PAULO")
+        self.__step('state_city', self.__select_state_and_city, "SP - SAO PAULO", "SAO PAULO")
         #Insert darf government code
-        self.__insert_government_code()
-        #time.sleep(5)
-        #Insert darf period and value
-        self.__insert_period_and_value(date, value)
-        #Check information and continue
-        self.__proceed_next_step()
+        self.__step('code', self.__insert_government_code)
+        #Insert darf period and value and check information and continue
+        self.__step('period_value', self.__insert_period_and_value, date, value)
+        self.__step('check', self.__proceed_next_step)
         #Fill CPF number
-        self.__fill_cpf(cpf)
-        #Solve captcha
-        self.__solve_captcha()
+        self.__step('cpf', self.__fill_cpf, cpf)
+        #Solve captcha (the time waiting for the answer is in captcha_input)
+        self.__step('captcha', self.__solve_captcha)
         #Save darf bill
-        self.__save_bill("darf.png")
-        #Finish generation
-        self.__web.close()
-        self.__web.quit()
+        self.__step('save', self.__save_bill, cpf, date)
+
+# Set the directory of the bills
+#----------------------------------------------------------------------------------------------------------------------
+    def set_downloads(self, path):
+        logging.debug('Setting the downloads directory: %s', path)
+        self.__downloads = path
+
+# Quit the browser sessions if the pool is not shared
+#----------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        logging.debug('Closing the darf generator...')
+        if (self.__own_pool):
+            self.__pool.close()
 
 #----------------------------------------------------------------------------------------------------------------------
 
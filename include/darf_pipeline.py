@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+import asyncio
+import inspect
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class CaptchaQueue:
+
+# Initialize the class with its properties (the captchas waiting for a solver and the answers waited by each job)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, debug=False):
+        self.__requests = asyncio.Queue()
+        self.__answers = {}
+        self.__debug = debug
+
+# Get the jobs waiting for the answer of a captcha
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def pending(self):
+        logging.debug('Returning the jobs waiting for a captcha...')
+        return list(self.__answers)
+
+# Publish the captcha of a job and wait for its answer (return the text of the captcha)
+#----------------------------------------------------------------------------------------------------------------------
+    async def solve(self, job, image):
+        logging.debug('Publishing the captcha of the job %s...', job)
+        answer = asyncio.get_running_loop().create_future()
+        self.__answers[job] = answer
+        await self.__requests.put((job, image))
+        try:
+            return await answer
+        finally:
+            self.__answers.pop(job, None)
+
+# Take the next captcha to solve (return (job, image))
+#----------------------------------------------------------------------------------------------------------------------
+    async def get(self):
+        return await self.__requests.get()
+
+# Answer the captcha of a job (return False if the job is not waiting for an answer)
+#----------------------------------------------------------------------------------------------------------------------
+    def answer(self, job, text):
+        logging.debug('Answering the captcha of the job %s...', job)
+        answer = self.__answers.get(job)
+        if (answer is None or answer.done()):
+            logging.warning('Job: %s is not waiting for a captcha!', job)
+            return False
+        answer.set_result(text)
+        return True
+
+# Fail the captcha of a job (the error is raised in the job)
+#----------------------------------------------------------------------------------------------------------------------
+    def fail(self, job, error):
+        logging.debug('Failing the captcha of the job %s...', job)
+        answer = self.__answers.get(job)
+        if (answer is None or answer.done()):
+            return False
+        answer.set_exception(error)
+        return True
+
+# Solve the captchas of a queue forever with a solver (a function or coroutine receiving (job, image) and returning the
+# text: a human interface, an ocr model or a stub in the tests)
+#----------------------------------------------------------------------------------------------------------------------
+async def run_solver(captcha_queue, solver):
+    logging.debug('Starting a captcha solver...')
+    while True:
+        job, image = await captcha_queue.get()
+        try:
+            text = solver(job, image)
+            if (inspect.isawaitable(text)):
+                text = await text
+            captcha_queue.answer(job, text)
+        except Exception as error:
+            logging.error('Error solving the captcha of the job %s: %s', job, error)
+            captcha_queue.fail(job, error)
+
+class DarfPipeline:
+
+# Initialize the class with its properties (generator is a DarfGenerator or a SicalcClient, whose blocking steps run in
+# up to concurrency threads, and the captchas of all the jobs are published in the captcha queue)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, generator, captcha_queue, concurrency=4, debug=False):
+        self.__generator = generator
+        self.__captcha_queue = captcha_queue
+        self.__concurrency = concurrency
+        self.__debug = debug
+
+# Generate the darf of a job, parking it at the captcha step until its answer arrives (return the record of the bill)
+#----------------------------------------------------------------------------------------------------------------------
+    async def generate(self, job, cpf, date, value, executor=None):
+        logging.debug('Generating the darf of the job %s...', job)
+        loop = asyncio.get_running_loop()
+        def captcha_solver(image):
+            return asyncio.run_coroutine_threadsafe(self.__captcha_queue.solve(job, image), loop).result()
+        return await loop.run_in_executor(executor, functools.partial(self.__generator.generate, cpf, date, value,
+            captcha_solver=captcha_solver))
+
+# Generate the darfs of many jobs concurrently ({job: (cpf, date, value)}), each job failing alone (return {job:
+# record}, with the error of the job in record['error'])
+#----------------------------------------------------------------------------------------------------------------------
+    async def run(self, jobs):
+        logging.debug('Generating %d darfs...', len(jobs))
+        with ThreadPoolExecutor(self.__concurrency) as executor:
+            results = await asyncio.gather(*(self.generate(job, *values, executor=executor)
+                for job, values in jobs.items()), return_exceptions=True)
+        records = {}
+        for job, result in zip(jobs, results):
+            if (isinstance(result, BaseException)):
+                logging.error('Error generating the darf of the job %s: %s', job, result)
+                result = {'error': '%s: %s' %(type(result).__name__, result)}
+            records[job] = result
+        return records
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+import logging
+import sqlite3
+from include.stock import Stock
+from include.stock import StockTypes
+from include.snapshot import MonthSnapshot
+from include.transaction import Transaction
+from include.transaction import TransactionTypes
+
+CATEGORIES = ('normal', 'day_trade', 'fi')
+STOCK_TYPES = {stock_type.value: stock_type for stock_type in StockTypes}
+TRANSACTION_TYPES = {transaction_type.value: transaction_type for transaction_type in TransactionTypes}
+
+# Money columns are integer units of 1e-8 reais (see include/money.py)
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS stocks (
+        name TEXT PRIMARY KEY, price INTEGER, category INTEGER, ammount INTEGER, paid_fares INTEGER);
+    CREATE TABLE IF NOT EXISTS transactions (
+        operation_id INTEGER PRIMARY KEY, name TEXT, price INTEGER, category INTEGER, ammount INTEGER,
+        paid_fares INTEGER, year INTEGER, month INTEGER, day INTEGER, operation_type INTEGER);
+    CREATE INDEX IF NOT EXISTS transactions_date ON transactions (year, month, day);
+    CREATE INDEX IF NOT EXISTS transactions_name ON transactions (name);
+    CREATE TABLE IF NOT EXISTS month_results (
+        year INTEGER, month INTEGER, accumulated_darf INTEGER, darf_value INTEGER,
+        accumulated_loss_normal INTEGER, accumulated_loss_day_trade INTEGER, accumulated_loss_fi INTEGER,
+        total_purchase_normal INTEGER, total_purchase_day_trade INTEGER, total_purchase_fi INTEGER,
+        total_sale_normal INTEGER, total_sale_day_trade INTEGER, total_sale_fi INTEGER,
+        total_profit_normal INTEGER, total_profit_day_trade INTEGER, total_profit_fi INTEGER,
+        total_due_tax_normal INTEGER, total_due_tax_day_trade INTEGER, total_due_tax_fi INTEGER,
+        PRIMARY KEY (year, month));
+    CREATE TABLE IF NOT EXISTS month_positions (
+        year INTEGER, month INTEGER, name TEXT, price INTEGER, category INTEGER, ammount INTEGER, paid_fares INTEGER,
+        PRIMARY KEY (year, month, name));
+"""
+
+class Database:
+
+# Initialize the class with its properties
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, path, debug=False):
+        logging.debug('Opening the database: %s', path)
+        self.__connection = sqlite3.connect(path)
+        self.__connection.executescript(SCHEMA)
+        self.__debug = debug
+
+# Save the changes in a single database transaction: the stocks (None if they did not change), the transactions
+# added or edited, the ids of the ones removed, the month snapshots calculated again and the first period invalidated
+# (its snapshots and the ones after it are deleted)
+#----------------------------------------------------------------------------------------------------------------------
+    def save(self, stocks, transactions, removed_transactions, snapshots, invalidated_period):
+        logging.debug('Saving %d transactions and %d snapshots...', len(transactions), len(snapshots))
+        with self.__connection:
+            if (stocks is not None):
+                self.__connection.execute('DELETE FROM stocks')
+                self.__connection.executemany('INSERT INTO stocks VALUES (?, ?, ?, ?, ?)',
+                    ((stock.name, stock.price_units, stock.category.value, stock.ammount, stock.paid_fares_units)
+                    for stock in stocks))
+            self.__connection.executemany('DELETE FROM transactions WHERE operation_id = ?',
+                ((operation_id,) for operation_id in removed_transactions))
+            self.__connection.executemany('INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((transaction.operation_id, transaction.name, transaction.price_units, transaction.category.value,
+                transaction.ammount, transaction.paid_fares_units, transaction.operation_date.year,
+                transaction.operation_date.month, transaction.operation_date.day, transaction.operation_type.value)
+                for transaction in transactions))
+            if (invalidated_period is not None):
+                for table in ('month_results', 'month_positions'):
+                    self.__connection.execute('DELETE FROM %s WHERE year > ? OR (year = ? AND month >= ?)' %table,
+                        (invalidated_period[0], invalidated_period[0], invalidated_period[1]))
+            for snapshot in snapshots:
+                self.__save_snapshot(snapshot)
+
+# Save a month snapshot (results and positions)
+#----------------------------------------------------------------------------------------------------------------------
+    def __save_snapshot(self, snapshot):
+        year, month = snapshot.period
+        values = [year, month, snapshot.accumulated_darf, snapshot.darf_value]
+        for totals in (snapshot.accumulated_loss, snapshot.total_purchase, snapshot.total_sale, snapshot.total_profit,
+            snapshot.total_due_tax):
+            values.extend(totals[category] for category in CATEGORIES)
+        self.__connection.execute('INSERT OR REPLACE INTO month_results VALUES (%s)' %', '.join('?' * len(values)),
+            values)
+        self.__connection.execute('DELETE FROM month_positions WHERE year = ? AND month = ?', (year, month))
+        self.__connection.executemany('INSERT INTO month_positions VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((year, month, stock.name, stock.price_units, stock.category.value, stock.ammount, stock.paid_fares_units)
+            for stock in snapshot.stocks.values()))
+
+# Build a stock from a row (money in units)
+#----------------------------------------------------------------------------------------------------------------------
+    def __stock(self, name, price, category, ammount, paid_fares):
+        stock = Stock(name, 0.0, STOCK_TYPES[category], ammount, 0.0, self.__debug)
+        stock.price_units = price
+        stock.paid_fares_units = paid_fares
+        return stock
+
+# Load the stocks
+#----------------------------------------------------------------------------------------------------------------------
+    def load_stocks(self):
+        logging.debug('Loading the stocks...')
+        cursor = self.__connection.execute('SELECT name, price, category, ammount, paid_fares FROM stocks')
+        return [self.__stock(name, price, category, ammount, paid_fares)
+            for name, price, category, ammount, paid_fares in cursor]
+
+# Load the transactions (all of them, or the ones of the (year, month) periods from first to last, both included)
+# without reading them all in memory
+#----------------------------------------------------------------------------------------------------------------------
+    def load_transactions(self, first=None, last=None):
+        logging.debug('Loading the transactions from %s to %s...', first, last)
+        query = 'SELECT name, price, category, ammount, paid_fares, day, month, year, operation_type, operation_id ' \
+            'FROM transactions'
+        conditions = []
+        values = []
+        if (first is not None):
+            conditions.append('(year > ? OR (year = ? AND month >= ?))')
+            values.extend((first[0], first[0], first[1]))
+        if (last is not None):
+            conditions.append('(year < ? OR (year = ? AND month <= ?))')
+            values.extend((last[0], last[0], last[1]))
+        if (conditions):
+            query += ' WHERE ' + ' AND '.join(conditions)
+        cursor = self.__connection.execute(query + ' ORDER BY year, month, day', values)
+        for name, price, category, ammount, paid_fares, day, month, year, operation_type, operation_id in cursor:
+            transaction = Transaction(name, 0.0, STOCK_TYPES[category], ammount, 0.0, day, month, year,
+                TRANSACTION_TYPES[operation_type], operation_id, self.__debug)
+            transaction.price_units = price
+            transaction.paid_fares_units = paid_fares
+            yield transaction
+
+# Get the greatest operation id saved (0 without transactions), the months not loaded included
+#----------------------------------------------------------------------------------------------------------------------
+    def last_operation_id(self):
+        logging.debug('Getting the last operation id...')
+        return self.__connection.execute('SELECT MAX(operation_id) FROM transactions').fetchone()[0] or 0
+
+# Load the month snapshots (all of them or only the last one before a period)
+#----------------------------------------------------------------------------------------------------------------------
+    def load_snapshots(self, before=None):
+        logging.debug('Loading the month snapshots...')
+        if (before is not None):
+            cursor = self.__connection.execute('SELECT * FROM month_results WHERE year < ? OR (year = ? AND month < ?) '
+                'ORDER BY year DESC, month DESC LIMIT 1', (before[0], before[0], before[1]))
+        else:
+            cursor = self.__connection.execute('SELECT * FROM month_results ORDER BY year, month')
+        snapshots = []
+        for row in cursor.fetchall():
+            year, month, accumulated_darf, darf_value = row[:4]
+            totals = [dict(zip(CATEGORIES, row[i:i + 3])) for i in range(4, len(row), 3)]
+            positions = self.__connection.execute('SELECT name, price, category, ammount, paid_fares '
+                'FROM month_positions WHERE year = ? AND month = ?', (year, month))
+            stocks = {name: self.__stock(name, price, category, ammount, paid_fares)
+                for name, price, category, ammount, paid_fares in positions}
+            snapshots.append(MonthSnapshot(year, month, stocks, totals[0], accumulated_darf, totals[1], totals[2],
+                totals[3], totals[4], darf_value))
+        return snapshots
+
+# Close the database
+#----------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        logging.debug('Closing the database...')
+        self.__connection.close()
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+import logging
+from include import money
+from include.stock import StockTypes
+from include.transaction import Transaction
+from include.transaction import TransactionTypes
+
+# Positions of the values of a fill (the working copy of a transaction while matching, money in units)
+INDEX, PRICE, AMMOUNT, PAID_FARES, TRANSACTION = range(5)
+
+# Build a new transaction from an existing one with the given values (money in units)
+#----------------------------------------------------------------------------------------------------------------------
+def _new_transaction(source, price, category, ammount, paid_fares):
+    operation_date = source.operation_date
+    transaction = Transaction(source.name, 0.0, category, ammount, 0.0, operation_date.day,
+        operation_date.month, operation_date.year, source.operation_type, source.operation_id)
+    transaction.price_units = price
+    transaction.paid_fares_units = paid_fares
+    return transaction
+
+# Find the first fill with ammount different of zero (return its position if exists, else return -1)
+#----------------------------------------------------------------------------------------------------------------------
+def _first_open_fill(fills):
+    for i in range(len(fills)):
+        if fills[i][AMMOUNT] != 0:
+            return i
+    return -1
+
+# Merge the fills from start to the end of the list in a single one (weighted average price)
+#----------------------------------------------------------------------------------------------------------------------
+def _merge_fills(fills, start):
+    price = fills[start][PRICE]
+    ammount = fills[start][AMMOUNT]
+    paid_fares = fills[start][PAID_FARES]
+    for fill in fills[start + 1:]:
+        new_ammount = ammount + fill[AMMOUNT]
+        price = money.divide(price * ammount + fill[PRICE] * fill[AMMOUNT], new_ammount)
+        ammount = new_ammount
+        paid_fares += fill[PAID_FARES]
+    return price, ammount, paid_fares
+
+# Emit the remaining of the fills as a single normal transaction
+#----------------------------------------------------------------------------------------------------------------------
+def _emit_normal(fills, touched, normal_emitted):
+    start = _first_open_fill(fills)
+    if (start != -1):
+        index = fills[start][INDEX]
+        transaction = fills[start][TRANSACTION]
+        price, ammount, paid_fares = _merge_fills(fills, start)
+        if (touched or start != len(fills) - 1):
+            normal_emitted[index] = _new_transaction(transaction, price, transaction.category, ammount, paid_fares)
+        else:
+            normal_emitted[index] = transaction
+
+# Net the purchases against the sales of a single (date, stock) group
+#----------------------------------------------------------------------------------------------------------------------
+def _match_group(purchases, sales, day_trade_emitted, normal_emitted):
+    start = _first_open_fill(purchases)
+    if (start == -1 or not sales):
+        _emit_normal(purchases, False, normal_emitted)
+        _emit_normal(sales, False, normal_emitted)
+        return
+    purchase = purchases[start][TRANSACTION]
+    price, ammount, paid_fares = _merge_fills(purchases, start)
+    pairs = []
+    sale_touched = False
+    for sale in sales:
+        if (ammount == 0):
+            break
+        if (sale[AMMOUNT] < ammount):
+            new_fares = money.divide(paid_fares * sale[AMMOUNT], ammount)
+            pairs.append(_new_transaction(purchase, price, StockTypes.DAY_TRADE, sale[AMMOUNT], new_fares))
+            pairs.append(_new_transaction(sale[TRANSACTION], sale[PRICE], StockTypes.DAY_TRADE, sale[AMMOUNT],
+                sale[PAID_FARES]))
+            paid_fares = paid_fares - new_fares
+            ammount -= sale[AMMOUNT]
+            sale[AMMOUNT] = 0
+        else:
+            new_fares = money.divide(sale[PAID_FARES] * ammount, sale[AMMOUNT])
+            pairs.append(_new_transaction(sale[TRANSACTION], sale[PRICE], StockTypes.DAY_TRADE, ammount, new_fares))
+            pairs.append(_new_transaction(purchase, price, StockTypes.DAY_TRADE, ammount, paid_fares))
+            sale[PAID_FARES] = sale[PAID_FARES] - new_fares
+            sale[AMMOUNT] -= ammount
+            sale_touched = True
+            ammount = 0
+    day_trade_emitted[purchases[start][INDEX]] = pairs
+    if (ammount != 0):
+        normal_emitted[purchases[start][INDEX]] = _new_transaction(purchase, price, purchase.category, ammount,
+            paid_fares)
+    _emit_normal(sales, sale_touched, normal_emitted)
+
+# Match the day trade operations of normal transactions sorted by (operation_date, operation_type)
+#----------------------------------------------------------------------------------------------------------------------
+def match_day_trades(transactions):
+    logging.debug('Matching the day trade transactions...')
+    # All purchases of a (date, stock) group are merged in the first one, which is netted against the sales of the
+    # group in order. Whatever remains of the purchases or of the sales is a normal (swing trade) operation. The
+    # results are emitted in the position of the transaction that originated them, so the output keeps the order
+    # of the sorted input.
+    groups = {}
+    for i in range(len(transactions)):
+        transaction = transactions[i]
+        key = (transaction.operation_date, transaction.name)
+        group = groups.get(key)
+        if (group is None):
+            group = ([], [])
+            groups[key] = group
+        fill = [i, transaction.price_units, transaction.ammount, transaction.paid_fares_units, transaction]
+        if (transaction.operation_type == TransactionTypes.PURCHASE):
+            group[0].append(fill)
+        else:
+            group[1].append(fill)
+    day_trade_emitted = {}
+    normal_emitted = {}
+    for purchases, sales in groups.values():
+        _match_group(purchases, sales, day_trade_emitted, normal_emitted)
+    day_trade_transactions = []
+    for i in sorted(day_trade_emitted):
+        day_trade_transactions.extend(day_trade_emitted[i])
+    normal_transactions = [normal_emitted[i] for i in sorted(normal_emitted)]
+    return day_trade_transactions, normal_transactions
+
+#----------------------------------------------------------------------------------------------------------------------
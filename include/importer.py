@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+import re
+import csv
+import logging
+import collections
+import unicodedata
+from include.stock import StockTypes
+from include.transaction import Transaction
+from include.transaction import TransactionTypes
+
+# Names of the columns of the supported exports (broker exports, B3 CEI and B3 investor area trade notes) after
+# removing accents, case and the unit of the column, and the field of the transaction that each one fills
+COLUMNS = {
+    'name': 'name', 'ativo': 'name', 'codigo': 'name', 'codigo de negociacao': 'name', 'ticker': 'name',
+    'price': 'price', 'preco': 'price', 'preco medio': 'price',
+    'ammount': 'ammount', 'amount': 'ammount', 'quantidade': 'ammount', 'qtd': 'ammount',
+    'paid_fares': 'paid_fares', 'taxas': 'paid_fares', 'custos': 'paid_fares', 'corretagem': 'paid_fares',
+    'date': 'date', 'data': 'date', 'data do negocio': 'date', 'data do pregao': 'date',
+    'operation_type': 'operation_type', 'compra/venda': 'operation_type', 'c/v': 'operation_type',
+    'tipo de movimentacao': 'operation_type', 'operacao': 'operation_type',
+    'category': 'category', 'categoria': 'category', 'tipo': 'category',
+    'operation_id': 'operation_id', 'id': 'operation_id',
+}
+REQUIRED_COLUMNS = ('name', 'price', 'ammount', 'date', 'operation_type')
+OPERATION_TYPES = {'c': TransactionTypes.PURCHASE, 'compra': TransactionTypes.PURCHASE, '1': TransactionTypes.PURCHASE,
+    'purchase': TransactionTypes.PURCHASE, 'v': TransactionTypes.SALE, 'venda': TransactionTypes.SALE,
+    '2': TransactionTypes.SALE, 'sale': TransactionTypes.SALE}
+CATEGORIES = {'fi': StockTypes.FI, 'fii': StockTypes.FI, '2': StockTypes.FI, 'normal': StockTypes.NORMAL,
+    'acao': StockTypes.NORMAL, 'acoes': StockTypes.NORMAL, '1': StockTypes.NORMAL, '': StockTypes.NORMAL}
+# Tickers of the fractional market (PETR4F) are the same stock of the standard one
+FRACTIONAL = re.compile(r'^([A-Z0-9]{4}\d{1,2})F$')
+
+# Normalize the name of a column (lower case, without accents and without the unit, as in "Preco (R$)")
+#----------------------------------------------------------------------------------------------------------------------
+def _column(name):
+    name = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s*\(.*\)\s*$', '', name).strip().lower()
+
+# Convert a number of an export to float, with the decimal separator of the export ("1.234,56", "R$ 12,30" or "1.000"
+# with ',', "1,234.56" or "12.30" with '.')
+#----------------------------------------------------------------------------------------------------------------------
+def _number(value, decimal=','):
+    if (isinstance(value, (int, float))):
+        return float(value)
+    value = value.strip().replace('R$', '').strip()
+    thousands = '.' if decimal == ',' else ','
+    return float(value.replace(thousands, '').replace(decimal, '.') or 0)
+
+# Get the delimiter of a csv file from its header (';' in the Brazilian exports, as the ',' is their decimal separator)
+#----------------------------------------------------------------------------------------------------------------------
+def csv_delimiter(header):
+    return ';' if header.count(';') > header.count(',') else ','
+
+# Convert a date of an export ("31/01/2020", "2020-01-31" or a datetime of xlsx) to (year, month, day)
+#----------------------------------------------------------------------------------------------------------------------
+def _date(value):
+    if (hasattr(value, 'year')):
+        return value.year, value.month, value.day
+    value = value.strip()[:10]
+    if ('/' in value):
+        day, month, year = value.split('/')
+    else:
+        year, month, day = value.split('-')
+    return int(year), int(month), int(day)
+
+# Read the rows of a csv file without loading the whole file (the delimiter is detected from the header)
+#----------------------------------------------------------------------------------------------------------------------
+def read_csv(path, encoding='utf-8-sig'):
+    logging.debug('Reading the csv file: %s', path)
+    with open(path, newline='', encoding=encoding) as input_file:
+        header = input_file.readline()
+        delimiter = csv_delimiter(header)
+        yield next(csv.reader([header], delimiter=delimiter))
+        yield from csv.reader(input_file, delimiter=delimiter)
+
+# Read the rows of the first sheet of a xlsx file without loading the whole file (needs openpyxl)
+#----------------------------------------------------------------------------------------------------------------------
+def read_xlsx(path):
+    logging.debug('Reading the xlsx file: %s', path)
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError('Openpyxl is not installed, xlsx files can not be read!')
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+# Get the key of a transaction used to find it again in an export without operation ids
+#----------------------------------------------------------------------------------------------------------------------
+def _key(transaction):
+    return (transaction.operation_date, transaction.name, transaction.operation_type, transaction.ammount,
+        transaction.price_units)
+
+# Parse the rows of an export (the first one is the header) in transactions, skipping the invalid rows. The operation
+# ids are taken from the export or numbered from first_id; without them, a row is skipped for each transaction of
+# existing (a Counter of their keys, the transactions already registered) with the same date, name, type, ammount and
+# price, so an export imported again adds nothing while the equal rows of a single export are all kept.
+#----------------------------------------------------------------------------------------------------------------------
+def parse_rows(rows, first_id=1, debug=False, decimal=',', existing=None):
+    rows = iter(rows)
+    header = [COLUMNS.get(_column(name)) for name in next(rows, [])]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if (missing):
+        raise ValueError('Columns not found in the export: %s' %', '.join(missing))
+    name_index, price_index, ammount_index, date_index, type_index = [header.index(name) for name in REQUIRED_COLUMNS]
+    fares_index = header.index('paid_fares') if 'paid_fares' in header else None
+    category_index = header.index('category') if 'category' in header else None
+    id_index = header.index('operation_id') if 'operation_id' in header else None
+    # The same dates, tickers, types and categories are repeated along the export, so they are converted only once
+    dates = {}
+    names = {}
+    operation_types = {}
+    categories = {}
+    operation_id = first_id
+    line = 1
+    for row in rows:
+        line += 1
+        if (not any(row)):
+            continue
+        try:
+            name = names.get(row[name_index])
+            if (name is None):
+                name = str(row[name_index]).strip().upper()
+                match = FRACTIONAL.match(name)
+                names[row[name_index]] = name = match.group(1) if match else name
+            operation_date = dates.get(row[date_index])
+            if (operation_date is None):
+                operation_date = dates[row[date_index]] = _date(row[date_index])
+            # A fractional ammount (or a thousands separator read as decimal) is an invalid row, not a truncated one
+            ammount = _number(row[ammount_index], decimal)
+            if (ammount <= 0 or ammount != int(ammount)):
+                raise ValueError('Invalid ammount: %s' %row[ammount_index])
+            ammount = int(ammount)
+            operation_type = operation_types.get(row[type_index])
+            if (operation_type is None):
+                operation_type = operation_types[row[type_index]] = OPERATION_TYPES[_column(row[type_index])]
+            category = StockTypes.NORMAL
+            if (category_index is not None):
+                category = categories.get(row[category_index])
+                if (category is None):
+                    category = categories[row[category_index]] = CATEGORIES[_column(row[category_index])]
+            if (id_index is not None):
+                operation_id = int(row[id_index])
+            transaction = Transaction(name, _number(row[price_index], decimal), category, ammount,
+                _number(row[fares_index], decimal) if fares_index is not None else 0.0, operation_date[2],
+                operation_date[1], operation_date[0], operation_type, operation_id, debug)
+            if (id_index is None and existing and existing[_key(transaction)] > 0):
+                existing[_key(transaction)] -= 1
+                logging.warning('Skipping the line %d of the export: already imported', line)
+                continue
+            yield transaction
+            operation_id += 1
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            logging.warning('Skipping the line %d of the export: %s', line, error)
+
+# Group an iterable in lists of batch_size items
+#----------------------------------------------------------------------------------------------------------------------
+def batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if (len(batch) == batch_size):
+            yield batch
+            batch = []
+    if (batch):
+        yield batch
+
+# Import a csv or xlsx export in a control in batches (return the number of transactions imported). The decimal
+# separator of a csv file is ',' when its columns are separated by ';' (the Brazilian exports) and '.' when they are
+# separated by ','. The rows already imported are only found in the months loaded in the control, so the exports are
+# imported in a control with all of them. The progress is called after each batch with the number imported so far.
+#----------------------------------------------------------------------------------------------------------------------
+def import_file(control, path, first_id=None, batch_size=10000, debug=False, progress=None, decimal=None):
+    logging.debug('Importing the file: %s', path)
+    if (first_id is None):
+        # The ids of the months of the database not loaded are not used again
+        first_id = control.next_operation_id
+    existing = collections.Counter(_key(transaction) for transaction in control.transactions)
+    if (path.lower().endswith('.xlsx')):
+        rows = read_xlsx(path)
+    else:
+        rows = read_csv(path)
+        if (decimal is None):
+            with open(path, encoding='utf-8-sig') as input_file:
+                decimal = ',' if csv_delimiter(input_file.readline()) == ';' else '.'
+    imported = 0
+    for batch in batches(parse_rows(rows, first_id, debug, decimal or ',', existing), batch_size):
+        imported += control.add_transactions(batch)
+        if (progress is not None):
+            progress(imported)
+    logging.debug('%d transactions imported!', imported)
+    return imported
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+import copy
+import bisect
+import logging
+
+class PositionLedger:
+
+# Initialize the class with its properties (for each stock, the days with transactions in order and the position at
+# the end of each day). apply_day(transactions, stock) applies the transactions of a day to a position, without
+# changing it, and returns (True, new position or None if it was closed) or (False, None) if a sale has no position.
+# opening(name) returns the position before the first transaction.
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, apply_day, opening, debug=False):
+        self.__apply_day = apply_day
+        self.__opening = opening
+        self.__days = {}
+        self.__fills = {}
+        self.__checkpoints = {}
+        # First day of each stock whose checkpoint (and all the next ones) must be calculated again
+        self.__dirty = {}
+        self.__debug = debug
+
+# Add a transaction (the positions from its day on are calculated again on the next query of the stock)
+#----------------------------------------------------------------------------------------------------------------------
+    def add(self, transaction):
+        name = transaction.name
+        date = transaction.operation_date
+        days = self.__days.setdefault(name, [])
+        fills = self.__fills.setdefault(name, {})
+        index = bisect.bisect_left(days, date)
+        if (date in fills):
+            fills[date].append(transaction)
+        else:
+            fills[date] = [transaction]
+            days.insert(index, date)
+            self.__checkpoints.setdefault(name, []).insert(index, None)
+        self.__dirty[name] = min(self.__dirty.get(name, index), index)
+
+# Remove a transaction (return False if it is not in the ledger)
+#----------------------------------------------------------------------------------------------------------------------
+    def remove(self, transaction):
+        name = transaction.name
+        date = transaction.operation_date
+        fills = self.__fills.get(name, {}).get(date)
+        if (fills is None or transaction not in fills):
+            logging.warning('Transaction: %d is not in the ledger!', transaction.operation_id)
+            return False
+        fills.remove(transaction)
+        index = bisect.bisect_left(self.__days[name], date)
+        if (not fills):
+            del self.__fills[name][date]
+            del self.__days[name][index]
+            del self.__checkpoints[name][index]
+        self.__dirty[name] = min(self.__dirty.get(name, index), index)
+        return True
+
+# Calculate all the positions again on the next queries (after the opening positions changed)
+#----------------------------------------------------------------------------------------------------------------------
+    def invalidate(self):
+        logging.debug('Invalidating the ledger...')
+        self.__dirty = {name: 0 for name in self.__days}
+
+# Calculate the dirty positions of a stock (return the number of days with valid positions, the days from a sale
+# without position on are invalid)
+#----------------------------------------------------------------------------------------------------------------------
+    def __update(self, name):
+        days = self.__days[name]
+        start = self.__dirty.pop(name, None)
+        if (start is None):
+            return len(days)
+        checkpoints = self.__checkpoints[name]
+        stock = checkpoints[start - 1] if start > 0 else self.__opening(name)
+        for i in range(start, len(days)):
+            valid, stock = self.__apply_day(self.__fills[name][days[i]], stock)
+            if (not valid):
+                logging.error('Stock: %s sold without position on %s!', name, days[i])
+                self.__dirty[name] = i
+                return i
+            checkpoints[i] = stock
+        return len(days)
+
+# Get the position of a stock at the end of a date (a copy, None if there was no position or the history is invalid
+# up to the date)
+#----------------------------------------------------------------------------------------------------------------------
+    def position(self, name, date):
+        if (self.__debug):
+            logging.debug('Returning the position of %s on %s...', name, date)
+        days = self.__days.get(name)
+        if (not days):
+            stock = self.__opening(name)
+        else:
+            valid = self.__update(name)
+            index = bisect.bisect_right(days, date) - 1
+            if (index >= valid):
+                return None
+            stock = self.__checkpoints[name][index] if index >= 0 else self.__opening(name)
+        return None if stock is None else copy.copy(stock)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+
+from decimal import Decimal
+from decimal import ROUND_HALF_EVEN
+
+# Money is kept as an integer number of units of 1e-8 reais: prices and fares with up to 8 decimals are exact,
+# sums are exact and the divisions (average prices, prorated fares and taxes) are rounded once to the nearest unit.
+SCALE = 100000000
+
+# Convert a value in reais (float, int, str or Decimal) to units
+#----------------------------------------------------------------------------------------------------------------------
+def to_units(value):
+    if (isinstance(value, float)):
+        return round(value * SCALE)
+    return int((Decimal(value) * SCALE).to_integral_value(ROUND_HALF_EVEN))
+
+# Convert units to a float value in reais
+#----------------------------------------------------------------------------------------------------------------------
+def to_float(units):
+    return units / SCALE
+
+# Convert units to an exact Decimal value in reais
+#----------------------------------------------------------------------------------------------------------------------
+def to_decimal(units):
+    return Decimal(units).scaleb(-8)
+
+# Round units to cents (the bills are paid in cents)
+#----------------------------------------------------------------------------------------------------------------------
+def to_cents(units):
+    return divide(units, SCALE // 100) * (SCALE // 100)
+
+# Divide by a positive denominator rounding to the nearest integer (half up)
+#----------------------------------------------------------------------------------------------------------------------
+def divide(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if (2 * remainder >= denominator):
+        quotient += 1
+    return quotient
+
+# Format a value in reais as the interfaces show it (R$ 1.234,56)
+#----------------------------------------------------------------------------------------------------------------------
+def to_text(value):
+    return ('R$ {:,.2f}'.format(value)).replace(',', '_').replace('.', ',').replace('_', '.')
+
+# Apply a rate given in percent to an ammount of units
+#----------------------------------------------------------------------------------------------------------------------
+def percent(units, rate):
+    return divide(units * rate, 100)
+
+#----------------------------------------------------------------------------------------------------------------------
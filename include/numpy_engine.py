@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+import logging
+from include.stock import Stock
+from include.transaction import TransactionTypes
+
+# Numpy is imported on the first check of the engine, so the programs that do not use it do not pay for its import
+numpy = None
+
+# Bound of the products of the money units by the ammounts computed in int64 (above it, the arrays hold python ints)
+INT64_BOUND = 2**62
+
+# Check if numpy is installed (importing it on the first call)
+#----------------------------------------------------------------------------------------------------------------------
+def available():
+    global numpy
+    if (numpy is None):
+        try:
+            import numpy
+        except ImportError:
+            logging.warning('Numpy is not installed!')
+            return False
+    return True
+
+# Divide by positive denominators rounding to the nearest integer (half up), as money.divide
+#----------------------------------------------------------------------------------------------------------------------
+def _divide(numerators, denominators):
+    quotients = numerators // denominators
+    return quotients + (2 * (numerators - quotients * denominators) >= denominators)
+
+# Get the arrays of values of the transactions (money in units, int64 unless the products of the units by the
+# ammounts may overflow it)
+#----------------------------------------------------------------------------------------------------------------------
+def _arrays(transactions):
+    count = len(transactions)
+    prices = [transaction.price_units for transaction in transactions]
+    ammounts = numpy.fromiter((transaction.ammount for transaction in transactions), numpy.int64, count)
+    fares = [transaction.paid_fares_units for transaction in transactions]
+    largest = max(max(prices, default=0), max(fares, default=0)) * max(int(ammounts.sum()), 1)
+    money_type = numpy.int64 if largest < INT64_BOUND else object
+    sales = numpy.fromiter((transaction.operation_type == TransactionTypes.SALE for transaction in transactions),
+        numpy.bool_, count)
+    return numpy.array(prices, money_type), ammounts, numpy.array(fares, money_type), sales
+
+# Process the purchases and sales of stocks updating their positions (return the totals in units as (purchase, sale,
+# profit), or None if a stock is sold without position). The stocks are processed at once, a transaction of each one
+# per step, with the roundings of the scalar passes of Control, so the results are exact.
+#----------------------------------------------------------------------------------------------------------------------
+def _positions(transactions, stocks):
+    count = len(transactions)
+    if (count == 0):
+        return 0, 0, 0
+    names, codes = numpy.unique(numpy.array([transaction.name for transaction in transactions], dtype=object),
+        return_inverse=True)
+    order = numpy.argsort(codes, kind='stable')
+    codes = codes[order]
+    transactions = [transactions[i] for i in order]
+    prices, ammounts, fares, sales = _arrays(transactions)
+    values = prices * ammounts
+    # Rank of each transaction among the ones of its stock (the step it is processed in)
+    starts = numpy.flatnonzero(numpy.append(True, codes[1:] != codes[:-1]))
+    ranks = numpy.arange(count) - numpy.repeat(starts, numpy.diff(numpy.append(starts, count)))
+    # Opening positions of the stocks
+    opening = [stocks.get(name) for name in names]
+    held = numpy.array([stock is not None for stock in opening], numpy.bool_)
+    position_ammounts = numpy.array([stock.ammount if stock is not None else 0 for stock in opening], numpy.int64)
+    position_prices = numpy.array([stock.price_units if stock is not None else 0 for stock in opening], prices.dtype)
+    position_fares = numpy.array([stock.paid_fares_units if stock is not None else 0 for stock in opening],
+        prices.dtype)
+    reopened = numpy.zeros(len(names), numpy.bool_)
+    profits = numpy.zeros(count, prices.dtype)
+    for rank in range(int(ranks.max()) + 1):
+        step = numpy.flatnonzero(ranks == rank)
+        stock = codes[step]
+        sale = sales[step]
+        ammount = ammounts[step]
+        # Purchases: the average price is rounded to units, a position closed before is started again
+        purchase = step[~sale]
+        bought = stock[~sale]
+        was_held = held[bought]
+        new_ammounts = position_ammounts[bought] + ammounts[purchase]
+        position_prices[bought] = numpy.where(was_held, _divide(position_prices[bought] * position_ammounts[bought] +
+            values[purchase], numpy.maximum(new_ammounts, 1)), prices[purchase])
+        position_fares[bought] = numpy.where(was_held, position_fares[bought], 0) + fares[purchase]
+        position_ammounts[bought] = new_ammounts
+        reopened[bought] |= ~was_held
+        held[bought] = True
+        # Sales: the fares of the position are prorated in units, the last sale takes all of them
+        sale_step = step[sale]
+        sold = stock[sale]
+        if (len(sold) and (not held[sold].all() or numpy.any(position_ammounts[sold] < ammount[sale]))):
+            return None
+        stock_fares = _divide(position_fares[sold] * ammount[sale], numpy.maximum(position_ammounts[sold], 1))
+        profits[sale_step] = values[sale_step] - position_prices[sold] * ammount[sale] - stock_fares - \
+            fares[sale_step]
+        position_ammounts[sold] -= ammount[sale]
+        position_fares[sold] -= stock_fares
+        held[sold] = position_ammounts[sold] > 0
+    # Final positions
+    for i in range(len(names)):
+        name = names[i]
+        if (not held[i]):
+            stocks.pop(name, None)
+            continue
+        stock = opening[i]
+        if (stock is None or reopened[i]):
+            stock = Stock(name, 0.0, transactions[starts[i]].category, 0)
+            stocks[name] = stock
+        stock.ammount = int(position_ammounts[i])
+        stock.price_units = int(position_prices[i])
+        stock.paid_fares_units = int(position_fares[i])
+    return int(values[~sales].sum()), int(values[sales].sum()), int(profits.sum())
+
+# Process the day trade pairs (return the totals in units as (purchase, sale, profit))
+#----------------------------------------------------------------------------------------------------------------------
+def _day_trades(transactions):
+    if (not transactions):
+        return 0, 0, 0
+    prices, ammounts, fares, sales = _arrays(transactions)
+    values = prices * ammounts
+    active = ammounts[0::2] != 0
+    first_sale = sales[0::2]
+    purchases = numpy.where(active, numpy.where(first_sale, values[1::2], values[0::2]), 0)
+    sales = numpy.where(active, numpy.where(first_sale, values[0::2], values[1::2]), 0)
+    profits = numpy.where(active, sales - purchases - (fares[0::2] + fares[1::2]), 0)
+    return int(purchases.sum()), int(sales.sum()), int(profits.sum())
+
+# Process the purchases and sales of fi or normal stocks of a month updating their positions (return the totals in
+# units as (purchase, sale, profit), or None if a stock is sold without position)
+#----------------------------------------------------------------------------------------------------------------------
+def process_positions(transactions, stocks):
+    logging.debug('Processing %d transactions with numpy...', len(transactions))
+    return _positions(transactions, stocks)
+
+# Process the day trade pairs of a month (return the totals in units as (purchase, sale, profit))
+#----------------------------------------------------------------------------------------------------------------------
+def process_day_trades(transactions):
+    logging.debug('Processing %d day trade transactions with numpy...', len(transactions))
+    return _day_trades(transactions)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+import copy
+import logging
+from include import money
+
+class CopyOnWriteStocks:
+
+# Initialize the class with its properties (the positions at the end of a month are read from the snapshot and each
+# one is copied only when it is first used, so a scenario never changes the snapshot)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, snapshot):
+        self.__snapshot = snapshot
+        self.__stocks = {}
+
+# Get a position (copied from the snapshot on the first access, None if it does not exist or was closed)
+#----------------------------------------------------------------------------------------------------------------------
+    def get(self, name, default=None):
+        if (name in self.__stocks):
+            stock = self.__stocks[name]
+        else:
+            stock = self.__snapshot.find_stock(name)
+            if (stock is not None):
+                stock = copy.copy(stock)
+            self.__stocks[name] = stock
+        return default if stock is None else stock
+
+# Open a position
+#----------------------------------------------------------------------------------------------------------------------
+    def __setitem__(self, name, stock):
+        self.__stocks[name] = stock
+
+# Close a position
+#----------------------------------------------------------------------------------------------------------------------
+    def __delitem__(self, name):
+        self.__stocks[name] = None
+
+# Close a position (return it, or default if it does not exist)
+#----------------------------------------------------------------------------------------------------------------------
+    def pop(self, name, default=None):
+        stock = self.get(name)
+        self.__stocks[name] = None
+        return default if stock is None else stock
+
+# Get the positions changed by the scenario ({name: stock}, None for the closed ones)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def changes(self):
+        return dict(self.__stocks)
+
+class Preview:
+
+# Initialize the class with its properties (a fork of the state of a month: its closing snapshot, the snapshot of the
+# previous month and the evaluation of the orders of Control, all money in units). The fork does not see the later
+# changes of the control.
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, snapshot, previous, evaluate, debug=False):
+        self.__snapshot = snapshot
+        self.__previous = previous
+        self.__evaluate = evaluate
+        self.__debug = debug
+
+# Get the (year, month) period of the preview
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def period(self):
+        return self.__snapshot.period
+
+# Get the darf value of the month without orders
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def darf_value(self):
+        return money.to_float(self.__snapshot.darf_value)
+
+# Get the month values with hypothetical orders ([(name, price, category, ammount, paid_fares, operation_type)]) done
+# after the operations of the month (return {'darf_value', 'darf_delta', 'results', 'delta'}, the results and deltas
+# as in Control.results, or None if a sale has no position)
+#----------------------------------------------------------------------------------------------------------------------
+    def evaluate(self, orders):
+        if (self.__debug):
+            logging.debug('Evaluating %d orders in %d-%d...', len(orders), self.period[1], self.period[0])
+        results = self.__evaluate(self.__snapshot, self.__previous, orders)
+        if (results is None):
+            logging.warning('Orders with a sale without position: %s', orders)
+            return None
+        snapshot = self.__snapshot
+        base = {'total_purchase': snapshot.total_purchase, 'total_sale': snapshot.total_sale,
+            'total_profit': snapshot.total_profit, 'total_due_tax': snapshot.total_due_tax,
+            'accumulated_loss': snapshot.accumulated_loss}
+        delta = {key: {category: money.to_float(results[key][category] - value) for category, value in values.items()}
+            for key, values in base.items()}
+        return {'darf_value': money.to_float(results['darf_value']),
+            'darf_delta': money.to_float(results['darf_value'] - snapshot.darf_value),
+            'results': {key: {category: money.to_float(value) for category, value in results[key].items()}
+                for key in base}, 'delta': delta}
+
+# Evaluate many independent scenarios (return the list of results of evaluate)
+#----------------------------------------------------------------------------------------------------------------------
+    def evaluate_many(self, scenarios):
+        logging.debug('Evaluating %d scenarios...', len(scenarios))
+        return [self.evaluate(orders) for orders in scenarios]
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+import enum
+import hashlib
+import logging
+import datetime
+import threading
+import collections
+
+# Get the canonical form of a value to digest: the enums by value, the dates in iso format and the sets sorted
+#----------------------------------------------------------------------------------------------------------------------
+def _canonical(value):
+    if (isinstance(value, enum.Enum)):
+        return _canonical(value.value)
+    if (isinstance(value, datetime.date)):
+        return value.isoformat()
+    if (isinstance(value, (tuple, list))):
+        return tuple(_canonical(item) for item in value)
+    if (isinstance(value, (set, frozenset))):
+        return tuple(sorted((_canonical(item) for item in value), key=repr))
+    return value
+
+# Get the content digest of values (strings, numbers, booleans, None, enums, dates, tuples, lists and sets) with blake2b
+# over their canonical form, so the equal contents have the same digest in every process and run, unlike hash()
+#----------------------------------------------------------------------------------------------------------------------
+def digest(*values):
+    return hashlib.blake2b(repr(_canonical(values)).encode('utf-8'), digest_size=20).hexdigest()
+
+class ResultCache:
+
+# Initialize the class with its properties (at most size results, the least recently used ones are evicted first). The
+# keys are (account, period, content digest) tuples, so a cache can be shared by the controls of many accounts.
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, size=256, debug=False):
+        self.__entries = collections.OrderedDict()
+        self.__size = size
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        # The controls sharing the cache can calculate in different threads
+        self.__lock = threading.Lock()
+        self.__debug = debug
+
+# Get a result (None if it is not cached)
+#----------------------------------------------------------------------------------------------------------------------
+    def get(self, key):
+        with self.__lock:
+            value = self.__entries.get(key)
+            if (value is None):
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return value
+
+# Add a result (evicting the least recently used ones above the size)
+#----------------------------------------------------------------------------------------------------------------------
+    def put(self, key, value):
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while (len(self.__entries) > self.__size):
+                self.__entries.popitem(last=False)
+                self.__evictions += 1
+
+# Remove the results of an account (or all of them if no account is given)
+#----------------------------------------------------------------------------------------------------------------------
+    def clear(self, account=None):
+        logging.debug('Clearing the cached results of %s...', account)
+        with self.__lock:
+            if (account is None):
+                self.__entries.clear()
+            else:
+                for key in [key for key in self.__entries if key[0] == account]:
+                    del self.__entries[key]
+
+# Get the number of cached results
+#----------------------------------------------------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.__entries)
+
+# Get class member "size" (the maximum number of cached results)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def size(self):
+        return self.__size
+
+# Get class member "hits"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def hits(self):
+        return self.__hits
+
+# Get class member "misses"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def misses(self):
+        return self.__misses
+
+# Get class member "evictions"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def evictions(self):
+        return self.__evictions
+
+# Get the hits, misses, evictions and number of results as a dict (to write as json)
+#----------------------------------------------------------------------------------------------------------------------
+    def as_dict(self):
+        return {'hits': self.__hits, 'misses': self.__misses, 'evictions': self.__evictions,
+            'results': len(self.__entries), 'size': self.__size}
+
+#----------------------------------------------------------------------------------------------------------------------
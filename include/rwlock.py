@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+import logging
+import threading
+
+class _Holder:
+
+# Initialize the class with its properties (the acquire and release functions of one side of the lock)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, acquire, release):
+        self.__acquire = acquire
+        self.__release = release
+
+# Acquire the lock on the start of a with block
+#----------------------------------------------------------------------------------------------------------------------
+    def __enter__(self):
+        self.__acquire()
+        return self
+
+# Release the lock on the end of a with block
+#----------------------------------------------------------------------------------------------------------------------
+    def __exit__(self, *args):
+        self.__release()
+        return False
+
+class ReadWriteLock:
+
+# Initialize the class with its properties (many readers or a single writer hold the lock; a waiting writer blocks the
+# new readers, so the writers are not starved by a stream of readers). The lock is reentrant: the writer can read and
+# write again and a reader can read again, but a reader can not become a writer (it would wait for itself).
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, debug=False):
+        # The mutex is taken directly (it is faster than the condition) and the waiting threads are counted, so the
+        # condition is only notified when a thread waits for it
+        self.__mutex = threading.Lock()
+        self.__condition = threading.Condition(self.__mutex)
+        self.__readers = 0
+        self.__writer = None
+        self.__writes = 0
+        self.__waiting_readers = 0
+        self.__waiting_writers = 0
+        # Reads held by each thread (the nested ones and the ones of the writer are not counted in the readers)
+        self.__local = threading.local()
+        self.__debug = debug
+        self.reader = _Holder(self.acquire_read, self.release_read)
+        self.writer = _Holder(self.acquire_write, self.release_write)
+
+# Acquire the lock to read (wait while a writer holds or waits for the lock)
+#----------------------------------------------------------------------------------------------------------------------
+    def acquire_read(self):
+        local = self.__local
+        reads = getattr(local, 'reads', 0)
+        if (reads or self.__writer == threading.get_ident()):
+            local.reads = reads + 1
+            return
+        with self.__mutex:
+            if (self.__writer is not None or self.__waiting_writers):
+                self.__waiting_readers += 1
+                try:
+                    while (self.__writer is not None or self.__waiting_writers):
+                        self.__condition.wait()
+                finally:
+                    self.__waiting_readers -= 1
+            self.__readers += 1
+        local.reads = 1
+
+# Release the lock to read
+#----------------------------------------------------------------------------------------------------------------------
+    def release_read(self):
+        local = self.__local
+        local.reads -= 1
+        if (local.reads or self.__writer == threading.get_ident()):
+            return
+        with self.__mutex:
+            self.__readers -= 1
+            if (not self.__readers and self.__waiting_writers):
+                self.__condition.notify_all()
+
+# Acquire the lock to write (wait for the readers and the writer holding the lock)
+#----------------------------------------------------------------------------------------------------------------------
+    def acquire_write(self):
+        ident = threading.get_ident()
+        if (self.__writer == ident):
+            self.__writes += 1
+            return
+        if (getattr(self.__local, 'reads', 0)):
+            logging.error('A reader can not write!')
+            raise RuntimeError('The lock is held to read by the thread, it can not be acquired to write')
+        with self.__mutex:
+            if (self.__writer is not None or self.__readers):
+                self.__waiting_writers += 1
+                try:
+                    while (self.__writer is not None or self.__readers):
+                        self.__condition.wait()
+                finally:
+                    self.__waiting_writers -= 1
+                    if (not self.__waiting_writers and self.__waiting_readers):
+                        # The readers that only waited for this writer go on if the wait was interrupted
+                        self.__condition.notify_all()
+            self.__writer = ident
+            self.__writes = 1
+
+# Release the lock to write
+#----------------------------------------------------------------------------------------------------------------------
+    def release_write(self):
+        self.__writes -= 1
+        if (self.__writes):
+            return
+        with self.__mutex:
+            self.__writer = None
+            if (self.__waiting_readers or self.__waiting_writers):
+                self.__condition.notify_all()
+
+#----------------------------------------------------------------------------------------------------------------------
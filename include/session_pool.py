@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+import time
+import queue
+import logging
+import threading
+import contextlib
+
+class SessionPool:
+
+# Initialize the class with its properties (factory creates a new session, the sessions are created only when needed
+# and never more than size, and reset prepares a session for the next bill, the browser reset if not given)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, factory, size=1, debug=False, reset=None):
+        self.__factory = factory
+        self.__reset = self.__reset_browser if reset is None else reset
+        self.__size = size
+        self.__idle = queue.LifoQueue()
+        self.__sessions = []
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__debug = debug
+
+# Get class member "size"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def size(self):
+        logging.debug('Returning the pool size: %d!', self.__size)
+        return self.__size
+
+# Get the number of sessions created so far
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def created(self):
+        logging.debug('Returning the number of sessions created: %d!', len(self.__sessions))
+        return len(self.__sessions)
+
+# Take a session from the pool, creating a new one while the pool is not full or waiting for a free one
+#----------------------------------------------------------------------------------------------------------------------
+    def acquire(self, timeout=None):
+        logging.debug('Acquiring a browser session...')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if (self.__closed):
+                raise RuntimeError('Session pool is closed!')
+            try:
+                return self.__idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.__lock:
+                create = len(self.__sessions) < self.__size
+                if (create):
+                    # The slot is reserved before the (slow) browser startup, which happens out of the lock
+                    self.__sessions.append(None)
+            if (create):
+                try:
+                    session = self.__factory()
+                except Exception:
+                    with self.__lock:
+                        self.__sessions.remove(None)
+                    raise
+                with self.__lock:
+                    self.__sessions[self.__sessions.index(None)] = session
+                return session
+            # Wait in short steps, so a slot freed by a discarded session is also noticed
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if (wait <= 0):
+                raise TimeoutError('No browser session available!')
+            try:
+                return self.__idle.get(timeout=wait)
+            except queue.Empty:
+                pass
+
+# Give a session back to the pool, resetting it for the next bill (a session that can not be reset is replaced)
+#----------------------------------------------------------------------------------------------------------------------
+    def release(self, session):
+        logging.debug('Releasing a browser session...')
+        try:
+            self.__reset(session)
+        except Exception as error:
+            logging.warning('Discarding a broken browser session: %s', error)
+            self.__discard(session)
+            return
+        if (self.__closed):
+            self.__quit(session)
+        else:
+            self.__idle.put(session)
+
+# Use a session of the pool in a with block
+#----------------------------------------------------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def session(self, timeout=None):
+        session = self.acquire(timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+# Reset a browser session: close the windows opened by the last bill and clear the cookies of the form
+#----------------------------------------------------------------------------------------------------------------------
+    def __reset_browser(self, session):
+        logging.debug('Resetting a browser session...')
+        handles = session.window_handles
+        for handle in handles[1:]:
+            session.switch_to.window(handle)
+            session.close()
+        session.switch_to.window(handles[0])
+        session.delete_all_cookies()
+        session.get('about:blank')
+
+# Remove a session from the pool and quit its browser
+#----------------------------------------------------------------------------------------------------------------------
+    def __discard(self, session):
+        with self.__lock:
+            if (session in self.__sessions):
+                self.__sessions.remove(session)
+        self.__quit(session)
+
+# Quit the browser of a session ignoring the errors (it may be already dead)
+#----------------------------------------------------------------------------------------------------------------------
+    def __quit(self, session):
+        try:
+            session.quit()
+        except Exception as error:
+            logging.debug('Error quitting a browser session: %s', error)
+
+# Quit all the idle sessions (the sessions in use are quit when released)
+#----------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        logging.debug('Closing the session pool...')
+        self.__closed = True
+        while True:
+            try:
+                session = self.__idle.get_nowait()
+            except queue.Empty:
+                break
+            self.__discard(session)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+
+import os
+import re
+import time
+import logging
+import http.client
+from html.parser import HTMLParser
+from urllib.parse import urlencode
+from urllib.parse import urljoin
+from urllib.parse import urlsplit
+from include import bill
+from include.session_pool import SessionPool
+
+ENDPOINT = "http://www31.receita.fazenda.gov.br/SicalcWeb/UF.asp?AP=P&Person=N&TipTributo=1&FormaPagto=1"
+CAPTCHA_IMAGE = "img_captcha_serpro_gov_br"
+CAPTCHA_FIELD = "txtTexto_captcha_serpro_gov_br"
+
+class _FormParser(HTMLParser):
+
+# Initialize the class with its properties (the forms of a page, the images by id and the names of the fields by id)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self.images = {}
+        self.ids = {}
+        self.__select = None
+        self.__option = None
+        self.__buttons_depth = 0
+
+# Get the form being parsed (the fields out of a form are added to an implicit one)
+#----------------------------------------------------------------------------------------------------------------------
+    def __form(self):
+        if (not self.forms):
+            self.forms.append({'action': '', 'method': 'get', 'fields': [], 'selects': {}, 'buttons': []})
+        return self.forms[-1]
+
+# Handle the start of a tag
+#----------------------------------------------------------------------------------------------------------------------
+    def handle_starttag(self, tag, attributes):
+        attributes = {name: value if value is not None else '' for name, value in attributes}
+        if (attributes.get('id') and attributes.get('name')):
+            self.ids[attributes['id']] = attributes['name']
+        if (tag == 'form'):
+            self.forms.append({'action': attributes.get('action', ''),
+                'method': attributes.get('method', 'get').lower(), 'fields': [], 'selects': {}, 'buttons': []})
+        elif (tag == 'div' and (self.__buttons_depth or attributes.get('id') == 'botoes')):
+            self.__buttons_depth += 1
+        elif (tag == 'img' and attributes.get('id')):
+            self.images[attributes['id']] = attributes.get('src', '')
+        elif (tag == 'input'):
+            input_type = attributes.get('type', 'text').lower()
+            field = (attributes.get('name', ''), attributes.get('value', ''))
+            if (self.__buttons_depth):
+                # The buttons of #botoes are clicked by position, as in the browser flow
+                self.__form()['buttons'].append(field)
+            elif (input_type in ('submit', 'button', 'image', 'reset')):
+                pass
+            elif (input_type in ('checkbox', 'radio') and 'checked' not in attributes):
+                pass
+            elif (field[0]):
+                self.__form()['fields'].append(field)
+        elif (tag == 'select'):
+            self.__select = attributes.get('name', '')
+            self.__form()['selects'][self.__select] = {}
+        elif (tag == 'option' and self.__select is not None):
+            self.__option = [attributes.get('value'), '']
+
+# Handle the text of a tag
+#----------------------------------------------------------------------------------------------------------------------
+    def handle_data(self, data):
+        if (self.__option is not None):
+            self.__option[1] += data
+
+# Handle the end of a tag
+#----------------------------------------------------------------------------------------------------------------------
+    def handle_endtag(self, tag):
+        if (tag == 'option' and self.__option is not None):
+            text = ' '.join(self.__option[1].split())
+            self.__form()['selects'][self.__select][text] = text if self.__option[0] is None else self.__option[0]
+            self.__option = None
+        elif (tag == 'select'):
+            self.__select = None
+        elif (tag == 'div' and self.__buttons_depth):
+            self.__buttons_depth -= 1
+
+class HttpSession:
+
+# Initialize the class with its properties (keep-alive connections by host and the cookies of the session)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, timeout=30.0, debug=False):
+        self.__timeout = timeout
+        self.__connections = {}
+        self.__cookies = {}
+        self.__debug = debug
+
+# Get the number of connections opened by the session
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def connections(self):
+        logging.debug('Returning the number of connections: %d!', len(self.__connections))
+        return len(self.__connections)
+
+# Get a keep-alive connection to the host of an url
+#----------------------------------------------------------------------------------------------------------------------
+    def __connection(self, parts):
+        key = (parts.scheme, parts.netloc)
+        connection = self.__connections.get(key)
+        if (connection is None):
+            logging.debug('Opening a connection to %s...', parts.netloc)
+            connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(parts.netloc, timeout=self.__timeout)
+            self.__connections[key] = connection
+        return connection
+
+# Send a request following the redirects (return (final url, content type, body))
+#----------------------------------------------------------------------------------------------------------------------
+    def request(self, method, url, fields=None, encoding='iso-8859-1'):
+        logging.debug('Requesting %s %s...', method, url)
+        body = urlencode(fields, encoding=encoding) if fields is not None else None
+        if (body is not None and method == 'GET'):
+            url = url.split('?')[0] + '?' + body
+            body = None
+        for _ in range(10):
+            parts = urlsplit(url)
+            path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            headers = {'Connection': 'keep-alive'}
+            if (self.__cookies):
+                headers['Cookie'] = '; '.join('%s=%s' %item for item in self.__cookies.items())
+            if (body is not None):
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            response = self.__send(parts, method, path, body, headers)
+            for header in response.headers.get_all('Set-Cookie') or ():
+                name, _, value = header.split(';')[0].partition('=')
+                self.__cookies[name.strip()] = value.strip()
+            content = response.read()
+            if (response.status in (301, 302, 303, 307, 308) and response.getheader('Location')):
+                url = urljoin(url, response.getheader('Location'))
+                if (response.status in (301, 302, 303)):
+                    method, body = 'GET', None
+                continue
+            if (response.status >= 400):
+                raise ConnectionError('HTTP error %d requesting %s' %(response.status, url))
+            return url, response.getheader('Content-Type', ''), content
+        raise ConnectionError('Too many redirects requesting %s' %url)
+
+# Send a request in the keep-alive connection, reconnecting once if the server closed it. The request is only sent
+# again if it is a GET or if it failed while being sent in a reused connection: a form posted and closed before the
+# answer may have been handled by the server, so it is not posted twice.
+#----------------------------------------------------------------------------------------------------------------------
+    def __send(self, parts, method, path, body, headers):
+        connection = self.__connection(parts)
+        reused = connection.sock is not None
+        try:
+            connection.request(method, path, body, headers)
+        except (ConnectionResetError, BrokenPipeError):
+            if (not reused and method != 'GET'):
+                raise
+            return self.__resend(connection, parts, method, path, body, headers)
+        try:
+            return connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if (method != 'GET'):
+                connection.close()
+                logging.error('Connection to %s closed after posting %s!', parts.netloc, path)
+                raise
+            return self.__resend(connection, parts, method, path, body, headers)
+
+# Send a request again in a new connection (the server closed the previous one)
+#----------------------------------------------------------------------------------------------------------------------
+    def __resend(self, connection, parts, method, path, body, headers):
+        logging.debug('Connection to %s closed by the server, reconnecting...', parts.netloc)
+        connection.close()
+        connection.request(method, path, body, headers)
+        return connection.getresponse()
+
+# Forget the cookies of the last bill
+#----------------------------------------------------------------------------------------------------------------------
+    def reset(self):
+        logging.debug('Resetting the http session...')
+        self.__cookies.clear()
+
+# Close the connections
+#----------------------------------------------------------------------------------------------------------------------
+    def quit(self):
+        logging.debug('Closing the http session...')
+        for connection in self.__connections.values():
+            connection.close()
+        self.__connections.clear()
+
+class SicalcClient:
+
+# Initialize the class with its properties (the http sessions are taken from the given pool, else from a private pool
+# of one session, and captcha_solver receives the captcha image and returns its text)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, debug=False, pool=None, endpoint=ENDPOINT, timeout=30.0, captcha_solver=None):
+        self.__endpoint = endpoint
+        self.__own_pool = pool is None
+        self.__pool = new_pool(1, timeout, debug) if pool is None else pool
+        self.__captcha_solver = captcha_solver
+        self.__downloads = os.path.dirname(__file__) + "/../downloads"
+        self.__debug = debug
+
+# Load a page (return the page as (url, forms parser, content type, content))
+#----------------------------------------------------------------------------------------------------------------------
+    def __load(self, session, method, url, fields=None, encoding='iso-8859-1'):
+        url, content_type, content = session.request(method, url, fields, encoding)
+        match = re.search(r'charset=([\w-]+)', content_type)
+        parser = _FormParser()
+        parser.feed(content.decode(match.group(1) if match else 'iso-8859-1', 'replace'))
+        parser.close()
+        return url, parser, content_type, content
+
+# Submit the form of a page clicking a button of #botoes (1 based, as in the browser flow) with the given values
+# (select values are given by the text of the option, as shown in the page)
+#----------------------------------------------------------------------------------------------------------------------
+    def __submit(self, session, page, values, button=2):
+        url, parser = page[0], page[1]
+        form = next((form for form in parser.forms if form['buttons']), None) or parser.forms[0]
+        fields = dict(form['fields'])
+        for name, options in form['selects'].items():
+            if (name in values):
+                if (values[name] not in options):
+                    raise ValueError("Option: %s not found!" %values[name])
+                fields[name] = options[values[name]]
+            elif (options):
+                fields[name] = next(iter(options.values()))
+        fields.update((name, value) for name, value in values.items() if name not in form['selects'])
+        if (len(form['buttons']) >= button and form['buttons'][button - 1][0]):
+            fields[form['buttons'][button - 1][0]] = form['buttons'][button - 1][1]
+        method = 'POST' if form['method'] == 'post' else 'GET'
+        return self.__load(session, method, urljoin(url, form['action']) if form['action'] else url, fields)
+
+# Get the name of the select of a page
+#----------------------------------------------------------------------------------------------------------------------
+    def __select_name(self, page):
+        for form in page[1].forms:
+            for name in form['selects']:
+                return name
+        raise ValueError('Select not found!')
+
+# Fill the cpf number (return the fields of the cpf, sent with the captcha)
+#----------------------------------------------------------------------------------------------------------------------
+    def __fill_cpf(self, page, cpf):
+        logging.debug('Filling the cpf number...')
+        fields = {'Num_Princ': cpf[:9], 'Num_DV': cpf[-2:]}
+        names = {name for form in page[1].forms for name, _ in form['fields']}
+        if (not names.issuperset(fields)):
+            raise ValueError('Cpf fields not found in the page')
+        return fields
+
+# Solve the captcha until the next page has no captcha field (return the next page)
+#----------------------------------------------------------------------------------------------------------------------
+    def __solve_captcha(self, session, page, values, timings, captcha_solver):
+        logging.debug('Solving the captcha...')
+        while True:
+            _, _, image = session.request('GET', urljoin(page[0], page[1].images[CAPTCHA_IMAGE]))
+            start = time.perf_counter()
+            answer = captcha_solver(image)
+            timings['captcha_input'] += time.perf_counter() - start
+            page = self.__submit(session, page, dict(values, **{page[1].ids.get(CAPTCHA_FIELD, CAPTCHA_FIELD): answer}))
+            if (CAPTCHA_FIELD not in page[1].ids):
+                return page
+            logging.error('Captcha wrong. Try again!')
+
+# Run a step of the generation recording the time spent on it
+#----------------------------------------------------------------------------------------------------------------------
+    def __step(self, timings, name, function, *args):
+        logging.debug('Executing the step %s...', name)
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            timings['steps'][name] = time.perf_counter() - start
+
+# Select state and city (return the page after the city)
+#----------------------------------------------------------------------------------------------------------------------
+    def __select_state_and_city(self, session, page, state, city):
+        logging.debug('Selecting state and city...')
+        page = self.__submit(session, page, {self.__select_name(page): state})
+        return self.__submit(session, page, {self.__select_name(page): city})
+
+# Generate the darf replaying the forms of the government system (return the structured record of the time spent in
+# each step, with the masked cpf and the path and the fields of the bill saved, as the browser flow). The
+# captcha_solver replaces the one of the client for this bill.
+#----------------------------------------------------------------------------------------------------------------------
+    def generate(self, cpf, date, value, captcha_solver=None):
+        logging.debug('Generating the darf for user %s...', cpf)
+        timings = {'cpf': bill.mask_cpf(cpf), 'period': date.strftime("%m/%Y"), 'steps': {}, 'captcha_input': 0.0,
+            'total': 0.0, 'error': None, 'bill': None, 'fields': None}
+        # Without a solver, the captcha of this bill is asked in the console with an image of its own
+        captcha_solver = captcha_solver or self.__captcha_solver or (lambda image: bill.ask_captcha(self.__downloads,
+            cpf, date, image))
+        start = time.perf_counter()
+        try:
+            with self.__pool.session() as session:
+                page = self.__step(timings, 'navigate', self.__load, session, 'GET', self.__endpoint)
+                page = self.__step(timings, 'state_city', self.__select_state_and_city, session, page,
+                    "SP - SAO PAULO", "SAO PAULO")
+                page = self.__step(timings, 'code', self.__submit, session, page, {'CodReceita': '6015'})
+                page = self.__step(timings, 'period_value', self.__submit, session, page,
+                    {'PA': date.strftime("%m%Y"), 'TxtValRec': "%.2f" %value}, 3)
+                page = self.__step(timings, 'check', self.__submit, session, page, {})
+                #The cpf is sent with the captcha, as in the browser flow (the steps are timed apart as in it)
+                values = self.__step(timings, 'cpf', self.__fill_cpf, page, cpf)
+                page = self.__step(timings, 'captcha', self.__solve_captcha, session, page, values, timings,
+                    captcha_solver)
+                page = self.__step(timings, 'save', self.__submit, session, page, {})
+                timings['bill'], timings['fields'] = bill.save_bill(self.__downloads, cpf, date, page[3], page[2])
+        except Exception as error:
+            timings['error'] = '%s: %s' %(type(error).__name__, error)
+            raise
+        finally:
+            timings['total'] = time.perf_counter() - start
+            logging.debug('Darf timings: %s', timings)
+        return timings
+
+# Set the directory of the bills
+#----------------------------------------------------------------------------------------------------------------------
+    def set_downloads(self, path):
+        logging.debug('Setting the downloads directory: %s', path)
+        self.__downloads = path
+
+# Close the http sessions if the pool is not shared
+#----------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        logging.debug('Closing the sicalc client...')
+        if (self.__own_pool):
+            self.__pool.close()
+
+# Create a pool of http sessions to share between clients
+#----------------------------------------------------------------------------------------------------------------------
+def new_pool(size, timeout=30.0, debug=False):
+    return SessionPool(lambda: HttpSession(timeout, debug), size, debug, HttpSession.reset)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+import copy
+import logging
+from include import tracing
+
+class MonthSnapshot:
+
+# Initialize the class with its properties (closing state of a month, money in units, and the content digest of the
+# opening positions and of all the transactions up to the month, None if it is not known)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, year, month, stocks, accumulated_loss, accumulated_darf, total_purchase=None, total_sale=None,
+        total_profit=None, total_due_tax=None, darf_value=0, digest=None):
+        empty = {'normal': 0, 'day_trade': 0, 'fi': 0}
+        self.__year = year
+        self.__month = month
+        self.__stocks = {name: copy.copy(stock) for name, stock in stocks.items()}
+        self.__accumulated_loss = dict(accumulated_loss)
+        self.__accumulated_darf = accumulated_darf
+        self.__total_purchase = dict(total_purchase or empty)
+        self.__total_sale = dict(total_sale or empty)
+        self.__total_profit = dict(total_profit or empty)
+        self.__total_due_tax = dict(total_due_tax or empty)
+        self.__darf_value = darf_value
+        self.__digest = digest
+
+# Get class member "period" (year, month)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def period(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot period: %d-%d!', self.__month, self.__year)
+        return (self.__year, self.__month)
+
+# Get a copy of the positions at the end of the month
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def stocks(self):
+        if (tracing.enabled):
+            logging.debug('Returning a copy of the snapshot stocks...')
+        return {name: copy.copy(stock) for name, stock in self.__stocks.items()}
+
+# Get a position at the end of the month without copying it (it must not be changed, see include/preview.py)
+#----------------------------------------------------------------------------------------------------------------------
+    def find_stock(self, name):
+        return self.__stocks.get(name)
+
+# Get class member "accumulated_loss"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def accumulated_loss(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot accumulated loss...')
+        return dict(self.__accumulated_loss)
+
+# Get class member "accumulated_darf" (darf value below the minimum carried to the next month)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def accumulated_darf(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot accumulated darf: %d!', self.__accumulated_darf)
+        return self.__accumulated_darf
+
+# Get class member "total_purchase"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def total_purchase(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot total purchase...')
+        return dict(self.__total_purchase)
+
+# Get class member "total_sale"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def total_sale(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot total sale...')
+        return dict(self.__total_sale)
+
+# Get class member "total_profit"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def total_profit(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot total profit...')
+        return dict(self.__total_profit)
+
+# Get class member "total_due_tax"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def total_due_tax(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot total due tax...')
+        return dict(self.__total_due_tax)
+
+# Get class member "darf_value"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def darf_value(self):
+        if (tracing.enabled):
+            logging.debug('Returning the snapshot darf value: %d!', self.__darf_value)
+        return self.__darf_value
+
+# Get class member "digest"
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def digest(self):
+        return self.__digest
+
+#----------------------------------------------------------------------------------------------------------------------
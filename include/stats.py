@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+import time
+import logging
+import contextlib
+
+class Stats:
+
+# Initialize the class with its properties (hook is called with (phase, seconds) after each phase, and with profile
+# the runs are also recorded by cProfile)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, hook=None, profile=False, debug=False):
+        self.__phases = {}
+        self.__counters = {}
+        self.__hook = hook
+        self.__profiler = None
+        if (profile):
+            import cProfile
+            self.__profiler = cProfile.Profile()
+        self.__debug = debug
+
+# Get the seconds spent in each phase of the last run (the phases of the control are nested in the whole run)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def phases(self):
+        return dict(self.__phases)
+
+# Get the counters of the last run
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def counters(self):
+        return dict(self.__counters)
+
+# Clear the phases and counters (called at the start of each run, the profile keeps all the runs)
+#----------------------------------------------------------------------------------------------------------------------
+    def reset(self):
+        self.__phases = {}
+        self.__counters = {}
+
+# Get the current time to start a phase
+#----------------------------------------------------------------------------------------------------------------------
+    def clock(self):
+        return time.perf_counter()
+
+# Add the time since start to a phase (return the current time to start the next phase)
+#----------------------------------------------------------------------------------------------------------------------
+    def lap(self, phase, start):
+        now = time.perf_counter()
+        self.__phases[phase] = self.__phases.get(phase, 0.0) + now - start
+        if (self.__hook is not None):
+            self.__hook(phase, now - start)
+        return now
+
+# Add a value to a counter
+#----------------------------------------------------------------------------------------------------------------------
+    def count(self, counter, value=1):
+        self.__counters[counter] = self.__counters.get(counter, 0) + value
+
+# Record the calls made inside the context with cProfile (nothing without profile)
+#----------------------------------------------------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def profiling(self):
+        if (self.__profiler is None):
+            yield
+            return
+        self.__profiler.enable()
+        try:
+            yield
+        finally:
+            self.__profiler.disable()
+
+# Get the report of the profile of all the runs, the functions sorted by a pstats key (return None without profile)
+#----------------------------------------------------------------------------------------------------------------------
+    def profile_report(self, sort='cumulative', limit=20):
+        logging.debug('Returning the profile report...')
+        if (self.__profiler is None):
+            logging.warning('The profile is not enabled!')
+            return None
+        import io
+        import pstats
+        output = io.StringIO()
+        try:
+            pstats.Stats(self.__profiler, stream=output).sort_stats(sort).print_stats(limit)
+        except TypeError:
+            # Nothing was recorded yet
+            return ''
+        return output.getvalue()
+
+# Get the phases and counters as a dict (to write as json)
+#----------------------------------------------------------------------------------------------------------------------
+    def as_dict(self):
+        return {'phases': self.phases, 'counters': self.counters}
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -1,7 +1,10 @@
 #!/usr/bin/python3
 
+import sys
 import enum
 import logging
+from include import money
+from include import tracing
 
 class StockTypes(enum.Enum):
     NORMAL = 1
@@ -10,92 +13,137 @@ class StockTypes(enum.Enum):
 
 class Stock:
 
+    __slots__ = ('__name', '__price', '__category', '__ammount', '__paid_fares', '__debug')
+
 # Initialize the class with its properties
 #----------------------------------------------------------------------------------------------------------------------
     def __init__(self, name="NoName", price=0.0, category=StockTypes.NORMAL, ammount=1, paid_fares=0.0, debug=False):
-        self.__name = name
-        self.__price = price
+        self.__name = sys.intern(name)
+        self.__price = money.to_units(price)
         self.__category = category
         self.__ammount = ammount
-        self.__paid_fares = paid_fares
+        self.__paid_fares = money.to_units(paid_fares)
         self.__debug = debug
 
 # Get class member "name"
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def name(self):
-        logging.debug('Returning the stock name: %s!', self.__name)
+        if (tracing.enabled):
+            logging.debug('Returning the stock name: %s!', self.__name)
         return self.__name
 
 # Set class member "name"
 #----------------------------------------------------------------------------------------------------------------------
     @name.setter
     def name(self, new_name):
-        logging.debug('Setting the stock name: %s!', new_name)
-        self.__name = new_name
+        if (tracing.enabled):
+            logging.debug('Setting the stock name: %s!', new_name)
+        self.__name = sys.intern(new_name)
 
 # Get class member "price"
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def price(self):
-        logging.debug('Returning the stock price: %f!', self.__price)
-        return self.__price
+        if (tracing.enabled):
+            logging.debug('Returning the stock price: %f!', money.to_float(self.__price))
+        return money.to_float(self.__price)
 
 # Set class member "price"
 #----------------------------------------------------------------------------------------------------------------------
     @price.setter
     def price(self, new_price):
-        logging.debug('Setting the stock price: %f!', new_price)
+        if (tracing.enabled):
+            logging.debug('Setting the stock price: %f!', new_price)
+        self.__price = money.to_units(new_price)
+
+# Get class member "price" in money units
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def price_units(self):
+        if (tracing.enabled):
+            logging.debug('Returning the stock price units: %d!', self.__price)
+        return self.__price
+
+# Set class member "price" in money units
+#----------------------------------------------------------------------------------------------------------------------
+    @price_units.setter
+    def price_units(self, new_price):
+        if (tracing.enabled):
+            logging.debug('Setting the stock price units: %d!', new_price)
         self.__price = new_price
 
 # Get class member "category"
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def category(self):
-        logging.debug('Returning the stock category: %d!', self.__category.value)
+        if (tracing.enabled):
+            logging.debug('Returning the stock category: %d!', self.__category.value)
         return self.__category
 
 # Set class member "category"
 #----------------------------------------------------------------------------------------------------------------------
     @category.setter
     def category(self, new_category):
-        logging.debug('Setting the stock category: %d!', new_category.value)
+        if (tracing.enabled):
+            logging.debug('Setting the stock category: %d!', new_category.value)
         self.__category = new_category
 
 # Get class member "ammount"
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def ammount(self):
-        logging.debug('Returning the stock ammount: %d!', self.__ammount)
+        if (tracing.enabled):
+            logging.debug('Returning the stock ammount: %d!', self.__ammount)
         return self.__ammount
 
 # Set class member "ammount"
 #----------------------------------------------------------------------------------------------------------------------
     @ammount.setter
     def ammount(self, new_ammount):
-        logging.debug('Setting the stock ammount: %d!', new_ammount)
+        if (tracing.enabled):
+            logging.debug('Setting the stock ammount: %d!', new_ammount)
         self.__ammount = new_ammount
 
 # Get class member "paid_fares"
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def paid_fares(self):
-        logging.debug('Returning the stock paid_fares: %f!', self.__paid_fares)
-        return self.__paid_fares
+        if (tracing.enabled):
+            logging.debug('Returning the stock paid_fares: %f!', money.to_float(self.__paid_fares))
+        return money.to_float(self.__paid_fares)
 
 # Set class member "paid_fares"
 #----------------------------------------------------------------------------------------------------------------------
     @paid_fares.setter
     def paid_fares(self, new_paid_fares):
-        logging.debug('Setting the stock paid fares: %d!', new_paid_fares)
+        if (tracing.enabled):
+            logging.debug('Setting the stock paid fares: %f!', new_paid_fares)
+        self.__paid_fares = money.to_units(new_paid_fares)
+
+# Get class member "paid_fares" in money units
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def paid_fares_units(self):
+        if (tracing.enabled):
+            logging.debug('Returning the stock paid fares units: %d!', self.__paid_fares)
+        return self.__paid_fares
+
+# Set class member "paid_fares" in money units
+#----------------------------------------------------------------------------------------------------------------------
+    @paid_fares_units.setter
+    def paid_fares_units(self, new_paid_fares):
+        if (tracing.enabled):
+            logging.debug('Setting the stock paid fares units: %d!', new_paid_fares)
         self.__paid_fares = new_paid_fares
 
 # Return total price value
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def total_price(self):
-        logging.debug('Return the total price value...')
-        total = self.__ammount * self.__price
+        if (tracing.enabled):
+            logging.debug('Return the total price value...')
+        total = money.to_float(self.__ammount * self.__price)
         return total
 
 #----------------------------------------------------------------------------------------------------------------------
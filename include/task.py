@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import logging
+import threading
+from include import importer
+
+class Cancelled(Exception):
+    pass
+
+class Task:
+
+# Initialize the class with its properties (function is called as function(task, *args) and reports its progress and
+# partial results through the task, which also tells it when it was cancelled)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, function, *args, debug=False):
+        self.__function = function
+        self.__args = args
+        self.__cancelled = threading.Event()
+        self.__progress_callback = None
+        self.__result_callback = None
+        self.__debug = debug
+
+# Set the callbacks of the progress (done, total) and of the partial results (a total of 0 means unknown)
+#----------------------------------------------------------------------------------------------------------------------
+    def connect(self, progress_callback=None, result_callback=None):
+        self.__progress_callback = progress_callback
+        self.__result_callback = result_callback
+
+# Check if the task was cancelled
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def cancelled(self):
+        return self.__cancelled.is_set()
+
+# Ask the task to stop (it stops at its next progress or check)
+#----------------------------------------------------------------------------------------------------------------------
+    def cancel(self):
+        logging.debug('Cancelling the task %s...', self.__function.__name__)
+        self.__cancelled.set()
+
+# Raise Cancelled if the task was cancelled
+#----------------------------------------------------------------------------------------------------------------------
+    def check(self):
+        if (self.__cancelled.is_set()):
+            raise Cancelled('Task %s cancelled!' %self.__function.__name__)
+
+# Report the progress of the task
+#----------------------------------------------------------------------------------------------------------------------
+    def progress(self, done, total=0):
+        if (self.__progress_callback is not None):
+            self.__progress_callback(done, total)
+        self.check()
+
+# Report a partial result of the task
+#----------------------------------------------------------------------------------------------------------------------
+    def emit(self, result):
+        if (self.__result_callback is not None):
+            self.__result_callback(result)
+
+# Run the task in the current thread (return the result of the function, raise Cancelled if it was cancelled)
+#----------------------------------------------------------------------------------------------------------------------
+    def run(self):
+        logging.debug('Running the task %s...', self.__function.__name__)
+        self.check()
+        return self.__function(self, *self.__args)
+
+# Load the saved operations in a control (return the number of transactions loaded)
+#----------------------------------------------------------------------------------------------------------------------
+def load_operations(task, control, path=None):
+    if (not control.load_operations(path)):
+        raise ValueError('Error loading the saved operations!')
+    return len(control.transactions)
+
+# Calculate the darf of each month with transactions, emitting ((year, month), results) after each one (return the
+# number of months calculated)
+#----------------------------------------------------------------------------------------------------------------------
+def calculate_months(task, control):
+    periods = control.periods
+    for i in range(len(periods)):
+        task.check()
+        year, month = periods[i]
+        if (not control.calculate_month_darf(month, year)):
+            raise ValueError('Error calculating the darf of %d-%d!' %(month, year))
+        task.emit((periods[i], control.results))
+        task.progress(i + 1, len(periods))
+    return len(periods)
+
+# Import a csv or xlsx export in a control (return the number of transactions imported)
+#----------------------------------------------------------------------------------------------------------------------
+def import_file(task, control, path):
+    return importer.import_file(control, path, progress=task.progress)
+
+# Generate the bills of many jobs ({job: (cpf, date, value)}), emitting (job, record) after each one (return the
+# number of bills generated). The generator is got from new_generator in the thread of the task, so selenium is
+# imported and the browser is started out of the interface, and the captchas are solved by captcha_solver.
+#----------------------------------------------------------------------------------------------------------------------
+def generate_bills(task, new_generator, jobs, captcha_solver=None):
+    generator = new_generator()
+    done = 0
+    for job, values in jobs.items():
+        task.check()
+        task.emit((job, generator.generate(*values, captcha_solver=captcha_solver)))
+        done += 1
+        task.progress(done, len(jobs))
+    return done
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,13 @@
+#!/usr/bin/python3
+
+# Log every access to the stock, transaction and control values (only for debugging, it is slow in the processing
+# loops). Control turns it on in debug mode.
+enabled = False
+
+# Turn the tracing on or off
+#----------------------------------------------------------------------------------------------------------------------
+def set_tracing(value):
+    global enabled
+    enabled = value
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+import logging
+from PySide2 import QtCore
+from include import money
+from include.transaction_view import COLUMNS
+from include.transaction_view import TransactionView
+
+NUMERIC_COLUMNS = (4, 5, 6, 7)
+
+class TransactionModel(QtCore.QAbstractTableModel):
+
+# Initialize the class with its properties (the rows are fetched in batches as the table is scrolled and only the
+# visible cells are read from the control)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, control, batch_size=1000, parent=None, debug=False):
+        super().__init__(parent)
+        self.__view = TransactionView(control, batch_size, debug)
+        self.__debug = debug
+
+# Get the view of the transactions
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def view(self):
+        return self.__view
+
+# Get the number of rows fetched
+#----------------------------------------------------------------------------------------------------------------------
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.__view.row_count
+
+# Get the number of columns
+#----------------------------------------------------------------------------------------------------------------------
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+# Get the data of a cell
+#----------------------------------------------------------------------------------------------------------------------
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if (not index.isValid()):
+            return None
+        if (role == QtCore.Qt.DisplayRole):
+            value = self.__view.value(index.row(), index.column())
+            if (value is None):
+                # The transaction of the row was removed, it is shown empty until the model is refreshed
+                return None
+            # The money is shown as in the rest of the interface (R$ 1.234,56)
+            return money.to_text(value) if isinstance(value, float) else str(value)
+        if (role == QtCore.Qt.TextAlignmentRole and index.column() in NUMERIC_COLUMNS):
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        return None
+
+# Get the title of a column
+#----------------------------------------------------------------------------------------------------------------------
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if (role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal):
+            return COLUMNS[section][0]
+        return None
+
+# Check if there are rows not fetched yet (called by the view when it is scrolled to the end)
+#----------------------------------------------------------------------------------------------------------------------
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self.__view.can_fetch_more()
+
+# Fetch the next batch of rows
+#----------------------------------------------------------------------------------------------------------------------
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if (parent.isValid() or self.__view.next_batch() == 0):
+            return
+        first = self.__view.row_count
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + self.__view.next_batch() - 1)
+        self.__view.fetch_more()
+        self.endInsertRows()
+
+# Sort the rows by a column (called by the view when a header is clicked)
+#----------------------------------------------------------------------------------------------------------------------
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        logging.debug('Sorting the model by the column %d...', column)
+        self.layoutAboutToBeChanged.emit()
+        self.__view.sort(column, order == QtCore.Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
+# Filter the rows by period, name and category (None shows all)
+#----------------------------------------------------------------------------------------------------------------------
+    def set_filter(self, year=None, month=None, name=None, category=None):
+        self.beginResetModel()
+        self.__view.set_filter(year, month, name, category)
+        self.endResetModel()
+
+# Read the rows again from the control (after transactions were added)
+#----------------------------------------------------------------------------------------------------------------------
+    def refresh(self):
+        self.beginResetModel()
+        self.__view.refresh()
+        self.endResetModel()
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+import logging
+from include.stock import StockTypes
+from include.transaction import TransactionTypes
+
+CATEGORIES = {StockTypes.NORMAL: 'Normal', StockTypes.FI: 'FII', StockTypes.DAY_TRADE: 'Day Trade'}
+OPERATION_TYPES = {TransactionTypes.PURCHASE: 'Compra', TransactionTypes.SALE: 'Venda'}
+
+# Columns of the view: title, value of a transaction to show and to sort
+COLUMNS = (
+    ('Data', lambda x: x.operation_date.strftime('%d/%m/%Y'), lambda x: (x.operation_date, x.operation_id)),
+    ('Tipo', lambda x: OPERATION_TYPES[x.operation_type], lambda x: x.operation_type.value),
+    ('Ativo', lambda x: x.name, lambda x: x.name),
+    ('Categoria', lambda x: CATEGORIES[x.category], lambda x: x.category.value),
+    ('Quantidade', lambda x: x.ammount, lambda x: x.ammount),
+    ('Preço', lambda x: x.price, lambda x: x.price_units),
+    ('Taxas', lambda x: x.paid_fares, lambda x: x.paid_fares_units),
+    ('Total', lambda x: x.get_total_price(), lambda x: x.ammount * x.price_units - x.paid_fares_units),
+)
+
+class TransactionView:
+
+# Initialize the class with its properties (the view keeps only the ids of the filtered transactions, in order, and
+# reads each transaction from the control when its row is shown)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, control, batch_size=1000, debug=False):
+        self.__control = control
+        self.__batch_size = batch_size
+        self.__filter = {}
+        self.__sort_column = 0
+        self.__descending = False
+        self.__ids = []
+        self.__fetched = 0
+        self.__debug = debug
+        self.refresh()
+
+# Get the number of rows fetched
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def row_count(self):
+        return self.__fetched
+
+# Get the number of rows that match the filter
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def total_count(self):
+        return len(self.__ids)
+
+# Check if there are rows not fetched yet
+#----------------------------------------------------------------------------------------------------------------------
+    def can_fetch_more(self):
+        return self.__fetched < len(self.__ids)
+
+# Fetch the next batch of rows (return the (first, last) rows fetched)
+#----------------------------------------------------------------------------------------------------------------------
+    def fetch_more(self):
+        first = self.__fetched
+        self.__fetched = min(len(self.__ids), self.__fetched + self.__batch_size)
+        logging.debug('Fetching the rows %d to %d...', first, self.__fetched - 1)
+        return first, self.__fetched - 1
+
+# Get the number of rows to fetch in the next batch
+#----------------------------------------------------------------------------------------------------------------------
+    def next_batch(self):
+        return min(len(self.__ids), self.__fetched + self.__batch_size) - self.__fetched
+
+# Filter the transactions by period, name and category (None shows all, a month without a year is the month of all
+# the years)
+#----------------------------------------------------------------------------------------------------------------------
+    def set_filter(self, year=None, month=None, name=None, category=None):
+        logging.debug('Filtering the transactions: %s-%s %s %s', month, year, name, category)
+        self.__filter = {'year': year, 'month': month, 'name': name, 'category': category}
+        self.refresh()
+
+# Sort the transactions by a column
+#----------------------------------------------------------------------------------------------------------------------
+    def sort(self, column, descending=False):
+        logging.debug('Sorting the transactions by the column %d...', column)
+        self.__sort_column = column
+        self.__descending = descending
+        key = COLUMNS[column][2]
+        transactions = {operation_id: self.__control.find_transaction(operation_id) for operation_id in self.__ids}
+        # The transactions removed after the last refresh are left at the end (shown empty) until the next one
+        removed = [operation_id for operation_id in self.__ids if transactions[operation_id] is None]
+        self.__ids = sorted((operation_id for operation_id in self.__ids if transactions[operation_id] is not None),
+            key=lambda operation_id: key(transactions[operation_id]), reverse=descending) + removed
+        self.__fetched = min(len(self.__ids), max(self.__fetched, self.__batch_size))
+
+# Read the transactions again from the control (after they were changed)
+#----------------------------------------------------------------------------------------------------------------------
+    def refresh(self):
+        self.__ids = self.__control.find_transaction_ids(**self.__filter)
+        self.__fetched = 0
+        self.sort(self.__sort_column, self.__descending)
+
+# Get the transaction of a row (None if it was removed from the control after the last refresh)
+#----------------------------------------------------------------------------------------------------------------------
+    def transaction(self, row):
+        return self.__control.find_transaction(self.__ids[row])
+
+# Get the value of a cell (None if the transaction of the row was removed, the row is shown empty until the refresh)
+#----------------------------------------------------------------------------------------------------------------------
+    def value(self, row, column):
+        transaction = self.transaction(row)
+        return None if transaction is None else COLUMNS[column][1](transaction)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import logging
+import threading
+from PySide2 import QtCore
+from include.task import Task
+from include.task import Cancelled
+
+class WorkerSignals(QtCore.QObject):
+    # The signals are emitted in the pool thread and delivered in the thread of the interface (queued connections)
+    progress = QtCore.Signal(int, int)
+    result = QtCore.Signal(object)
+    finished = QtCore.Signal(object)
+    error = QtCore.Signal(str)
+    cancelled = QtCore.Signal()
+
+class Worker(QtCore.QRunnable):
+
+# Initialize the class with its properties (function is called in a thread of the pool as function(task, *args))
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, function, *args, debug=False):
+        super().__init__()
+        self.__task = Task(function, *args, debug=debug)
+        self.__signals = WorkerSignals()
+        self.__task.connect(self.__signals.progress.emit, self.__signals.result.emit)
+        self.__debug = debug
+
+# Get the signals of the worker
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def signals(self):
+        return self.__signals
+
+# Ask the worker to stop
+#----------------------------------------------------------------------------------------------------------------------
+    def cancel(self):
+        self.__task.cancel()
+
+# Run the task (called by the pool)
+#----------------------------------------------------------------------------------------------------------------------
+    def run(self):
+        try:
+            result = self.__task.run()
+        except Cancelled:
+            logging.debug('Worker cancelled!')
+            self.__signals.cancelled.emit()
+        except Exception as error:
+            logging.error('Error in the worker: %s', error)
+            self.__signals.error.emit('%s: %s' %(type(error).__name__, error))
+        else:
+            self.__signals.finished.emit(result)
+
+class InterfaceCall(QtCore.QObject):
+    # The requests are emitted in the pool thread and run in the thread of the interface (queued connection)
+    called = QtCore.Signal(object)
+
+# Initialize the class with its properties (it must be created in the thread of the interface, where function runs)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, function, debug=False):
+        super().__init__()
+        self.__function = function
+        # Requests waiting for the interface by id
+        self.__requests = {}
+        self.__closed = False
+        self.__lock = threading.Lock()
+        self.__debug = debug
+        self.called.connect(self.__run, QtCore.Qt.QueuedConnection)
+
+# Call the function in the thread of the interface and wait for its result (called by the workers)
+#----------------------------------------------------------------------------------------------------------------------
+    def __call__(self, *args):
+        request = {'args': args, 'done': threading.Event(), 'result': None, 'error': None}
+        with self.__lock:
+            if (self.__closed):
+                raise Cancelled('The interface was closed')
+            self.__requests[id(request)] = request
+        self.called.emit(request)
+        request['done'].wait()
+        if (request['error'] is not None):
+            raise request['error']
+        return request['result']
+
+# Run a request in the thread of the interface
+#----------------------------------------------------------------------------------------------------------------------
+    def __run(self, request):
+        with self.__lock:
+            if (request['done'].is_set()):
+                return
+        try:
+            request['result'] = self.__function(*request['args'])
+        except Exception as error:
+            request['error'] = error
+        finally:
+            with self.__lock:
+                self.__requests.pop(id(request), None)
+            request['done'].set()
+
+# Release the workers waiting for the interface with Cancelled (called when the interface is closed)
+#----------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        logging.debug('Closing the interface calls...')
+        with self.__lock:
+            self.__closed = True
+            for request in self.__requests.values():
+                request['error'] = Cancelled('The interface was closed')
+                request['done'].set()
+            self.__requests.clear()
+
+class WorkerPool:
+
+# Initialize the class with its properties (the workers run in the global thread pool of qt)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, debug=False):
+        self.__pool = QtCore.QThreadPool.globalInstance()
+        self.__workers = set()
+        self.__debug = debug
+
+# Start a worker (return it to connect its signals)
+#----------------------------------------------------------------------------------------------------------------------
+    def start(self, function, *args, progress=None, result=None, finished=None, error=None):
+        logging.debug('Starting a worker for %s...', function.__name__)
+        worker = Worker(function, *args, debug=self.__debug)
+        for signal, slot in ((worker.signals.progress, progress), (worker.signals.result, result),
+            (worker.signals.finished, finished), (worker.signals.error, error)):
+            if (slot is not None):
+                signal.connect(slot)
+        # Keep a reference to the worker until it ends, so its signals are not collected while it runs
+        self.__workers.add(worker)
+        for signal in (worker.signals.finished, worker.signals.error, worker.signals.cancelled):
+            signal.connect(lambda *args, worker=worker: self.__workers.discard(worker))
+        worker.setAutoDelete(False)
+        self.__pool.start(worker)
+        return worker
+
+# Cancel all the running workers and wait for them (called when the interface is closed)
+#----------------------------------------------------------------------------------------------------------------------
+    def shutdown(self, timeout=30000):
+        logging.debug('Stopping %d workers...', len(self.__workers))
+        for worker in list(self.__workers):
+            worker.cancel()
+        self.__pool.waitForDone(timeout)
+
+#----------------------------------------------------------------------------------------------------------------------
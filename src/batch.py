@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from src.control import Control
+from include import importer
+
+# Calculate the darf of a single account (the errors are returned in the result, so one account never breaks the
+# others of its chunk). With periods, each month of the range is calculated over the snapshots of the account, so the
+# months saved in its database by a previous run are not calculated again.
+#----------------------------------------------------------------------------------------------------------------------
+def _calculate_account(account, operations, debug):
+    result = {'account': account, 'error': None}
+    try:
+        control = Control(debug)
+        if (operations.get('database') is not None and not control.load_operations(operations['database'])):
+            raise ValueError('Error loading the database: %s' %operations['database'])
+        for stock in operations.get('stocks', ()):
+            if (not control.add_stock(*stock)):
+                raise ValueError('Invalid stock: %s' %(stock,))
+        for transaction in operations.get('transactions', ()):
+            if (not control.add_transaction(*transaction)):
+                raise ValueError('Invalid transaction: %s' %(transaction,))
+        for path in operations.get('files', ()):
+            importer.import_file(control, path, debug=debug)
+        if ('periods' not in operations):
+            if (not control.calculate_darf()):
+                raise ValueError('Error calculating the darf')
+            result.update(control.results)
+            return result
+        result['months'] = {}
+        for year, month in control.get_periods(*operations['periods']):
+            if (not control.calculate_month_darf(month, year)):
+                raise ValueError('Error calculating the darf of %d-%d' %(month, year))
+            result['months'][(year, month)] = control.results
+        if (operations.get('save') and operations.get('database') is not None
+            and not control.save_operations(operations['database'])):
+            raise ValueError('Error saving the database: %s' %operations['database'])
+    except Exception as error:
+        result['error'] = '%s: %s' %(type(error).__name__, error)
+    return result
+
+# Calculate the darf of a chunk of accounts in a worker process
+#----------------------------------------------------------------------------------------------------------------------
+def _calculate_chunk(chunk, debug):
+    return [_calculate_account(account, operations, debug) for account, operations in chunk]
+
+class Batch:
+
+# Initialize the class with its properties
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, workers=None, chunk_size=None, debug=False):
+        self.__workers = workers or os.cpu_count() or 1
+        self.__chunk_size = chunk_size
+        self.__debug = debug
+
+# Calculate the darf of many accounts ({account: {'database': path, 'stocks': [add_stock arguments], 'transactions':
+# [add_transaction arguments], 'files': [exports], 'periods': (first, last), 'save': bool}}, all optional) in a process
+# pool (return {account: result}, with the error of the account in result['error'] and, with periods, the results of
+# each month in result['months'])
+#----------------------------------------------------------------------------------------------------------------------
+    def calculate(self, accounts):
+        logging.debug('Calculating the darf of %d accounts with %d workers...', len(accounts), self.__workers)
+        items = list(accounts.items())
+        # Several chunks per worker keep the workers busy when the accounts have very different sizes
+        chunk_size = self.__chunk_size or max(1, len(items) // (self.__workers * 4))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        results = {}
+        # A worker process that dies breaks the pool and all its unfinished chunks. They are calculated again in a new
+        # pool account by account, and the accounts that break it again are calculated alone, so only the account
+        # that kills its worker fails.
+        broken = self.__run(chunks, self.__workers, results)
+        if (broken):
+            logging.warning('A worker process died, calculating %d chunks again...', len(broken))
+            broken = self.__run([[item] for chunk in broken for item in chunk], self.__workers, results)
+        for chunk in broken:
+            for account, _ in sum(self.__run([chunk], 1, results), []):
+                logging.error('The worker process died calculating the account %s!', account)
+                results[account] = {'account': account, 'error': 'BrokenProcessPool: the worker process died'}
+        failed = sum(1 for result in results.values() if result['error'] is not None)
+        if (failed):
+            logging.warning('Darf not calculated for %d of %d accounts!', failed, len(items))
+        return {account: results[account] for account, _ in items}
+
+# Calculate chunks of accounts in a new process pool storing the results (return the chunks not calculated because a
+# worker process died)
+#----------------------------------------------------------------------------------------------------------------------
+    def __run(self, chunks, workers, results):
+        broken = []
+        with ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(_calculate_chunk, chunk, self.__debug): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    for result in future.result():
+                        results[result['account']] = result
+                except BrokenProcessPool:
+                    broken.append(futures[future])
+                except Exception as error:
+                    logging.error('Error calculating a chunk of %d accounts: %s', len(futures[future]), error)
+                    for account, _ in futures[future]:
+                        results[account] = {'account': account, 'error': '%s: %s' %(type(error).__name__, error)}
+        return broken
+
+#----------------------------------------------------------------------------------------------------------------------
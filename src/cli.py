@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import logging
+import argparse
+from src.control import Control
+from include.money import to_text
+
+FORMATS = ('text', 'json', 'csv')
+
+# Parse a MM/YYYY period in (year, month)
+#----------------------------------------------------------------------------------------------------------------------
+def period(value):
+    try:
+        month, year = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('período inválido: %s (use MM/AAAA)' %value)
+    if (not 1 <= month <= 12):
+        raise argparse.ArgumentTypeError('mês inválido: %s' %value)
+    return (year, month)
+
+# Parse the arguments of the command line
+#----------------------------------------------------------------------------------------------------------------------
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Calcula o DARF das operações salvas sem a interface gráfica.')
+    parser.add_argument('-d', '--database', help='banco de dados das operações (padrão: darf.db)')
+    parser.add_argument('-i', '--import', dest='imports', action='append', default=[], metavar='FILE',
+        help='importa um arquivo csv ou xlsx antes do cálculo (pode ser repetido)')
+    parser.add_argument('-a', '--accounts', nargs='+', metavar='FILE',
+        help='calcula várias contas em paralelo, uma por banco de dados (.db) ou arquivo exportado')
+    parser.add_argument('-w', '--workers', type=int, help='processos usados com --accounts (padrão: um por núcleo)')
+    parser.add_argument('-m', '--month', type=int, help='calcula apenas o mês informado (exige --year)')
+    parser.add_argument('-y', '--year', type=int, help='ano do mês calculado')
+    parser.add_argument('--from', dest='first', type=period, metavar='MM/AAAA', help='primeiro mês calculado')
+    parser.add_argument('--to', dest='last', type=period, metavar='MM/AAAA', help='último mês calculado')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='text', help='formato da saída (padrão: text)')
+    parser.add_argument('-o', '--output', help='arquivo de saída (padrão: a saída padrão)')
+    parser.add_argument('-s', '--save', action='store_true',
+        help='salva as operações e os meses calculados (as próximas execuções só calculam os meses alterados)')
+    parser.add_argument('--stats', action='store_true', help='mostra o tempo das fases e os contadores de cada mês')
+    parser.add_argument('--profile', action='store_true', help='mostra o perfil (cProfile) do cálculo no final')
+    parser.add_argument('--numpy', action='store_true', help='usa o motor numpy (se estiver instalado)')
+    parser.add_argument('--debug', action='store_true', help='ativa o log de depuração')
+    arguments = parser.parse_args(argv)
+    if ((arguments.month is None) != (arguments.year is None)):
+        parser.error('--month e --year devem ser informados juntos')
+    if (arguments.month is not None):
+        if (arguments.first is not None or arguments.last is not None):
+            parser.error('--month não pode ser usado com --from ou --to')
+        arguments.first = arguments.last = period('%d/%d' %(arguments.month, arguments.year))
+    if (arguments.accounts and (arguments.database is not None or arguments.imports)):
+        parser.error('--accounts não pode ser usado com --database ou --import')
+    if (arguments.accounts and (arguments.stats or arguments.profile)):
+        parser.error('--stats e --profile não podem ser usados com --accounts')
+    return arguments
+
+# Get the record of a calculated month (the values by category are flattened, as total_sale_normal)
+#----------------------------------------------------------------------------------------------------------------------
+def record(account, year, month, results):
+    values = {'account': account, 'period': '%02d/%d' %(month, year)}
+    for key, value in results.items():
+        if (isinstance(value, dict)):
+            values.update(('%s_%s' %(key, category), total) for category, total in value.items())
+        else:
+            values[key] = value
+    values['error'] = None
+    return values
+
+# Write the records in the output format
+#----------------------------------------------------------------------------------------------------------------------
+def write(records, output_format, output):
+    logging.debug('Writing %d records as %s...', len(records), output_format)
+    if (output_format == 'json'):
+        import json
+        json.dump(records, output, indent=2)
+        output.write('\n')
+    elif (output_format == 'csv'):
+        import csv
+        fields = []
+        for values in records:
+            fields.extend(field for field in values if field not in fields)
+        writer = csv.DictWriter(output, fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        for values in records:
+            prefix = '%s  ' %values['account'] if values['account'] is not None else ''
+            if (values['error'] is not None):
+                output.write('%serro: %s\n' %(prefix, values['error']))
+                continue
+            sold = sum(value for key, value in values.items() if key.startswith('total_sale_'))
+            due_tax = sum(value for key, value in values.items() if key.startswith('total_due_tax_'))
+            output.write('%s%s  vendas %s  imposto %s  darf %s\n' %(prefix, values['period'], to_text(sold),
+                to_text(due_tax), to_text(values['darf_value'])))
+
+# Calculate the darf of the months of the control (return the records, None if a month fails)
+#----------------------------------------------------------------------------------------------------------------------
+def calculate(control, first=None, last=None):
+    periods = control.get_periods(first, last)
+    logging.debug('Calculating %d months...', len(periods))
+    records = []
+    for year, month in periods:
+        if (not control.calculate_month_darf(month, year)):
+            logging.error('Error calculating the darf of %d-%d!', month, year)
+            return None
+        records.append(record(None, year, month, control.results))
+        if (control.stats is not None):
+            logging.info('Stats of %02d/%d: %s', month, year, control.stats.as_dict())
+    return records
+
+# Calculate the darf of many accounts in a process pool (return the records, with the error of the failed accounts)
+#----------------------------------------------------------------------------------------------------------------------
+def calculate_accounts(paths, first=None, last=None, workers=None, save=False, debug=False):
+    # The process pool is only needed (and imported) with many accounts
+    from src.batch import Batch
+    accounts = {}
+    for path in paths:
+        account = os.path.splitext(os.path.basename(path))[0]
+        if (path.lower().endswith('.db')):
+            accounts[account] = {'database': path, 'periods': (first, last), 'save': save}
+        else:
+            accounts[account] = {'files': [path], 'periods': (first, last)}
+    records = []
+    for account, result in Batch(workers, debug=debug).calculate(accounts).items():
+        if (result['error'] is not None):
+            records.append({'account': account, 'period': None, 'error': result['error']})
+            continue
+        records.extend(record(account, year, month, results) for (year, month), results in result['months'].items())
+    return records
+
+# Run the command line (return the exit code)
+#----------------------------------------------------------------------------------------------------------------------
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if (arguments.accounts):
+        records = calculate_accounts(arguments.accounts, arguments.first, arguments.last, arguments.workers,
+            arguments.save, arguments.debug)
+        failed = any(values['error'] is not None for values in records)
+    else:
+        control = Control(arguments.debug, arguments.numpy)
+        if (arguments.stats or arguments.profile):
+            control.set_stats(True, arguments.profile)
+        # A single month only needs its transactions and the snapshot of the previous months (but the imports are
+        # checked against all the transactions, to find the rows already imported)
+        if (arguments.first is not None and arguments.first == arguments.last and not arguments.imports):
+            loaded = control.load_operations(arguments.database, arguments.first[1], arguments.first[0])
+        else:
+            loaded = control.load_operations(arguments.database)
+        if (not loaded):
+            return 1
+        if (arguments.imports):
+            # The importer is only needed (and imported) when a file is given
+            from include import importer
+            for path in arguments.imports:
+                logging.info('%d transactions imported from %s', importer.import_file(control, path), path)
+        records = calculate(control, arguments.first, arguments.last)
+        failed = records is None
+        if (arguments.profile):
+            sys.stderr.write(control.stats.profile_report())
+        if (not failed and arguments.save and not control.save_operations(arguments.database)):
+            return 1
+    if (records):
+        if (arguments.output is None):
+            write(records, arguments.format, sys.stdout)
+        else:
+            with open(arguments.output, 'w', newline='') as output:
+                write(records, arguments.format, output)
+    return 1 if failed else 0
+
+#----------------------------------------------------------------------------------------------------------------------
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -1,7 +1,23 @@
 #!/usr/bin/python3
 
+import os
 import copy
 import logging
+import calendar
+import threading
+from include import money
+from include import tracing
+from include import numpy_engine
+from include.database import Database
+from include.stats import Stats
+from include.result_cache import ResultCache
+from include.result_cache import digest as content_digest
+from include.rwlock import ReadWriteLock
+from include.ledger import PositionLedger
+from include.day_trade import match_day_trades
+from include.snapshot import MonthSnapshot
+from include.preview import Preview
+from include.preview import CopyOnWriteStocks
 from include.stock import Stock
 from include.stock import StockTypes
 from include.transaction import Transaction
@@ -11,444 +27,956 @@ class Control:
 
 # Initialize the class with its properties
 #----------------------------------------------------------------------------------------------------------------------
-    def __init__(self, debug=False):
-        self.__stocks = []
-        self.__transactions = []
-        self.__darf_value = 0.0
-        self.__total_purchase = {'normal': 0.0, 'day_trade': 0.0, 'fi': 0.0}
-        self.__total_sale = {'normal': 0.0, 'day_trade': 0.0, 'fi': 0.0}
-        self.__total_due_tax = {'normal': 0.0, 'day_trade': 0.0, 'fi': 0.0}
-        self.__total_profit = {'normal': 0.0, 'day_trade': 0.0, 'fi': 0.0}
-        self.__accumulated_loss = {'normal': 0.0, 'day_trade': 0.0, 'fi': 0.0}
-        self.__accumulated_darf = 0.0
-        self.__normal_no_tax_sale_value = 20000.00
-        self.__normal_tax = 0.15
-        self.__fi_tax = 0.20
-        self.__day_trade_tax = 0.20
-        self.__minimum_darf_value = 10.0
+    def __init__(self, debug=False, use_numpy=False):
+        self.__stocks = {}
+        self.__transactions = {}
+        self.__monthly_transactions = {}
+        self.__snapshots = {}
+        self.__opening_snapshot = None
+        # Content digest of the transactions of each month, removed when the month changes
+        self.__month_digests = {}
+        self.__cache = None
+        self.__account = None
+        self.__removed_transactions = set()
+        self.__invalidated_period = None
+        # Changes not saved yet: the ids of the transactions added or edited, the stocks and the snapshots saved (or
+        # loaded) by period, so a save writes only the new ones
+        self.__changed_transactions = set()
+        self.__stocks_changed = True
+        self.__saved_snapshots = {}
+        # Greatest operation id of the database loaded (its months not loaded included)
+        self.__last_operation_id = 0
+        self.__database_path = os.path.dirname(__file__) + "/../darf.db"
+        # Money values are kept in units (see include/money.py) and the taxes in percent
+        self.__darf_value = 0
+        self.__total_purchase = {'normal': 0, 'day_trade': 0, 'fi': 0}
+        self.__total_sale = {'normal': 0, 'day_trade': 0, 'fi': 0}
+        self.__total_due_tax = {'normal': 0, 'day_trade': 0, 'fi': 0}
+        self.__total_profit = {'normal': 0, 'day_trade': 0, 'fi': 0}
+        self.__accumulated_loss = {'normal': 0, 'day_trade': 0, 'fi': 0}
+        self.__accumulated_darf = 0
+        self.__normal_no_tax_sale_value = money.to_units(20000.00)
+        self.__normal_tax = 15
+        self.__fi_tax = 20
+        self.__day_trade_tax = 20
+        self.__minimum_darf_value = money.to_units(10.0)
         self.__debug = debug
+        # The registered operations are changed under the lock to write and read under the lock to read. The
+        # calculations of months only read them, so they run under the lock to read, one at a time, as they share the
+        # snapshots, the ledger and the totals being calculated.
+        self.__lock = ReadWriteLock(debug)
+        self.__calculation = threading.RLock()
+        # Results of the last calculation, replaced at once when it ends (the getters read them without locks)
+        self.__published = MonthSnapshot(0, 0, {}, self.__accumulated_loss, 0)
+        self.__stats = None
+        # The position ledger is built on the first query of a position and then updated with the transactions
+        self.__ledger = None
         self.set_log_level(self.__debug)
+        self.__numpy_engine = use_numpy and numpy_engine.available()
+        if (use_numpy and not self.__numpy_engine):
+            logging.warning('Numpy is not installed, using the scalar engine!')
 
 # Add a new stock to the class
 #----------------------------------------------------------------------------------------------------------------------
     def add_stock(self, name, price, category, ammount, paid_fares):
         logging.debug('Adding a new stock: %s', name)
-        if (self.find_stock(name) == -1):
-            stock = Stock(name,price,category,ammount,paid_fares,self.__debug)
-            self.__stocks.append(stock)
-            return True
-        else:
-            logging.warning('Stock: %s already exists!', name)
-            return False
+        with self.__lock.writer:
+            if (self.__stocks.get(name) is None):
+                stock = Stock(name,price,category,ammount,paid_fares,self.__debug)
+                self.__stocks[name] = stock
+                self.__stocks_changed = True
+                self.__invalidate_snapshots()
+                return True
+            else:
+                logging.warning('Stock: %s already exists!', name)
+                return False
 
 # Edit a stock in the class
 #----------------------------------------------------------------------------------------------------------------------
     def edit_stock(self, name, price, category, ammount, paid_fares):
         logging.debug('Editing the stock: %s', name)
-        stock_index = self.find_stock(name)
-        if (stock_index != -1):
-            self.__stocks[stock_index].price = price
-            self.__stocks[stock_index].category = category
-            self.__stocks[stock_index].ammount = ammount
-            self.__stocks[stock_index].paid_fares = paid_fares
-            return True
-        else:
-            logging.warning('Stock: %s does not exist!', name)
-            return False
+        with self.__lock.writer:
+            if (self.__stocks.get(name) is not None):
+                self.__stocks[name] = Stock(name,price,category,ammount,paid_fares,self.__debug)
+                self.__stocks_changed = True
+                self.__invalidate_snapshots()
+                return True
+            else:
+                logging.warning('Stock: %s does not exist!', name)
+                return False
 
 # Remove a stock in the class
 #----------------------------------------------------------------------------------------------------------------------
     def remove_stock(self, name):
         logging.debug('Removing the stock: %s', name)
-        stock_index = self.find_stock(name)
-        if (stock_index != -1):
-            del self.__stocks[stock_index]
-            return True
-        else:
-            logging.warning('Stock: %s does not exist!', name)
-            return False
+        with self.__lock.writer:
+            if (self.__stocks.get(name) is not None):
+                del self.__stocks[name]
+                self.__stocks_changed = True
+                self.__invalidate_snapshots()
+                return True
+            else:
+                logging.warning('Stock: %s does not exist!', name)
+                return False
 
-# Find an existing stock by name (return index if exists, else return -1)
+# Find an existing stock by name (return the stock if exists, else return None)
 #----------------------------------------------------------------------------------------------------------------------
     def find_stock(self, name):
-        logging.debug('Finding if stock %s exists in the system', name)
-        for i in range (len(self.__stocks)):
-            if self.__stocks[i].name == name:
-                return i
-        return -1
+        if (tracing.enabled):
+            logging.debug('Finding if stock %s exists in the system', name)
+        with self.__lock.reader:
+            if (self.__stats is not None):
+                self.__stats.count('stock_lookups')
+            return self.__stocks.get(name)
 
 # Remove all stocks that has zero as ammount number in the class
 #----------------------------------------------------------------------------------------------------------------------
     def remove_all_zero_ammount_stocks(self, name):
         logging.debug('Removing the zero ammount stocks')
-        for i in range(len(self.__stocks)):
-            if self.__stocks[i].ammount == 0:
-                del self.__stocks[i]
+        with self.__lock.writer:
+            zero_ammount_stocks = [key for key, stock in self.__stocks.items() if stock.ammount == 0]
+            for key in zero_ammount_stocks:
+                del self.__stocks[key]
+            if (zero_ammount_stocks):
+                self.__stocks_changed = True
+                self.__invalidate_snapshots()
 
-# Get stocks
+# Get stocks (the positions before the first transaction; the editors replace them, never change them, so they can be
+# read while the control changes)
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def stocks(self):
         logging.debug('Returning the registered stocks...')
-        return self.__stocks
+        with self.__lock.reader:
+            return list(self.__stocks.values())
 
 # Add a new transaction to the class
 #----------------------------------------------------------------------------------------------------------------------
     def add_transaction(self, name, price, category, ammount, paid_fares, day, month, year,\
         operation_type, operation_id):
         logging.debug('Adding new transaction: %s : id: %d', name, operation_id)
-        transaction = Transaction(name,price,category,ammount,paid_fares,day,month,year,
-            operation_type,operation_id,self.__debug)
-        self.__transactions.append(transaction)
+        with self.__lock.writer:
+            if (self.__transactions.get(operation_id) is None):
+                transaction = Transaction(name,price,category,ammount,paid_fares,day,month,year,
+                    operation_type,operation_id,self.__debug)
+                self.__register_transaction(transaction)
+                self.__invalidate_snapshots(self.__period(transaction))
+                return True
+            else:
+                logging.warning('Transaction: %d already exists!', operation_id)
+                return False
+
+# Add many transactions at once invalidating the snapshots only once (return the number of transactions added)
+#----------------------------------------------------------------------------------------------------------------------
+    def add_transactions(self, transactions):
+        logging.debug('Adding %d new transactions...', len(transactions))
+        with self.__lock.writer:
+            period = None
+            added = 0
+            for transaction in transactions:
+                if (transaction.operation_id in self.__transactions):
+                    logging.warning('Transaction: %d already exists!', transaction.operation_id)
+                    continue
+                self.__register_transaction(transaction)
+                if (period is None or self.__period(transaction) < period):
+                    period = self.__period(transaction)
+                added += 1
+            if (period is not None):
+                self.__invalidate_snapshots(period)
+            return added
 
 # Edit a transaction in the class
 #----------------------------------------------------------------------------------------------------------------------
     def edit_transaction(self, operation_id,name, price, category, ammount, paid_fares,\
         day, month, year, operation_type):
         logging.debug('Editing the transaction: %d', operation_id)
-        transaction_index = self.find_transaction(operation_id)
-        if (transaction_index != -1):
-            self.__transactions[transaction_index].name = name
-            self.__transactions[transaction_index].price = price
-            self.__transactions[transaction_index].category = category
-            self.__transactions[transaction_index].ammount = ammount
-            self.__transactions[transaction_index].paid_fares = paid_fares
-            self.__transactions[transaction_index].set_operation_date(year,month,day)
-            self.__transactions[transaction_index].operation_type = operation_type
-            return True
-        else:
-            logging.warning('Transaction: %d does not exist!', operation_id)
-            return False
+        with self.__lock.writer:
+            old_transaction = self.__transactions.get(operation_id)
+            if (old_transaction is not None):
+                old_period = self.__period(old_transaction)
+                del self.__monthly_transactions[old_period][operation_id]
+                self.__month_digests.pop(old_period, None)
+                if (self.__ledger is not None):
+                    self.__ledger.remove(old_transaction)
+                transaction = Transaction(name,price,category,ammount,paid_fares,day,month,year,
+                    operation_type,operation_id,self.__debug)
+                self.__transactions[operation_id] = transaction
+                self.__changed_transactions.add(operation_id)
+                self.__monthly_transactions.setdefault(self.__period(transaction), {})[operation_id] = transaction
+                self.__month_digests.pop(self.__period(transaction), None)
+                if (self.__ledger is not None):
+                    self.__ledger.add(transaction)
+                self.__invalidate_snapshots(min(old_period, self.__period(transaction)))
+                return True
+            else:
+                logging.warning('Transaction: %d does not exist!', operation_id)
+                return False
 
 # Remove a transaction in the class
 #----------------------------------------------------------------------------------------------------------------------
     def remove_transaction(self, operation_id):
         logging.debug('Removing the transaction: %d', operation_id)
-        transaction_index = self.find_transaction(operation_id)
-        if (transaction_index != -1):
-            del self.__transactions[transaction_index]
-            return True
-        else:
-            logging.warning('Stock: %d does not exist!', operation_id)
-            return False
-
-# Find an existing transaction by id (return index if exists, else return -1)
+        with self.__lock.writer:
+            transaction = self.__transactions.get(operation_id)
+            if (transaction is not None):
+                del self.__transactions[operation_id]
+                del self.__monthly_transactions[self.__period(transaction)][operation_id]
+                self.__month_digests.pop(self.__period(transaction), None)
+                if (self.__ledger is not None):
+                    self.__ledger.remove(transaction)
+                self.__removed_transactions.add(operation_id)
+                self.__changed_transactions.discard(operation_id)
+                self.__invalidate_snapshots(self.__period(transaction))
+                return True
+            else:
+                logging.warning('Transaction: %d does not exist!', operation_id)
+                return False
+
+# Get the ids of the transactions of a period (a year, a month of all the years, a month of a year or all of them)
+# filtered by name and category
+#----------------------------------------------------------------------------------------------------------------------
+    def find_transaction_ids(self, year=None, month=None, name=None, category=None):
+        logging.debug('Finding the transactions of %s-%s...', month, year)
+        with self.__lock.reader:
+            if (year is not None and month is not None):
+                transactions = self.__monthly_transactions.get((year, month), {}).values()
+            elif (year is not None or month is not None):
+                # A year alone or a month alone (of all the years) is taken from the months of the index
+                transactions = [transaction for period, monthly in self.__monthly_transactions.items()
+                    if (year is None or period[0] == year) and (month is None or period[1] == month)
+                    for transaction in monthly.values()]
+            else:
+                transactions = self.__transactions.values()
+            if (name is None and category is None):
+                return [transaction.operation_id for transaction in transactions]
+            return [transaction.operation_id for transaction in transactions if (name is None or
+                transaction.name == name) and (category is None or transaction.category == category)]
+
+# Register a transaction in the indexes
+#----------------------------------------------------------------------------------------------------------------------
+    def __register_transaction(self, transaction):
+        operation_id = transaction.operation_id
+        self.__transactions[operation_id] = transaction
+        self.__monthly_transactions.setdefault(self.__period(transaction), {})[operation_id] = transaction
+        self.__month_digests.pop(self.__period(transaction), None)
+        self.__removed_transactions.discard(operation_id)
+        self.__changed_transactions.add(operation_id)
+        if (self.__ledger is not None):
+            self.__ledger.add(transaction)
+
+# Find an existing transaction by id (return the transaction if exists, else return None)
 #----------------------------------------------------------------------------------------------------------------------
     def find_transaction(self, operation_id):
-        logging.debug('Finding if transaction %d exists in the system', operation_id)
-        for i in range (len(self.__transactions)):
-            if self.__transactions[i].operation_id == operation_id:
-                return i
-        return -1
+        if (tracing.enabled):
+            logging.debug('Finding if transaction %d exists in the system', operation_id)
+        with self.__lock.reader:
+            if (self.__stats is not None):
+                self.__stats.count('transaction_lookups')
+            return self.__transactions.get(operation_id)
 
-# Get transactions
+# Get the id of the next new transaction (after the ones registered and the ones saved in the months not loaded)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def next_operation_id(self):
+        with self.__lock.reader:
+            return max(self.__last_operation_id, max(self.__transactions, default=0)) + 1
+
+# Get transactions (the registered transactions are replaced, never changed, by edit_transaction)
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def transactions(self):
         logging.debug('Returning the registered transactions...')
-        return self.__transactions
+        with self.__lock.reader:
+            return list(self.__transactions.values())
 
 # Process transactions
 #----------------------------------------------------------------------------------------------------------------------
-    def __process_transactions(self):
+    def __process_transactions(self, transactions, stocks):
         logging.debug('Processing the registered transactions...')
-        self.__darf_value = 0.0
-        transactions = sorted(self.__transactions, key=lambda x: (x.operation_date, x.operation_type.value))
-        fi_transactions = []
-        day_trade_transactions = []
-        normal_transactions = []
-        for i in range(len(transactions)):
-            if transactions[i].category == StockTypes.FI:
-                fi_transactions.append(copy.copy(transactions[i]))
-            elif transactions[i].category == StockTypes.NORMAL:
-                j = i + 1
-                while (j < len(transactions) and transactions[j].operation_date == transactions[i].operation_date \
-                     and transactions[i].ammount != 0):
-                    if (transactions[j].name == transactions[i].name):
-                        if (transactions[j].operation_type == transactions[i].operation_type):
-                            new_ammount = transactions[i].ammount + transactions[j].ammount
-                            new_price = (transactions[i].price * transactions[i].ammount + \
-                                transactions[j].price * transactions[j].ammount) / new_ammount
-                            transactions[i].ammount = new_ammount
-                            transactions[i].price = new_price
-                            transactions[i].paid_fares += transactions[j].paid_fares
-                            transactions[j].ammount = 0
-                            transactions[j].price = 0.0
-                            transactions[j].paid_fares = 0.0
-                        else:
-                            if (transactions[j].ammount < transactions[i].ammount):
-                                new = copy.copy(transactions[i])
-                                new.ammount = transactions[j].ammount
-                                new.paid_fares = (transactions[i].paid_fares / transactions[i].ammount) * new.ammount
-                                transactions[j].category = StockTypes.DAY_TRADE
-                                new.category = StockTypes.DAY_TRADE
-                                day_trade_transactions.append(new)
-                                day_trade_transactions.append(copy.copy(transactions[j]))
-                                transactions[i].paid_fares = transactions[i].paid_fares - new.paid_fares
-                                transactions[i].ammount-=new.ammount
-                                transactions[j].ammount = 0
-                            else:
-                                new = copy.copy(transactions[j])
-                                new.ammount = transactions[i].ammount
-                                new.paid_fares = (transactions[j].paid_fares / transactions[j].ammount) * new.ammount
-                                transactions[i].category = StockTypes.DAY_TRADE
-                                new.category = StockTypes.DAY_TRADE
-                                day_trade_transactions.append(new)
-                                day_trade_transactions.append(copy.copy(transactions[i]))
-                                transactions[j].paid_fares = transactions[j].paid_fares - new.paid_fares
-                                transactions[j].ammount-=new.ammount
-                                transactions[i].ammount = 0
-                    j+=1
-                if (transactions[i].ammount != 0 and transactions[i].category != StockTypes.DAY_TRADE):
-                    normal_transactions.append(copy.copy(transactions[i]))
-        if (not self.__process_fi_transactions(fi_transactions)):
+        self.__darf_value = 0
+        # The phases are only timed with the stats enabled (a single check of None between them when disabled)
+        stats = self.__stats
+        if (stats is not None):
+            start = stats.clock()
+        # The ids keep the order of the transactions of a day the same after they are edited or loaded again
+        transactions = sorted(transactions, key=lambda x: (x.operation_date, x.operation_type.value, x.operation_id))
+        if (stats is not None):
+            start = stats.lap('sort', start)
+        fi_transactions = [transaction for transaction in transactions if transaction.category == StockTypes.FI]
+        normal_transactions = [transaction for transaction in transactions \
+            if transaction.category == StockTypes.NORMAL]
+        day_trade_transactions, normal_transactions = match_day_trades(normal_transactions)
+        if (stats is not None):
+            start = stats.lap('day_trade_matching', start)
+            stats.count('fills', len(transactions))
+            stats.count('day_trade_pairs', len(day_trade_transactions) // 2)
+        if (not self.__process_fi_transactions(fi_transactions, stocks)):
             return False
+        if (stats is not None):
+            start = stats.lap('fi_pass', start)
         if (not self.__process_day_trade_transactions(day_trade_transactions)):
             return False
-        if (not self.__process_normal_transactions(normal_transactions)):
+        if (stats is not None):
+            start = stats.lap('day_trade_pass', start)
+        if (not self.__process_normal_transactions(normal_transactions, stocks)):
             return False
-        self.__darf_value = self.__total_due_tax['normal'] + self.__total_due_tax['day_trade'] + \
-            self.__total_due_tax['fi'] + self.__accumulated_darf
-        if (self.__darf_value < self.__minimum_darf_value):
-            self.__accumulated_darf = self.__darf_value
+        if (stats is not None):
+            stats.lap('normal_pass', start)
+        self.__darf_value, self.__accumulated_darf = self.__darf(self.__total_due_tax, self.__accumulated_darf)
         return True
 
 # Process fi transactions
 #----------------------------------------------------------------------------------------------------------------------
-    def __process_fi_transactions(self, transactions):
+    def __process_fi_transactions(self, transactions, stocks):
         logging.debug('Processing fi transactions')
-        self.__total_purchase['fi'] = 0.0
-        self.__total_sale['fi'] = 0.0
-        self.__total_profit['fi'] = 0.0
-        self.__total_due_tax['fi'] = 0.0
-        for transaction in transactions:
-            stock_index = self.find_stock(transaction.name)
-            if (transaction.operation_type == TransactionTypes.PURCHASE):
-                self.__total_purchase['fi'] += transaction.price * transaction.ammount
-                if (stock_index != -1):
-                    stock = self.__stocks[stock_index]
-                    stock_price = stock.price
-                    stock_ammount = stock.ammount
-                    new_ammount = stock_ammount + transaction.ammount
-                    stock.price = (stock_price * stock_ammount + transaction.price * transaction.ammount) / new_ammount
-                    stock.ammount = new_ammount
-                    stock.paid_fares += transaction.paid_fares
-                else:
-                    new_stock = Stock(transaction.name, transaction.price, transaction.category, transaction.ammount,
-                        transaction.paid_fares)
-                    self.__stocks.append(new_stock)
-            else:
-                if (stock_index != -1):
-                    stock = self.__stocks[stock_index]
-                    self.__total_sale['fi'] += transaction.price * transaction.ammount
-                    fares = (stock.paid_fares / stock.ammount) * transaction.ammount + transaction.paid_fares
-                    profit = transaction.price * transaction.ammount - stock.price * transaction.ammount - fares
-                    self.__total_profit['fi'] += profit
-                    stock.ammount -= transaction.ammount
-                    stock.paid_fares -= fares
-                    if (stock.ammount < 0):
-                        return False
-                    elif (self.__stocks[stock_index].ammount == 0):
-                        del self.__stocks[stock_index]
-                else:
-                    return False
-        if (self.__total_profit['fi'] - self.__accumulated_loss['fi']) > 0:
-            self.__total_due_tax['fi'] = self.__fi_tax * self.__total_profit['fi']
-        else:
-            self.__accumulated_loss['fi'] = self.__accumulated_loss['fi'] \
-                - self.__total_profit['fi']
-        return True
+        return self.__process_category_transactions(transactions, stocks, 'fi')
 
 # Process day trade transactions
 #----------------------------------------------------------------------------------------------------------------------
     def __process_day_trade_transactions(self, transactions):
         logging.debug('Processing day trade transactions')
-        self.__total_purchase['day_trade'] = 0.0
-        self.__total_sale['day_trade'] = 0.0
-        self.__total_profit['day_trade'] = 0.0
-        self.__total_due_tax['day_trade'] = 0.0
+        self.__total_purchase['day_trade'], self.__total_sale['day_trade'], self.__total_profit['day_trade'] = \
+            self.__day_trade_totals(transactions)
+        self.__total_due_tax['day_trade'], self.__accumulated_loss['day_trade'] = self.__category_tax('day_trade',
+            self.__total_sale['day_trade'], self.__total_profit['day_trade'], self.__accumulated_loss['day_trade'])
+        return True
+
+# Process normal transactions
+#----------------------------------------------------------------------------------------------------------------------
+    def __process_normal_transactions(self, transactions, stocks):
+        logging.debug('Processing normal transactions')
+        return self.__process_category_transactions(transactions, stocks, 'normal')
+
+# Process the transactions of fi or normal stocks updating their positions, the totals and the tax of the category
+#----------------------------------------------------------------------------------------------------------------------
+    def __process_category_transactions(self, transactions, stocks, key):
+        if (self.__stats is not None):
+            self.__stats.count('position_lookups', len(transactions))
+            self.__stats.count('positions_touched', len({transaction.name for transaction in transactions}))
+        self.__total_due_tax[key] = 0
+        totals = self.__stock_totals(transactions, stocks)
+        if (totals is None):
+            return False
+        self.__total_purchase[key], self.__total_sale[key], self.__total_profit[key] = totals
+        self.__total_due_tax[key], self.__accumulated_loss[key] = self.__category_tax(key, self.__total_sale[key],
+            self.__total_profit[key], self.__accumulated_loss[key])
+        return True
+
+# Get the due tax of a category from its totals and the loss carried from the previous month (return the due tax and
+# the loss carried to the next month, money in units)
+#----------------------------------------------------------------------------------------------------------------------
+    def __category_tax(self, key, sale, profit, loss):
+        if (profit - loss <= 0):
+            return 0, loss - profit
+        if (key == 'normal'):
+            if (sale <= self.__normal_no_tax_sale_value):
+                return 0, loss
+            return money.percent(profit, self.__normal_tax), loss
+        return money.percent(profit, self.__fi_tax if key == 'fi' else self.__day_trade_tax), loss
+
+# Get the darf value of a month from its due taxes and the darf carried from the previous month (return the darf value
+# and the darf carried to the next month, when it is below the minimum, money in units)
+#----------------------------------------------------------------------------------------------------------------------
+    def __darf(self, total_due_tax, accumulated_darf):
+        darf_value = total_due_tax['normal'] + total_due_tax['day_trade'] + total_due_tax['fi'] + accumulated_darf
+        return darf_value, darf_value if darf_value < self.__minimum_darf_value else 0
+
+# Get the totals of the matched day trade pairs (return (purchase, sale, profit) in units)
+#----------------------------------------------------------------------------------------------------------------------
+    def __day_trade_totals(self, transactions):
+        if (self.__numpy_engine):
+            return numpy_engine.process_day_trades(transactions)
+        total_purchase = 0
+        total_sale = 0
+        total_profit = 0
         for i in range(len(transactions)):
             transaction = transactions[i]
             if (transaction.ammount != 0):
                 if (transaction.operation_type == TransactionTypes.PURCHASE):
-                    purchase = transaction.price * transaction.ammount
-                    sale = transactions[i+1].price * transactions[i+1].ammount
+                    purchase = transaction.price_units * transaction.ammount
+                    sale = transactions[i+1].price_units * transactions[i+1].ammount
                 else:
-                    sale = transaction.price * transaction.ammount
-                    purchase = transactions[i+1].price * transactions[i+1].ammount
-
-                fares = transaction.paid_fares + transactions[i+1].paid_fares
-                profit = sale - purchase - fares
-                self.__total_purchase['day_trade'] += purchase
-                self.__total_sale['day_trade'] += sale
-                self.__total_profit['day_trade'] += profit
+                    sale = transaction.price_units * transaction.ammount
+                    purchase = transactions[i+1].price_units * transactions[i+1].ammount
+
+                fares = transaction.paid_fares_units + transactions[i+1].paid_fares_units
+                total_purchase += purchase
+                total_sale += sale
+                total_profit += sale - purchase - fares
                 transaction.ammount = 0
                 transactions[i+1].ammount = 0
+        return total_purchase, total_sale, total_profit
 
-        if (self.__total_profit['day_trade'] - self.__accumulated_loss['day_trade']) > 0:
-            self.__total_due_tax['day_trade'] = self.__day_trade_tax * self.__total_profit['day_trade']
-        else:
-            self.__accumulated_loss['day_trade'] = self.__accumulated_loss['day_trade'] \
-                - self.__total_profit['day_trade']
-        return True
-
-# Process normal transactions
+# Process the purchases and sales of fi or normal stocks updating their positions (return (purchase, sale, profit) in
+# units, or None if a stock is sold without position)
 #----------------------------------------------------------------------------------------------------------------------
-    def __process_normal_transactions(self, transactions):
-        logging.debug('Processing normal transactions')
-        self.__total_purchase['normal'] = 0.0
-        self.__total_sale['normal'] = 0.0
-        self.__total_profit['normal'] = 0.0
-        self.__total_due_tax['normal'] = 0.0
+    def __stock_totals(self, transactions, stocks):
+        if (self.__numpy_engine):
+            return numpy_engine.process_positions(transactions, stocks)
+        total_purchase = 0
+        total_sale = 0
+        total_profit = 0
         for transaction in transactions:
-            stock_index = self.find_stock(transaction.name)
+            name = transaction.name
+            ammount = transaction.ammount
+            value = transaction.price_units * ammount
+            stock = stocks.get(name)
             if (transaction.operation_type == TransactionTypes.PURCHASE):
-                self.__total_purchase['normal'] += transaction.price * transaction.ammount
-                if (stock_index != -1):
-                    stock = self.__stocks[stock_index]
-                    stock_price = stock.price
+                total_purchase += value
+                if (stock is not None):
                     stock_ammount = stock.ammount
-                    stock_fares = stock.paid_fares
-                    new_ammount = stock_ammount + transaction.ammount
-                    stock.price = (stock_price * stock_ammount + transaction.price * transaction.ammount) / new_ammount
+                    new_ammount = stock_ammount + ammount
+                    stock.price_units = money.divide(stock.price_units * stock_ammount + value, new_ammount)
                     stock.ammount = new_ammount
-                    stock.paid_fares += transaction.paid_fares
+                    stock.paid_fares_units += transaction.paid_fares_units
                 else:
-                    new_stock = Stock(transaction.name, transaction.price, transaction.category, transaction.ammount,
-                        transaction.paid_fares)
-                    self.__stocks.append(new_stock)
+                    new_stock = Stock(name, 0.0, transaction.category, ammount)
+                    new_stock.price_units = transaction.price_units
+                    new_stock.paid_fares_units = transaction.paid_fares_units
+                    stocks[name] = new_stock
             else:
-                if (stock_index != -1):
-                    stock = self.__stocks[stock_index]
-                    self.__total_sale['normal'] += transaction.price * transaction.ammount
-                    fares = (stock.paid_fares / stock.ammount) * transaction.ammount + transaction.paid_fares
-                    profit = transaction.price * transaction.ammount - stock.price * transaction.ammount - fares
-                    self.__total_profit['normal'] += profit
-                    stock.ammount -= transaction.ammount
-                    stock.paid_fares -= fares
-                    if (stock.ammount < 0):
-                        return False
-                    elif (self.__stocks[stock_index].ammount == 0):
-                        del self.__stocks[stock_index]
+                if (stock is not None):
+                    stock_ammount = stock.ammount
+                    total_sale += value
+                    # The fares of the position are prorated in units, the remainder stays with the position and
+                    # the last sale takes all of it
+                    stock_fares = money.divide(stock.paid_fares_units * ammount, stock_ammount)
+                    total_profit += value - stock.price_units * ammount - stock_fares - transaction.paid_fares_units
+                    stock_ammount -= ammount
+                    stock.ammount = stock_ammount
+                    stock.paid_fares_units -= stock_fares
+                    if (stock_ammount < 0):
+                        return None
+                    elif (stock_ammount == 0):
+                        del stocks[name]
                 else:
-                    return False
-        if (self.__total_profit['normal'] - self.__accumulated_loss['normal']) > 0:
-            if (self.__total_sale['normal'] > self.__normal_no_tax_sale_value):
-                self.__total_due_tax['normal'] = self.__normal_tax * self.__total_profit['normal']
-        else:
-            self.__accumulated_loss['normal'] = self.__accumulated_loss['normal'] \
-                - self.__total_profit['normal']
-        return True
+                    return None
+        return total_purchase, total_sale, total_profit
 
-# Save operations
+# Save operations (only the changes since the last save or load are written: the stocks if they were edited, the
+# transactions added, edited or removed and the snapshots calculated again)
 #----------------------------------------------------------------------------------------------------------------------
-    def save_operations(self):
+    def save_operations(self, path=None):
         logging.debug('Saving the registered operations...')
-        # save the operations in the database
-        # self.__stocks = copy.copy(self.__evaluated_stocks)
-        # self.__accumulated_loss = copy.copy(self.__accumulated_loss_evaluated)
-        # self.__accumulated_darf = copy.copy(self.__accumulated_darf_evaluated)
+        with self.__lock.writer:
+            saved = self.__saved_snapshots
+            if (self.__invalidated_period is not None):
+                # The snapshots saved from the invalidated period on are deleted by the save
+                saved = {key: snapshot for key, snapshot in saved.items() if key < self.__invalidated_period}
+            snapshots = [self.__snapshots[key] for key in sorted(self.__snapshots)
+                if saved.get(key) is not self.__snapshots[key]]
+            database = Database(path or self.__database_path, self.__debug)
+            try:
+                database.save(self.stocks if self.__stocks_changed else None, [self.__transactions[operation_id]
+                    for operation_id in sorted(self.__changed_transactions)], self.__removed_transactions, snapshots,
+                    self.__invalidated_period)
+            finally:
+                database.close()
+            saved.update(self.__snapshots)
+            self.__saved_snapshots = saved
+            self.__changed_transactions.clear()
+            self.__stocks_changed = False
+            self.__removed_transactions.clear()
+            self.__invalidated_period = None
+            return True
 
-# Load operations
+# Load operations (all of them, or only the ones of a month and the closing state of the previous months: the last
+# saved snapshot before the month and the transactions after it)
 #----------------------------------------------------------------------------------------------------------------------
-    def load_operations(self):
+    def load_operations(self, path=None, month=None, year=None):
         logging.debug('Loading the saved operations...')
-        # Load the operations from the database
-        # self.__stocks = copy.copy(self.__evaluated_stocks)
-        # self.__accumulated_loss = copy.copy(self.__accumulated_loss_evaluated)
-        # self.__accumulated_darf = copy.copy(self.__accumulated_darf_evaluated)
+        with self.__lock.writer:
+            database = Database(path or self.__database_path, self.__debug)
+            try:
+                self.__stocks = {stock.name: stock for stock in database.load_stocks()}
+                self.__transactions = {}
+                self.__monthly_transactions = {}
+                self.__month_digests = {}
+                self.__ledger = None
+                before = (year, month) if year is not None else None
+                snapshots = database.load_snapshots(before)
+                first = None
+                if (before is not None and snapshots):
+                    # The months between the last saved snapshot and the month are loaded too, to be replayed
+                    last_year, last_month = snapshots[-1].period
+                    first = (last_year + 1, 1) if last_month == 12 else (last_year, last_month + 1)
+                for transaction in database.load_transactions(first, before):
+                    self.__register_transaction(transaction)
+                self.__snapshots = {snapshot.period: snapshot for snapshot in snapshots}
+                self.__last_operation_id = database.last_operation_id()
+            finally:
+                database.close()
+            self.__opening_snapshot = None
+            self.__saved_snapshots = dict(self.__snapshots)
+            self.__changed_transactions.clear()
+            self.__stocks_changed = False
+            self.__removed_transactions.clear()
+            self.__invalidated_period = None
+            return True
 
 # Get total purchase of fi stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_purchase_of_fi_stocks(self):
-        logging.debug('Returning the total purchase of fi stocks...')
-        return self.__total_purchase['fi']
+        if (tracing.enabled):
+            logging.debug('Returning the total purchase of fi stocks...')
+        return money.to_float(self.__published.total_purchase['fi'])
 
 # Get total purchase of day trade stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_purchase_of_day_trade_stocks(self):
-        logging.debug('Returning the total purchase of day trade stocks...')
-        return self.__total_purchase['day_trade']
+        if (tracing.enabled):
+            logging.debug('Returning the total purchase of day trade stocks...')
+        return money.to_float(self.__published.total_purchase['day_trade'])
 
 # Get total purchase of normal stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_purchase_of_normal_stocks(self):
-        logging.debug('Returning the total purchase of normal stocks...')
-        return self.__total_purchase['normal']
+        if (tracing.enabled):
+            logging.debug('Returning the total purchase of normal stocks...')
+        return money.to_float(self.__published.total_purchase['normal'])
 
 # Get total sale of fi stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_sale_of_fi_stocks(self):
-        logging.debug('Returning the total sale of fi stocks...')
-        return self.__total_sale['fi']
+        if (tracing.enabled):
+            logging.debug('Returning the total sale of fi stocks...')
+        return money.to_float(self.__published.total_sale['fi'])
 
 # Get total sale of day trade stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_sale_of_day_trade_stocks(self):
-        logging.debug('Returning the total sale of day trade stocks...')
-        return self.__total_sale['day_trade']
+        if (tracing.enabled):
+            logging.debug('Returning the total sale of day trade stocks...')
+        return money.to_float(self.__published.total_sale['day_trade'])
 
 # Get total sale of normal stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_sale_of_normal_stocks(self):
-        logging.debug('Returning the total sale of normal stocks...')
-        return self.__total_sale['normal']
+        if (tracing.enabled):
+            logging.debug('Returning the total sale of normal stocks...')
+        return money.to_float(self.__published.total_sale['normal'])
 
 # Get total profit of fi stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_profit_of_fi_stocks(self):
-        logging.debug('Returning the total profit of fi stocks...')
-        return self.__total_profit['fi']
+        if (tracing.enabled):
+            logging.debug('Returning the total profit of fi stocks...')
+        return money.to_float(self.__published.total_profit['fi'])
 
 # Get total profit of day trade stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_profit_of_day_trade_stocks(self):
-        logging.debug('Returning the total profit of day trade stocks...')
-        return self.__total_profit['day_trade']
+        if (tracing.enabled):
+            logging.debug('Returning the total profit of day trade stocks...')
+        return money.to_float(self.__published.total_profit['day_trade'])
 
 # Get total profit of normal stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_profit_of_normal_stocks(self):
-        logging.debug('Returning the total profit of normal stocks...')
-        return self.__total_profit['normal']
+        if (tracing.enabled):
+            logging.debug('Returning the total profit of normal stocks...')
+        return money.to_float(self.__published.total_profit['normal'])
 
 # Get total due tax of fi stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_due_tax_of_fi_stocks(self):
-        logging.debug('Returning the total due tax of fi stocks...')
-        return self.__total_due_tax['fi']
+        if (tracing.enabled):
+            logging.debug('Returning the total due tax of fi stocks...')
+        return money.to_float(self.__published.total_due_tax['fi'])
 
 # Get total due tax of day trade stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_due_tax_of_day_trade_stocks(self):
-        logging.debug('Returning the total due tax of day trade stocks...')
-        return self.__total_due_tax['day_trade']
+        if (tracing.enabled):
+            logging.debug('Returning the total due tax of day trade stocks...')
+        return money.to_float(self.__published.total_due_tax['day_trade'])
 
 # Get total due tax of normal stocks
 #----------------------------------------------------------------------------------------------------------------------
     def get_total_due_tax_of_normal_stocks(self):
-        logging.debug('Returning the total due tax of normal stocks...')
-        return self.__total_due_tax['normal']
+        if (tracing.enabled):
+            logging.debug('Returning the total due tax of normal stocks...')
+        return money.to_float(self.__published.total_due_tax['normal'])
 
 # Get darf value
 #----------------------------------------------------------------------------------------------------------------------
     @property
     def darf_value(self):
-        logging.debug('Returning the darf value %f...', self.__darf_value)
-        return self.__darf_value
+        if (tracing.enabled):
+            logging.debug('Returning the darf value %f...', money.to_float(self.__published.darf_value))
+        return money.to_float(self.__published.darf_value)
+
+# Get all the calculated values (totals by category, darf value and the state carried to the next month)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def results(self):
+        if (tracing.enabled):
+            logging.debug('Returning the calculated values...')
+        published = self.__published
+        totals = lambda values: {key: money.to_float(value) for key, value in values.items()}
+        return {'total_purchase': totals(published.total_purchase), 'total_sale': totals(published.total_sale),
+            'total_profit': totals(published.total_profit), 'total_due_tax': totals(published.total_due_tax),
+            'darf_value': money.to_float(published.darf_value), 'accumulated_loss': totals(published.accumulated_loss),
+            'accumulated_darf': money.to_float(published.accumulated_darf)}
+
+# Get the results of the last calculation as a snapshot with the closing positions (money in units, never changed, so
+# the values read from it are always of the same calculation while others run)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def result_snapshot(self):
+        return self.__published
+
+# Get the (year, month) periods with registered transactions in order
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def periods(self):
+        logging.debug('Returning the periods with transactions...')
+        with self.__lock.reader:
+            return sorted(period for period, transactions in self.__monthly_transactions.items() if transactions)
+
+# Get the (year, month) periods between two periods, both included (without first or last the range starts or ends in
+# the first or last period with transactions)
+#----------------------------------------------------------------------------------------------------------------------
+    def get_periods(self, first=None, last=None):
+        logging.debug('Returning the periods from %s to %s...', first, last)
+        periods = self.periods
+        first = first or (periods[0] if periods else None)
+        last = last or (periods[-1] if periods else None)
+        if (first is None or last is None):
+            return []
+        year, month = first
+        result = []
+        while (year, month) <= tuple(last):
+            result.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return result
+
+# Get the losses carried to the next month by category
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def accumulated_loss(self):
+        if (tracing.enabled):
+            logging.debug('Returning the accumulated loss...')
+        return {key: money.to_float(value) for key, value in self.__published.accumulated_loss.items()}
+
+# Get the darf value below the minimum carried to the next month
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def accumulated_darf(self):
+        if (tracing.enabled):
+            logging.debug('Returning the accumulated darf %f...', money.to_float(self.__published.accumulated_darf))
+        return money.to_float(self.__published.accumulated_darf)
+
+# Enable the stats of the calculations (timers of the phases and counters, read in the stats property after each
+# calculation), optionally with a cProfile of the calculations and a hook called with (phase, seconds)
+#----------------------------------------------------------------------------------------------------------------------
+    def set_stats(self, enabled=True, profile=False, hook=None):
+        logging.debug('Setting the stats: %s', enabled)
+        with self.__lock.writer:
+            self.__stats = Stats(hook, profile, self.__debug) if enabled else None
+            return True
+
+# Get the stats of the last calculation (None if they are not enabled)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def stats(self):
+        return self.__stats
+
+# Enable the cache of the calculated results, bounded to size results (or a cache shared with other controls, the
+# results of each one kept apart by its account). The results are keyed by the content hash of the positions and
+# transactions they depend on, so a result is served again while they do not change.
+#----------------------------------------------------------------------------------------------------------------------
+    def set_cache(self, enabled=True, size=256, account=None, cache=None):
+        logging.debug('Setting the result cache: %s', enabled)
+        with self.__lock.writer:
+            if (enabled and cache is None):
+                cache = ResultCache(size, self.__debug)
+            self.__cache = cache if enabled else None
+            self.__account = account
+            return True
+
+# Get the result cache (None if it is not enabled)
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def cache(self):
+        return self.__cache
+
+# Get a result from the cache counting the hits and misses in the stats
+#----------------------------------------------------------------------------------------------------------------------
+    def __cached(self, key):
+        snapshot = self.__cache.get(key)
+        if (self.__stats is not None):
+            self.__stats.count('cache_misses' if snapshot is None else 'cache_hits')
+        return snapshot
+
+# Run a calculation measuring it in the stats
+#----------------------------------------------------------------------------------------------------------------------
+    def __measure(self, phase, function, *args):
+        stats = self.__stats
+        stats.reset()
+        start = stats.clock()
+        with stats.profiling():
+            result = function(*args)
+        stats.lap(phase, start)
+        return result
 
 # Calculate darf
 #----------------------------------------------------------------------------------------------------------------------
     def calculate_darf(self):
         logging.debug('Calculating the darf')
-        if (self.__process_transactions()):
+        with self.__lock.reader, self.__calculation:
+            if (self.__stats is not None):
+                return self.__measure('calculate_darf', self.__calculate_darf)
+            return self.__calculate_darf()
+
+# Calculate darf of all the transactions from the opening state (the registered stocks are the positions before the
+# first transaction and are never changed, the closing positions are published in result_snapshot)
+#----------------------------------------------------------------------------------------------------------------------
+    def __calculate_darf(self):
+        opening = self.__opening()
+        key = None
+        if (self.__cache is not None):
+            key = (self.__account, None, content_digest(opening.digest, self.__numpy_engine,
+                [self.__month_digest(period) for period in sorted(self.__monthly_transactions)]))
+            snapshot = self.__cached(key)
+            if (snapshot is not None):
+                self.__restore_results(snapshot)
+                self.__published = snapshot
+                logging.debug('Darf calculated (cached)!')
+                return True
+        stocks = opening.stocks
+        self.__accumulated_loss = opening.accumulated_loss
+        self.__accumulated_darf = opening.accumulated_darf
+        if (self.__process_transactions(self.__transactions.values(), stocks)):
+            self.__published = MonthSnapshot(0, 0, stocks, self.__accumulated_loss, self.__accumulated_darf,
+                self.__total_purchase, self.__total_sale, self.__total_profit, self.__total_due_tax,
+                self.__darf_value)
+            if (key is not None):
+                self.__cache.put(key, self.__published)
             logging.debug('Darf calculated!')
+            return True
         else:
             logging.error('Error calculating the darf!')
+            return False
+
+# Calculate the darf of a single month (replaying only its transactions over the previous month closing state)
+#----------------------------------------------------------------------------------------------------------------------
+    def calculate_month_darf(self, month, year):
+        logging.debug('Calculating the darf of %d-%d', month, year)
+        with self.__lock.reader, self.__calculation:
+            if (self.__stats is not None):
+                return self.__measure('calculate_month_darf', self.__calculate_month_darf, month, year)
+            return self.__calculate_month_darf(month, year)
+
+# Calculate the darf of a single month from the closest snapshot
+#----------------------------------------------------------------------------------------------------------------------
+    def __calculate_month_darf(self, month, year):
+        snapshot = self.__month_snapshot(month, year)
+        if (snapshot is None):
+            return False
+        self.__restore_results(snapshot)
+        self.__published = snapshot
+        logging.debug('Darf of %d-%d calculated!', month, year)
+        return True
+
+# Get the snapshot of a month, replaying the months from the closest snapshot (return None if a month fails), without
+# publishing its results
+#----------------------------------------------------------------------------------------------------------------------
+    def __month_snapshot(self, month, year):
+        period = (year, month)
+        snapshot = self.__snapshots.get(period)
+        if (snapshot is None):
+            previous = self.__opening()
+            last = max([key for key in self.__snapshots if key < period], default=None)
+            if (last is not None):
+                previous = self.__snapshots[last]
+            for key in sorted(self.__monthly_transactions):
+                if (key >= period):
+                    break
+                if (last is None or key > last):
+                    previous = self.__replay_month(key, previous)
+                    if (previous is None):
+                        logging.error('Error calculating the darf of %d-%d!', key[1], key[0])
+                        return None
+            snapshot = self.__replay_month(period, previous)
+            if (snapshot is None):
+                logging.error('Error calculating the darf of %d-%d!', month, year)
+        return snapshot
+
+# Get the position of a stock at the end of a date (a copy of the stock with the ammount, the average price and the
+# paid fares, or None if there was no position), in O(log n) from the checkpoints of the position ledger
+#----------------------------------------------------------------------------------------------------------------------
+    def get_position(self, name, date):
+        if (tracing.enabled):
+            logging.debug('Returning the position of %s on %s...', name, date)
+        with self.__lock.reader, self.__calculation:
+            if (self.__ledger is None):
+                logging.debug('Building the position ledger...')
+                self.__ledger = PositionLedger(self.__apply_day, lambda name: self.__opening().find_stock(name),
+                    self.__debug)
+                for transaction in self.__transactions.values():
+                    self.__ledger.add(transaction)
+            return self.__ledger.position(name, date)
+
+# Apply the transactions of a stock in a day to its position, as the calculation does: the day trades are netted and
+# do not change the position (return (True, new position or None if it was closed) or (False, None) if a sale has no
+# position)
+#----------------------------------------------------------------------------------------------------------------------
+    def __apply_day(self, transactions, stock):
+        stocks = {} if stock is None else {stock.name: copy.copy(stock)}
+        transactions = sorted(transactions, key=lambda x: (x.operation_type.value, x.operation_id))
+        normal_transactions = match_day_trades([transaction for transaction in transactions
+            if transaction.category == StockTypes.NORMAL])[1]
+        fi_transactions = [transaction for transaction in transactions if transaction.category == StockTypes.FI]
+        if (self.__stock_totals(fi_transactions, stocks) is None or
+            self.__stock_totals(normal_transactions, stocks) is None):
+            return False, None
+        return True, next(iter(stocks.values()), None)
+
+# Fork the state of a month to evaluate hypothetical orders without changing the control (the month is calculated if
+# needed, as in calculate_month_darf; return a Preview, or None if the month can not be calculated)
+#----------------------------------------------------------------------------------------------------------------------
+    def preview(self, month, year):
+        logging.debug('Forking the state of %d-%d...', month, year)
+        with self.__lock.reader, self.__calculation:
+            period = (year, month)
+            last = max((key for key, transactions in self.__monthly_transactions.items()
+                if transactions and key < period), default=None)
+            # The snapshots are calculated without publishing them, so the results read are not changed by a preview
+            previous = self.__month_snapshot(last[1], last[0]) if last is not None else self.__opening()
+            if (previous is None):
+                return None
+            snapshot = self.__month_snapshot(month, year)
+            if (snapshot is None):
+                return None
+            return Preview(snapshot, previous, self.__evaluate_orders, self.__debug)
+
+# Process hypothetical orders after the operations of a month over copy on write positions (return the values of the
+# month in units, or None if a sale has no position). The orders are netted as day trades only among themselves.
+#----------------------------------------------------------------------------------------------------------------------
+    def __evaluate_orders(self, snapshot, previous, orders):
+        year, month = snapshot.period
+        day = calendar.monthrange(year, month)[1]
+        transactions = [Transaction(name, price, category, ammount, paid_fares, day, month, year, operation_type,
+            -i) for i, (name, price, category, ammount, paid_fares, operation_type) in enumerate(orders, 1)]
+        transactions.sort(key=lambda x: x.operation_type.value)
+        day_trade_transactions, normal_transactions = match_day_trades([transaction for transaction in transactions
+            if transaction.category == StockTypes.NORMAL])
+        stocks = CopyOnWriteStocks(snapshot)
+        totals = {'fi': self.__stock_totals([transaction for transaction in transactions
+            if transaction.category == StockTypes.FI], stocks), 'normal': self.__stock_totals(normal_transactions,
+            stocks), 'day_trade': self.__day_trade_totals(day_trade_transactions)}
+        if (totals['fi'] is None or totals['normal'] is None):
+            return None
+        results = {'total_purchase': snapshot.total_purchase, 'total_sale': snapshot.total_sale,
+            'total_profit': snapshot.total_profit, 'total_due_tax': {}, 'accumulated_loss': {}}
+        loss = previous.accumulated_loss
+        for key, (purchase, sale, profit) in totals.items():
+            results['total_purchase'][key] += purchase
+            results['total_sale'][key] += sale
+            results['total_profit'][key] += profit
+            results['total_due_tax'][key], results['accumulated_loss'][key] = self.__category_tax(key,
+                results['total_sale'][key], results['total_profit'][key], loss[key])
+        results['darf_value'], results['accumulated_darf'] = self.__darf(results['total_due_tax'],
+            previous.accumulated_darf)
+        return results
+
+# Get the closing state of a month already calculated (return None if it was not calculated or was invalidated)
+#----------------------------------------------------------------------------------------------------------------------
+    def get_snapshot(self, month, year):
+        logging.debug('Returning the snapshot of %d-%d...', month, year)
+        with self.__lock.reader:
+            return self.__snapshots.get((year, month))
+
+# Replay the transactions of a month over the closing state of the previous one (return the new snapshot, from the
+# cache if the state and the transactions were already calculated)
+#----------------------------------------------------------------------------------------------------------------------
+    def __replay_month(self, period, previous):
+        logging.debug('Replaying the transactions of %d-%d...', period[1], period[0])
+        digest = None
+        if (self.__cache is not None and previous.digest is not None):
+            digest = content_digest(previous.digest, self.__month_digest(period), self.__numpy_engine)
+            snapshot = self.__cached((self.__account, period, digest))
+            if (snapshot is not None):
+                self.__snapshots[period] = snapshot
+                return snapshot
+        if (self.__stats is not None):
+            self.__stats.count('months_replayed')
+        stocks = previous.stocks
+        self.__accumulated_loss = previous.accumulated_loss
+        self.__accumulated_darf = previous.accumulated_darf
+        transactions = self.__monthly_transactions.get(period, {}).values()
+        if (not self.__process_transactions(transactions, stocks)):
+            return None
+        snapshot = MonthSnapshot(period[0], period[1], stocks, self.__accumulated_loss, self.__accumulated_darf,
+            self.__total_purchase, self.__total_sale, self.__total_profit, self.__total_due_tax, self.__darf_value,
+            digest)
+        self.__snapshots[period] = snapshot
+        if (digest is not None):
+            self.__cache.put((self.__account, period, digest), snapshot)
+        return snapshot
+
+# Restore the calculated values from a month snapshot
+#----------------------------------------------------------------------------------------------------------------------
+    def __restore_results(self, snapshot):
+        logging.debug('Restoring the results of the snapshot...')
+        self.__total_purchase = snapshot.total_purchase
+        self.__total_sale = snapshot.total_sale
+        self.__total_profit = snapshot.total_profit
+        self.__total_due_tax = snapshot.total_due_tax
+        self.__accumulated_loss = snapshot.accumulated_loss
+        self.__accumulated_darf = snapshot.accumulated_darf
+        self.__darf_value = snapshot.darf_value
+
+# Get the state before the first month (the registered stocks without losses or darf to carry)
+#----------------------------------------------------------------------------------------------------------------------
+    def __opening(self):
+        if (self.__opening_snapshot is None):
+            self.__opening_snapshot = MonthSnapshot(0, 0, self.__stocks, {'normal': 0, 'day_trade': 0, 'fi': 0}, 0,
+                digest=self.__stocks_digest(self.__stocks))
+        return self.__opening_snapshot
+
+# Get the content digest of positions
+#----------------------------------------------------------------------------------------------------------------------
+    def __stocks_digest(self, stocks):
+        return content_digest({(stock.name, stock.price_units, stock.category, stock.ammount, stock.paid_fares_units)
+            for stock in stocks.values()})
+
+# Get the content digest of the transactions of a month (kept until the month changes)
+#----------------------------------------------------------------------------------------------------------------------
+    def __month_digest(self, period):
+        digest = self.__month_digests.get(period)
+        if (digest is None):
+            digest = content_digest({(transaction.operation_id, transaction.name, transaction.price_units,
+                transaction.category, transaction.ammount, transaction.paid_fares_units, transaction.operation_date,
+                transaction.operation_type) for transaction in self.__monthly_transactions.get(period, {}).values()})
+            self.__month_digests[period] = digest
+        return digest
+
+# Invalidate the snapshots from a period on (all of them, including the opening state, if no period is given)
+#----------------------------------------------------------------------------------------------------------------------
+    def __invalidate_snapshots(self, period=None):
+        if (period is None):
+            self.__snapshots.clear()
+            self.__opening_snapshot = None
+            self.__invalidated_period = (0, 0)
+            if (self.__ledger is not None):
+                self.__ledger.invalidate()
+        else:
+            for key in [key for key in self.__snapshots if key >= period]:
+                del self.__snapshots[key]
+            if (self.__invalidated_period is None or period < self.__invalidated_period):
+                self.__invalidated_period = period
+
+# Get the (year, month) period of a transaction
+#----------------------------------------------------------------------------------------------------------------------
+    def __period(self, transaction):
+        return (transaction.operation_date.year, transaction.operation_date.month)
 
 # Set log level
 #----------------------------------------------------------------------------------------------------------------------
     def set_log_level(self, debug):
+        tracing.set_tracing(debug)
         if (debug):
             logging.basicConfig(level=1)
             logging.debug('Log debug level activated!')
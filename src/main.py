@@ -1,7 +1,15 @@
 #!/usr/bin/python3
 
 import sys
+import datetime
+from include import task
+from include import money
 from include.gui import Ui_Gui
+from include.worker import WorkerPool
+from include.worker import InterfaceCall
+from src.control import Control
+from PySide2 import QtCore
+from PySide2 import QtGui
 from PySide2 import QtWidgets
 
 class Gui(QtWidgets.QWidget, Ui_Gui):
@@ -10,6 +18,20 @@ class Gui(QtWidgets.QWidget, Ui_Gui):
         super().__init__(*args, **kwargs)
         self.setupUi(self)
         self.center()
+        self.control = Control()
+        # The months asked again with nothing changed (or with an edit undone) are served from the cache
+        self.control.set_cache()
+        self.generator = None
+        # The generator asks the captchas from the worker pool, so they are asked in the thread of the interface
+        self.captcha = InterfaceCall(self.ask_captcha)
+        self.workers = WorkerPool()
+        self.period = None
+        self.table = None
+        self.darfGenerationButton.clicked.connect(self.generate)
+        self.consultStockButton.clicked.connect(self.show_transactions)
+        self.darfGenerationButton.setEnabled(False)
+        self.workers.start(task.load_operations, self.control, finished=lambda loaded: self.calculate(),
+            error=self.show_error)
 
     def center(self):
         frame = self.frameGeometry()
@@ -17,9 +39,95 @@ class Gui(QtWidgets.QWidget, Ui_Gui):
         frame.moveCenter(centerPosition)
         self.move(frame.topLeft())
 
-app = QtWidgets.QApplication(sys.argv)
-app.setStyle('Fusion')
-application = Gui()
-application.show()
-app.exec_()
+    # The calculation runs in the worker pool and each month is shown as soon as it is calculated
+    def calculate(self):
+        self.darfGenerationButton.setEnabled(False)
+        self.workers.start(task.calculate_months, self.control, progress=self.show_progress, result=self.show_month,
+            finished=self.calculated, error=self.show_error)
 
+    def calculated(self, months):
+        self.setWindowTitle('Gerador de Darf')
+        self.darfGenerationButton.setEnabled(months > 0)
+
+    def show_progress(self, done, total):
+        self.setWindowTitle('Gerador de Darf - %d/%d' %(done, total) if total else 'Gerador de Darf - %d' %done)
+
+    def show_month(self, month):
+        self.period, results = month
+        for prefix, key in (('swingTrade', 'normal'), ('dayTrade', 'day_trade'), ('realEstateFunds', 'fi')):
+            getattr(self, prefix + 'TotalSoldLabel').setText(money.to_text(results['total_sale'][key]))
+            getattr(self, prefix + 'AccumulatedLossLabel').setText(money.to_text(results['accumulated_loss'][key]))
+            getattr(self, prefix + 'DueTaxLabel').setText(money.to_text(results['total_due_tax'][key]))
+        self.darfValueOutputLabel.setText(money.to_text(results['darf_value']))
+
+    # The table fetches the transactions in batches as it is scrolled, so it opens at once with any history
+    def show_transactions(self):
+        if (self.table is None):
+            from include.transaction_model import TransactionModel
+            self.table = QtWidgets.QTableView()
+            self.table.setWindowTitle('Operações')
+            self.table.setModel(TransactionModel(self.control, parent=self.table))
+            self.table.setSortingEnabled(True)
+            self.table.sortByColumn(0, QtCore.Qt.AscendingOrder)
+            self.table.verticalHeader().setDefaultSectionSize(20)
+            self.table.resize(800, 600)
+        else:
+            self.table.model().refresh()
+        self.table.show()
+
+    def show_error(self, error):
+        self.setWindowTitle('Gerador de Darf')
+        QtWidgets.QMessageBox.warning(self, 'Gerador de Darf', error)
+
+    # The bill of the last month is generated in the worker pool (the cpf is the user of CEI)
+    def generate(self):
+        year, month = self.period
+        jobs = {'darf': (self.CeiUserInput.text(), datetime.date(year, month, 1), self.control.darf_value)}
+        self.darfGenerationButton.setEnabled(False)
+        self.workers.start(task.generate_bills, self.new_generator, jobs, self.captcha, progress=self.show_progress,
+            finished=self.calculated, error=self.show_error)
+
+    # Called in the worker pool: selenium is only imported and the browser started with the first generator, so the
+    # interface opens without them and does not freeze while they start
+    def new_generator(self):
+        if (self.generator is None):
+            from include.darf import DarfGenerator
+            self.generator = DarfGenerator()
+        return self.generator
+
+    # Called in the thread of the interface through self.captcha, while the worker waits for the answer
+    def ask_captcha(self, image):
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle('Captcha')
+        pixmap = QtGui.QPixmap()
+        pixmap.loadFromData(image)
+        picture = QtWidgets.QLabel(dialog)
+        picture.setPixmap(pixmap)
+        answer = QtWidgets.QLineEdit(dialog)
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel,
+            parent=dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        for widget in (picture, answer, buttons):
+            layout.addWidget(widget)
+        if (dialog.exec_() != QtWidgets.QDialog.Accepted):
+            raise ValueError('The captcha was not answered')
+        return answer.text()
+
+    def closeEvent(self, event):
+        # The workers waiting for a captcha are released before waiting for them
+        self.captcha.close()
+        self.workers.shutdown()
+        if (self.table is not None):
+            self.table.close()
+        if (self.generator is not None):
+            self.generator.close()
+        super().closeEvent(event)
+
+if (__name__ == '__main__'):
+    app = QtWidgets.QApplication(sys.argv)
+    app.setStyle('Fusion')
+    application = Gui()
+    application.show()
+    app.exec_()
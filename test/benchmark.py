@@ -0,0 +1,349 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import json
+import datetime
+import itertools
+import random
+import subprocess
+import logging
+import tempfile
+import tracemalloc
+from src.batch import Batch
+from src.control import Control
+from include import money
+from include import importer
+from include import tracing
+from include import numpy_engine
+from include.stock import StockTypes
+from include.day_trade import match_day_trades
+from include.transaction import TransactionTypes
+from history import synthetic_history
+
+# Greatest accepted ratio of the time of the money in units over the time of the float money
+ARITHMETIC_LIMIT = 3.0
+
+class Benchmark:
+
+# Initialize the class with its properties
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self, debug=False):
+        self.__debug = debug
+
+# Register a synthetic (but always valid) history of purchases and sales in a control
+#----------------------------------------------------------------------------------------------------------------------
+    def __add_transactions(self, control, size, seed=0):
+        generator = random.Random(seed)
+        holdings = {}
+        for operation_id in range(size):
+            name = 'STCK%d' %generator.randint(1, 300)
+            held = holdings.get(name, 0)
+            if (held > 0 and generator.random() < 0.4):
+                operation_type = TransactionTypes.SALE
+                ammount = generator.randint(1, held)
+                holdings[name] = held - ammount
+            else:
+                operation_type = TransactionTypes.PURCHASE
+                ammount = generator.randint(1, 1000)
+                holdings[name] = held + ammount
+            day = operation_id * 3000 // size
+            control.add_transaction(name, round(generator.uniform(5.0, 150.0), 2), StockTypes.NORMAL, ammount,
+                round(generator.uniform(0.0, 10.0), 2), day % 28 + 1, day // 28 % 12 + 1, 2010 + day // 336,
+                operation_type, operation_id)
+
+# Memory used by the transactions registered in a control
+#----------------------------------------------------------------------------------------------------------------------
+    def memory(self, size=100000):
+        control = Control(self.__debug)
+        logging.debug('Executing the memory benchmark')
+        tracemalloc.start()
+        start = time.perf_counter()
+        self.__add_transactions(control, size)
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        logging.info('Memory: %d transactions: %.1f MB (peak %.1f MB, %.0f bytes per transaction) in %.2f s', size,
+            current / 2**20, peak / 2**20, current / size, elapsed)
+
+# Time of the darf calculation with the tracing of the values turned on (former behaviour) and off
+#----------------------------------------------------------------------------------------------------------------------
+    def processing(self, size=100000):
+        logging.debug('Executing the processing benchmark')
+        for enabled in (True, False):
+            control = Control(self.__debug)
+            self.__add_transactions(control, size)
+            tracing.set_tracing(enabled)
+            start = time.perf_counter()
+            control.calculate_darf()
+            elapsed = time.perf_counter() - start
+            tracing.set_tracing(self.__debug)
+            logging.info('Processing: %d transactions with tracing %s: %.3f s (darf %.2f)', size,
+                'on' if enabled else 'off', elapsed, control.darf_value)
+        if (numpy_engine.available()):
+            control = Control(self.__debug, True)
+            self.__add_transactions(control, size)
+            start = time.perf_counter()
+            control.calculate_darf()
+            elapsed = time.perf_counter() - start
+            logging.info('Processing: %d transactions with numpy: %.3f s (darf %.2f)', size, elapsed,
+                control.darf_value)
+
+# Time of the average price and fee proration loop with float money and with money in units (return the ratio of the
+# times, units over float). The exact money is slower than float (about 2.3 times in this loop, 0.48 s against 0.44 s
+# of the last float version for calculate_darf of 100k transactions), a ratio above the limit is a regression.
+#----------------------------------------------------------------------------------------------------------------------
+    def arithmetic(self, size=100000, limit=ARITHMETIC_LIMIT):
+        Control(self.__debug)
+        logging.debug('Executing the arithmetic benchmark')
+        generator = random.Random(0)
+        operations = [(round(generator.uniform(5.0, 150.0), 2), generator.randint(1, 1000),
+            round(generator.uniform(0.0, 10.0), 2)) for _ in range(size)]
+        start = time.perf_counter()
+        price, ammount, paid_fares = 0.0, 0, 0.0
+        for value, quantity, fares in operations:
+            price = (price * ammount + value * quantity) / (ammount + quantity)
+            paid_fares = paid_fares + fares - (paid_fares / (ammount + quantity)) * quantity / 2
+            ammount += quantity
+        float_elapsed = time.perf_counter() - start
+        logging.info('Arithmetic: %d operations with float: %.3f s', size, float_elapsed)
+        operations = [(money.to_units(value), quantity, money.to_units(fares)) for value, quantity, fares in operations]
+        start = time.perf_counter()
+        price, ammount, paid_fares = 0, 0, 0
+        for value, quantity, fares in operations:
+            price = money.divide(price * ammount + value * quantity, ammount + quantity)
+            paid_fares = paid_fares + fares - money.divide(paid_fares * quantity, (ammount + quantity) * 2)
+            ammount += quantity
+        elapsed = time.perf_counter() - start
+        ratio = elapsed / float_elapsed
+        logging.info('Arithmetic: %d operations with units: %.3f s (%.2f times the float time)', size, elapsed, ratio)
+        if (ratio > limit):
+            logging.error('Arithmetic: the units take %.2f times the float time, above the limit of %.2f!', ratio,
+                limit)
+        return ratio
+
+# Time of the batch calculation of many accounts with one worker and with one worker per core
+#----------------------------------------------------------------------------------------------------------------------
+    def batch(self, size=100000, accounts=200):
+        control = Control(self.__debug)
+        logging.debug('Executing the batch benchmark')
+        self.__add_transactions(control, size)
+        transactions = [(x.name, x.price, x.category, x.ammount, x.paid_fares, x.operation_date.day,
+            x.operation_date.month, x.operation_date.year, x.operation_type, x.operation_id)
+            for x in control.transactions]
+        # Every account gets the same share of the names, so its history is still valid
+        shares = {}
+        for transaction in transactions:
+            shares.setdefault(hash(transaction[0]) % accounts, []).append(transaction)
+        operations = {'account-%d' %key: {'transactions': value} for key, value in shares.items()}
+        for workers in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            Batch(workers).calculate(operations)
+            elapsed = time.perf_counter() - start
+            logging.info('Batch: %d accounts (%d transactions) with %d workers: %.3f s', len(operations), size,
+                workers, elapsed)
+
+# Throughput of the import of a csv export and memory used by the parsing with two sizes of file
+#----------------------------------------------------------------------------------------------------------------------
+    def importing(self, size=100000):
+        control = Control(self.__debug)
+        logging.debug('Executing the import benchmark')
+        self.__add_transactions(control, size)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+            with open(path, 'w') as output:
+                output.write('Data do Negocio;Compra/Venda;Codigo;Quantidade;Preco;Taxas\n')
+                for x in control.transactions:
+                    output.write('%02d/%02d/%d;%s;%s;%d;%s;%s\n' %(x.operation_date.day, x.operation_date.month,
+                        x.operation_date.year, 'C' if x.operation_type == TransactionTypes.PURCHASE else 'V', x.name,
+                        x.ammount, str(x.price).replace('.', ','), str(x.paid_fares).replace('.', ',')))
+            start = time.perf_counter()
+            imported = importer.import_file(Control(self.__debug), path)
+            elapsed = time.perf_counter() - start
+            logging.info('Import: %d rows in %.3f s (%.0f rows per second)', imported, elapsed, imported / elapsed)
+            for rows in (size // 4, size):
+                tracemalloc.start()
+                for batch in importer.batches(importer.parse_rows(itertools.islice(importer.read_csv(path), rows + 1)),
+                    10000):
+                    pass
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                logging.info('Import: parsing %d rows in batches: peak %.1f MB', rows, peak / 2**20)
+
+# Import time of the entry points (from the -X importtime output of python) and wall time of the headless command line
+#----------------------------------------------------------------------------------------------------------------------
+    def startup(self, runs=5):
+        logging.debug('Executing the startup benchmark')
+        root = os.path.dirname(os.path.abspath(__file__)) + '/..'
+        environment = dict(os.environ, PYTHONPATH=root)
+        for module in ('src.control', 'src.cli', 'include.darf', 'src.main'):
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], env=environment,
+                stderr=subprocess.PIPE, universal_newlines=True)
+            modules = {}
+            for line in process.stderr.splitlines():
+                if (line.startswith('import time:') and not line.endswith('| imported package')):
+                    _, cumulative, name = line[len('import time:'):].split('|')
+                    modules[name.strip()] = int(cumulative)
+            heavy = [name for name in ('numpy', 'PySide2', 'selenium', 'openpyxl') if name in modules]
+            if (process.returncode != 0):
+                logging.info('Startup: import of %s failed (missing dependency)', module)
+            else:
+                logging.info('Startup: import of %s: %.1f ms (heavy modules: %s)', module, modules[module] / 1000,
+                    ', '.join(heavy) or 'none')
+        with tempfile.TemporaryDirectory() as directory:
+            control = Control(self.__debug)
+            self.__add_transactions(control, 1000)
+            control.save_operations(os.path.join(directory, 'darf.db'))
+            elapsed = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, root + '/src/cli.py', '-d', os.path.join(directory, 'darf.db'), '-m',
+                    '1', '-y', '2010'], env=environment, stdout=subprocess.DEVNULL, check=True)
+                elapsed.append(time.perf_counter() - start)
+            logging.info('Startup: headless command line of one month: %.1f ms (best of %d)', min(elapsed) * 1000,
+                runs)
+
+# Time of the darf calculation without stats, with the stats and with the stats and the profile
+#----------------------------------------------------------------------------------------------------------------------
+    def instrumentation(self, size=100000):
+        logging.debug('Executing the instrumentation benchmark')
+        history = list(synthetic_history(size))
+        for mode, arguments in (('off', None), ('on', (True, False)), ('on with profile', (True, True))):
+            control = Control(self.__debug)
+            for transaction in history:
+                control.add_transaction(*transaction)
+            if (arguments is not None):
+                control.set_stats(*arguments)
+            start = time.perf_counter()
+            control.calculate_darf()
+            elapsed = time.perf_counter() - start
+            logging.info('Instrumentation: %d transactions with stats %s: %.3f s', size, mode, elapsed)
+
+# Time of the first point in time query of a position (building the ledger), of the next queries and of a query after
+# a transaction is appended
+#----------------------------------------------------------------------------------------------------------------------
+    def positions(self, size=100000, queries=10000):
+        logging.debug('Executing the positions benchmark')
+        control = Control(self.__debug)
+        history = list(synthetic_history(size))
+        for transaction in history:
+            control.add_transaction(*transaction)
+        names = sorted({transaction[0] for transaction in history})
+        start = time.perf_counter()
+        control.get_position(names[0], datetime.date(2017, 6, 15))
+        first = time.perf_counter() - start
+        generator = random.Random(0)
+        dates = [datetime.date(generator.randint(2015, 2019), generator.randint(1, 12), generator.randint(1, 28))
+            for _ in range(queries)]
+        elapsed = []
+        # The positions of each stock are calculated on its first query
+        for _ in range(2):
+            start = time.perf_counter()
+            for i in range(queries):
+                control.get_position(names[i % len(names)], dates[i])
+            elapsed.append(time.perf_counter() - start)
+        name, price, category = history[-1][:3]
+        control.add_transaction(name, price, category, 1, 0.0, 28, 12, 2019, TransactionTypes.PURCHASE, size + 1)
+        start = time.perf_counter()
+        control.get_position(name, datetime.date(2019, 12, 28))
+        appended = time.perf_counter() - start
+        logging.info('Positions: %d transactions: first query %.3f s, %.1f us per query (%.1f us on the first query '
+            'of each stock), %.1f us after an append', size, first, elapsed[1] * 1e6 / queries,
+            elapsed[0] * 1e6 / queries, appended * 1e6)
+
+# Time of each phase of the calculation and memory of the transactions with synthetic histories of each size, stored in
+# the results file with the commit, so a phase that got slower or a darf that changed since the last run of another
+# commit is reported
+#----------------------------------------------------------------------------------------------------------------------
+    def suite(self, sizes=(10**3, 10**4, 10**5, 10**6), path=None, tolerance=1.2):
+        logging.debug('Executing the benchmark suite')
+        path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.jsonl')
+        process = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(path),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        commit = process.stdout.strip() or None
+        previous = {}
+        if (os.path.exists(path)):
+            with open(path) as results_file:
+                for line in results_file:
+                    record = json.loads(line)
+                    if (record['commit'] != commit or commit is None):
+                        previous[record['size']] = record
+        regressions = []
+        for size in sizes:
+            history = list(synthetic_history(size))
+            record = {'commit': commit, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': sys.version.split()[0], 'size': size}
+            control = Control(self.__debug)
+            start = time.perf_counter()
+            for transaction in history:
+                control.add_transaction(*transaction)
+            record['add_transaction'] = time.perf_counter() - start
+            # The passes of the calculation (private methods of Control) over new positions, as calculate_darf does
+            transactions = control.transactions
+            start = time.perf_counter()
+            ordered = sorted(transactions, key=lambda x: (x.operation_date, x.operation_type.value, x.operation_id))
+            fi_transactions = [x for x in ordered if x.category == StockTypes.FI]
+            day_trade_transactions, normal_transactions = match_day_trades([x for x in ordered
+                if x.category == StockTypes.NORMAL])
+            record['split'] = time.perf_counter() - start
+            for phase, function, arguments in (
+                ('fi_pass', control._Control__process_fi_transactions, (fi_transactions, {})),
+                ('day_trade_pass', control._Control__process_day_trade_transactions, (day_trade_transactions,)),
+                ('normal_pass', control._Control__process_normal_transactions, (normal_transactions, {})),
+                ('process_transactions', control._Control__process_transactions, (transactions, {}))):
+                start = time.perf_counter()
+                assert function(*arguments), 'Phase %s failed' %phase
+                record[phase] = time.perf_counter() - start
+            control = Control(self.__debug)
+            for transaction in history:
+                control.add_transaction(*transaction)
+            start = time.perf_counter()
+            assert control.calculate_darf(), 'Darf not calculated'
+            record['calculate_darf'] = time.perf_counter() - start
+            record['darf_value'] = control.darf_value
+            del control, transactions, ordered, fi_transactions, day_trade_transactions, normal_transactions
+            tracemalloc.start()
+            control = Control(self.__debug)
+            for transaction in history:
+                control.add_transaction(*transaction)
+            record['memory'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del control
+            logging.info('Suite: %d transactions: add %.3f s, split %.3f s, fi %.3f s, day trade %.3f s, normal %.3f '
+                's, process %.3f s, calculate_darf %.3f s, %.1f MB', size, record['add_transaction'], record['split'],
+                record['fi_pass'], record['day_trade_pass'], record['normal_pass'], record['process_transactions'],
+                record['calculate_darf'], record['memory'] / 2**20)
+            last = previous.get(size)
+            if (last is not None):
+                # The same history must give the same darf, a change is a regression of the calculation
+                if (abs(last['darf_value'] - record['darf_value']) > 0.01):
+                    logging.error('Suite: %d transactions: darf %.2f in %s and %.2f now!', size, last['darf_value'],
+                        last['commit'], record['darf_value'])
+                    regressions.append((size, 'darf_value', last['darf_value'], record['darf_value']))
+                for key in ('add_transaction', 'split', 'fi_pass', 'day_trade_pass', 'normal_pass',
+                    'process_transactions', 'calculate_darf', 'memory'):
+                    # Very short phases are too noisy to compare
+                    if (record[key] > last[key] * tolerance and (key == 'memory' or record[key] > 0.01)):
+                        logging.warning('Suite: %d transactions: %s regressed from %g in %s to %g!', size, key,
+                            last[key], last['commit'], record[key])
+                        regressions.append((size, key, last[key], record[key]))
+            with open(path, 'a') as results_file:
+                results_file.write(json.dumps(record) + '\n')
+        return regressions
+
+#----------------------------------------------------------------------------------------------------------------------
+
+benchmark = Benchmark(False)
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+largest = int(sys.argv[2]) if len(sys.argv) > 2 else 10**6
+benchmark.memory(size)
+benchmark.processing(size)
+ratio = benchmark.arithmetic(size)
+benchmark.batch(size)
+benchmark.importing(size)
+benchmark.startup()
+benchmark.instrumentation(size)
+benchmark.positions(size)
+if (benchmark.suite([10**exponent for exponent in range(3, 7) if 10**exponent <= largest]) or ratio > ARITHMETIC_LIMIT):
+    sys.exit(1)
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+
+import math
+import random
+from include.stock import StockTypes
+from include.transaction import TransactionTypes
+
+# Generate a synthetic but always valid trade history (the add_transaction arguments of each fill in date order). The
+# same seed always gives the same history: many tickers (the first ones are the most traded, as in the real market),
+# a share of real estate funds, intraday purchases and sales of the same stock that are netted as day trades and a
+# span of many years, with a random walk of the price of each ticker.
+#----------------------------------------------------------------------------------------------------------------------
+def synthetic_history(size, seed=0, tickers=500, years=5, fi_share=0.2, day_trade_share=0.15, first_year=2015):
+    generator = random.Random(seed)
+    funds = int(tickers * fi_share)
+    names = ['FUND%d11' %i if i < funds else 'STCK%d' %i for i in range(tickers)]
+    generator.shuffle(names)
+    prices = {name: generator.uniform(5.0, 150.0) for name in names}
+    holdings = {}
+    days = years * 12 * 28
+    operation_id = 0
+    while operation_id < size:
+        day = operation_id * days // size
+        date = (day % 28 + 1, day // 28 % 12 + 1, first_year + day // 336)
+        name = names[int(tickers * generator.random() ** 3)]
+        category = StockTypes.FI if name.startswith('FUND') else StockTypes.NORMAL
+        prices[name] = max(0.5, prices[name] * math.exp(generator.gauss(0.0, 0.02)))
+        price = round(prices[name], 2)
+        held = holdings.get(name, 0)
+        if (category == StockTypes.NORMAL and size - operation_id > 1 and generator.random() < day_trade_share):
+            # Intraday purchase and sale (the sale never takes more than the purchase, so the position stays valid)
+            ammount = generator.randint(1, 500)
+            sold = generator.randint(1, ammount)
+            fills = [(TransactionTypes.PURCHASE, ammount, price),
+                (TransactionTypes.SALE, sold, round(price * generator.uniform(0.97, 1.03), 2))]
+            holdings[name] = held + ammount - sold
+        elif (held > 0 and generator.random() < 0.45):
+            ammount = generator.randint(1, held)
+            fills = [(TransactionTypes.SALE, ammount, price)]
+            holdings[name] = held - ammount
+        else:
+            ammount = generator.randint(1, 1000)
+            fills = [(TransactionTypes.PURCHASE, ammount, price)]
+            holdings[name] = held + ammount
+        for operation_type, ammount, price in fills:
+            operation_id += 1
+            yield (name, price, category, ammount, round(generator.uniform(0.0, 10.0), 2)) + date + \
+                (operation_type, operation_id)
+
+#----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+import logging
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from include import bill
+
+# Buttons of the pages (#botoes), the browser flow clicks them by position
+BUTTONS = '<div id="botoes"><input type="button" value="Voltar"><input type="submit" name="Continuar" ' \
+    'value="Continuar">%s</div>'
+
+# Pages of the stand-in SicalcWeb flow (form action, fields of the form and the fields expected by the next step)
+PAGES = {
+    '/SicalcWeb/UF.asp': ('Municipio.asp', '<select name="UF"><option value="RJ">RJ - RIO DE JANEIRO</option>'
+        '<option value="SP">SP - SAO PAULO</option></select>', {}),
+    '/SicalcWeb/Municipio.asp': ('Receita.asp', '<select name="Municipio"><option value="7107">SAO PAULO</option>'
+        '</select>', {'UF': 'SP'}),
+    '/SicalcWeb/Receita.asp': ('Periodo.asp', '<input type="text" name="CodReceita">', {'Municipio': '7107'}),
+    '/SicalcWeb/Periodo.asp': ('Confirma.asp', '<input type="text" name="PA"><input type="text" name="TxtValRec">',
+        {'CodReceita': '6015'}),
+    '/SicalcWeb/Confirma.asp': ('Contribuinte.asp', '<input type="hidden" name="Resumo" value="1">', {}),
+    '/SicalcWeb/Contribuinte.asp': ('Valida.asp', '<input type="text" name="Num_Princ"><input type="text" '
+        'name="Num_DV"><img id="img_captcha_serpro_gov_br" src="captcha.jpg"><input type="text" '
+        'id="txtTexto_captcha_serpro_gov_br" name="txtTexto_captcha">', {'Resumo': '1'}),
+    '/SicalcWeb/Valida.asp': ('Darf.asp', '<p>Dados conferidos</p>', {'txtTexto_captcha': 'right'}),
+}
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+# Count the connections (one handler per connection)
+#----------------------------------------------------------------------------------------------------------------------
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+# Send a response
+#----------------------------------------------------------------------------------------------------------------------
+    def __send(self, content, content_type='text/html; charset=iso-8859-1', cookie=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        if (cookie is not None):
+            self.send_header('Set-Cookie', 'ASPSESSIONID=%s; path=/' %cookie)
+        self.end_headers()
+        self.wfile.write(content)
+
+# Send a page of the flow
+#----------------------------------------------------------------------------------------------------------------------
+    def __page(self, path, cookie=None):
+        action, fields, _ = PAGES[path]
+        buttons = BUTTONS %('<input type="submit" name="Calcular" value="Calcular">' if path.endswith('Periodo.asp')
+            else '')
+        content = '<html><body><form method="post" action="%s">%s%s</form></body></html>' %(action, fields, buttons)
+        self.__send(content.encode('iso-8859-1'), cookie=cookie)
+
+# Close the connection without answering if the path is to be dropped (once), as a server that handled the request
+# and closed the connection before the answer
+#----------------------------------------------------------------------------------------------------------------------
+    def __drop(self, path):
+        with self.server.lock:
+            if (path not in self.server.drop):
+                return False
+            self.server.drop.discard(path)
+            self.server.dropped.append(path)
+        self.close_connection = True
+        return True
+
+# Handle the get requests (first page and captcha image)
+#----------------------------------------------------------------------------------------------------------------------
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if (self.__drop(path)):
+            return
+        if (path.endswith('captcha.jpg')):
+            self.__send(b'captcha-image', 'image/jpeg')
+        else:
+            with self.server.lock:
+                self.server.sessions += 1
+                cookie = 'session-%d' %self.server.sessions
+            self.__page(path, cookie)
+
+# Handle the form submissions, going back to the captcha page if the captcha is wrong
+#----------------------------------------------------------------------------------------------------------------------
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        fields = dict(parse_qsl(self.rfile.read(int(self.headers['Content-Length'])).decode('iso-8859-1')))
+        self.server.requests.append((path, fields))
+        if (self.__drop(path)):
+            return
+        cookie = SimpleCookie(self.headers['Cookie'] or '').get('ASPSESSIONID')
+        if (cookie is None or not cookie.value.startswith('session-')):
+            self.send_error(403)
+            return
+        # The values of the forms are kept by session, as the sessions of the jobs run in parallel
+        with self.server.lock:
+            values = self.server.values.setdefault(cookie.value, {})
+        if (path.endswith('Darf.asp')):
+            period = values.get('PA')
+            cents = round(float(values.get('TxtValRec')) * 100)
+            barcode = ('8580%011d00646015%s' %(cents, period))[:44].ljust(44, '0')
+            self.__send(('%%PDF-1.4 DARF 6015 %s (Pagar este documento ate 28/%s/%s) (%s)' %(period, period[:2],
+                period[2:], bill.barcode_line(barcode))).encode('ascii'), 'application/pdf')
+            return
+        values.update(fields)
+        expected = PAGES[path][2]
+        if (any(fields.get(name) != value for name, value in expected.items())):
+            if (path.endswith('Valida.asp')):
+                self.__page('/SicalcWeb/Contribuinte.asp')
+            else:
+                self.send_error(400)
+            return
+        self.__page(path)
+
+# Log the requests only in debug
+#----------------------------------------------------------------------------------------------------------------------
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+class SicalcServer(ThreadingHTTPServer):
+
+# Initialize the class with its properties (a stand-in for SicalcWeb in a local port)
+#----------------------------------------------------------------------------------------------------------------------
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.sessions = 0
+        self.requests = []
+        # Paths of the next requests closed without an answer and the ones already dropped
+        self.drop = set()
+        self.dropped = []
+        # Values of the forms by session cookie
+        self.values = {}
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+
+# Get the url of the first page
+#----------------------------------------------------------------------------------------------------------------------
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:%d/SicalcWeb/UF.asp?AP=P&Person=N&TipTributo=1&FormaPagto=1' %self.server_address[1]
+
+# Stop the server
+#----------------------------------------------------------------------------------------------------------------------
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+#----------------------------------------------------------------------------------------------------------------------
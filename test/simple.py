@@ -1,9 +1,51 @@
 #!/usr/bin/python3
 
+import os
+import copy
+import csv
+import json
+import random
+import sqlite3
+import subprocess
+import tempfile
+import asyncio
+import time
 import logging
+import sys
+import datetime
+import threading
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from src import cli
+from src.batch import Batch
 from src.control import Control
+from include import bill
+from include import importer
+from include import money
+from include import task
+from include import numpy_engine
+from include.session_pool import SessionPool
+from include import sicalc_client
+from include.sicalc_client import SicalcClient
+from include.darf_pipeline import CaptchaQueue
+from include.darf_pipeline import DarfPipeline
+from include.darf_pipeline import run_solver
+from include.day_trade import match_day_trades
 from include.stock import StockTypes
+from include.transaction import Transaction
 from include.transaction import TransactionTypes
+from include.transaction_view import TransactionView
+from include.result_cache import ResultCache
+from include.rwlock import ReadWriteLock
+from sicalc_server import SicalcServer
+from history import synthetic_history
+
+class WorkerKiller:
+
+# Kill the worker process that unpickles the object (an account that makes its worker die)
+#----------------------------------------------------------------------------------------------------------------------
+    def __reduce__(self):
+        return (os._exit, (1,))
 
 class Test:
 
@@ -40,7 +82,962 @@ class Test:
         logging.info('Total Tax NORMAL: %f', self.__control.get_total_due_tax_of_normal_stocks())
         logging.info('Total Tax DAY_TRADE: %f', self.__control.get_total_due_tax_of_day_trade_stocks())
         logging.info('DARF VALUE: %f', self.__control.darf_value)
+
+# Reference day trade matching (the former nested loop of Control.__process_transactions)
+#----------------------------------------------------------------------------------------------------------------------
+    def __legacy_match_day_trades(self, transactions):
+        transactions = [copy.copy(transaction) for transaction in transactions]
+        day_trade_transactions = []
+        normal_transactions = []
+        for i in range(len(transactions)):
+            if transactions[i].category == StockTypes.NORMAL:
+                j = i + 1
+                while (j < len(transactions) and transactions[j].operation_date == transactions[i].operation_date \
+                     and transactions[i].ammount != 0):
+                    if (transactions[j].name == transactions[i].name):
+                        if (transactions[j].operation_type == transactions[i].operation_type):
+                            new_ammount = transactions[i].ammount + transactions[j].ammount
+                            new_price = (transactions[i].price * transactions[i].ammount + \
+                                transactions[j].price * transactions[j].ammount) / new_ammount
+                            transactions[i].ammount = new_ammount
+                            transactions[i].price = new_price
+                            transactions[i].paid_fares += transactions[j].paid_fares
+                            transactions[j].ammount = 0
+                            transactions[j].price = 0.0
+                            transactions[j].paid_fares = 0.0
+                        else:
+                            if (transactions[j].ammount < transactions[i].ammount):
+                                new = copy.copy(transactions[i])
+                                new.ammount = transactions[j].ammount
+                                new.paid_fares = (transactions[i].paid_fares / transactions[i].ammount) * new.ammount
+                                transactions[j].category = StockTypes.DAY_TRADE
+                                new.category = StockTypes.DAY_TRADE
+                                day_trade_transactions.append(new)
+                                day_trade_transactions.append(copy.copy(transactions[j]))
+                                transactions[i].paid_fares = transactions[i].paid_fares - new.paid_fares
+                                transactions[i].ammount-=new.ammount
+                                transactions[j].ammount = 0
+                            else:
+                                new = copy.copy(transactions[j])
+                                new.ammount = transactions[i].ammount
+                                new.paid_fares = (transactions[j].paid_fares / transactions[j].ammount) * new.ammount
+                                transactions[i].category = StockTypes.DAY_TRADE
+                                new.category = StockTypes.DAY_TRADE
+                                day_trade_transactions.append(new)
+                                day_trade_transactions.append(copy.copy(transactions[i]))
+                                transactions[j].paid_fares = transactions[j].paid_fares - new.paid_fares
+                                transactions[j].ammount-=new.ammount
+                                transactions[i].ammount = 0
+                    j+=1
+                if (transactions[i].ammount != 0 and transactions[i].category != StockTypes.DAY_TRADE):
+                    normal_transactions.append(copy.copy(transactions[i]))
+        return day_trade_transactions, normal_transactions
+
+# Test2 (day trade matching against the reference on random fills)
+#----------------------------------------------------------------------------------------------------------------------
+    def test2(self, rounds=200):
+        logging.debug('Executing test 2')
+        keys = lambda transactions: [(x.name, x.category, x.operation_type, x.operation_date, x.operation_id,
+            x.ammount) for x in transactions]
+        # The reference works with float money and the engine with units, so the values may differ in 1e-8
+        close = lambda first, second: all(abs(x.price - y.price) < 1e-6 and abs(x.paid_fares - y.paid_fares) < 1e-6
+            for x, y in zip(first, second))
+        for seed in range(rounds):
+            generator = random.Random(seed)
+            transactions = []
+            for operation_id in range(generator.randint(1, 60)):
+                transactions.append(Transaction(generator.choice(['stock-a', 'stock-b', 'stock-c']),
+                    round(generator.uniform(5.0, 50.0), 2), StockTypes.NORMAL, generator.randint(1, 500),
+                    round(generator.uniform(0.0, 5.0), 2), generator.randint(1, 3), 1, 2020,
+                    generator.choice(list(TransactionTypes)), operation_id))
+            transactions.sort(key=lambda x: (x.operation_date, x.operation_type.value))
+            expected = self.__legacy_match_day_trades(transactions)
+            day_trade_transactions, normal_transactions = match_day_trades(transactions)
+            assert keys(day_trade_transactions) == keys(expected[0]), 'Day trade mismatch (seed %d)' %seed
+            assert keys(normal_transactions) == keys(expected[1]), 'Normal mismatch (seed %d)' %seed
+            assert close(day_trade_transactions, expected[0]) and close(normal_transactions, expected[1]), \
+                'Value mismatch (seed %d)' %seed
+        logging.info('Day trade matching: %d random fill streams checked', rounds)
+
+# Register a random (but always valid) history of months in a control
+#----------------------------------------------------------------------------------------------------------------------
+    def __add_random_history(self, control, seed, months=6):
+        generator = random.Random(seed)
+        holdings = {}
+        operation_id = 0
+        for month in range(1, months + 1):
+            for day in range(1, 29, 3):
+                for _ in range(generator.randint(0, 6)):
+                    name, category = generator.choice([('stock-a', StockTypes.NORMAL), ('stock-b', StockTypes.NORMAL),
+                        ('fund-a', StockTypes.FI)])
+                    held = holdings.get(name, 0)
+                    if (held > 0 and generator.random() < 0.5):
+                        operation_type = TransactionTypes.SALE
+                        ammount = generator.randint(1, held)
+                        holdings[name] = held - ammount
+                    else:
+                        operation_type = TransactionTypes.PURCHASE
+                        ammount = generator.randint(1, 300)
+                        holdings[name] = held + ammount
+                    operation_id += 1
+                    control.add_transaction(name, round(generator.uniform(5.0, 150.0), 2), category, ammount,
+                        round(generator.uniform(0.0, 5.0), 2), day, month, 2020, operation_type, operation_id)
+
+# Get the calculated values of a control
+#----------------------------------------------------------------------------------------------------------------------
+    def __results(self, control):
+        return (control.get_total_purchase_of_fi_stocks(), control.get_total_purchase_of_normal_stocks(),
+            control.get_total_purchase_of_day_trade_stocks(), control.get_total_sale_of_fi_stocks(),
+            control.get_total_sale_of_normal_stocks(), control.get_total_sale_of_day_trade_stocks(),
+            control.get_total_profit_of_fi_stocks(), control.get_total_profit_of_normal_stocks(),
+            control.get_total_profit_of_day_trade_stocks(), control.darf_value)
+
+# Test3 (incremental month calculation against a calculation from scratch)
+#----------------------------------------------------------------------------------------------------------------------
+    def test3(self):
+        logging.debug('Executing test 3')
+        control = Control(False)
+        self.__add_random_history(control, 3)
+        incremental = []
+        for month in range(1, 7):
+            assert control.calculate_month_darf(month, 2020), 'Month %d not calculated' %month
+            incremental.append(self.__results(control))
+        for month in range(1, 7):
+            scratch = Control(False)
+            self.__add_random_history(scratch, 3)
+            assert scratch.calculate_month_darf(month, 2020)
+            assert self.__results(scratch) == incremental[month - 1], 'Month %d mismatch' %month
+        transaction = [x for x in control.transactions if x.operation_date.month == 3][0]
+        control.edit_transaction(transaction.operation_id, transaction.name, transaction.price + 1.0,
+            transaction.category, transaction.ammount, transaction.paid_fares, transaction.operation_date.day,
+            transaction.operation_date.month, transaction.operation_date.year, transaction.operation_type)
+        assert control.get_snapshot(2, 2020) is not None and control.get_snapshot(3, 2020) is None
+        assert control.calculate_month_darf(6, 2020)
+        scratch = Control(False)
+        for x in control.transactions:
+            scratch.add_transaction(x.name, x.price, x.category, x.ammount, x.paid_fares, x.operation_date.day,
+                x.operation_date.month, x.operation_date.year, x.operation_type, x.operation_id)
+        assert scratch.calculate_month_darf(6, 2020)
+        assert self.__results(scratch) == self.__results(control), 'Mismatch after editing a transaction'
+        # The whole calculation never changes the registered positions, so it can be mixed with the month ones
+        mixed = Control(False)
+        mixed.add_stock('stock-x', 10.0, StockTypes.NORMAL, 1000, 0.0)
+        mixed.add_transaction('stock-x', 12.0, StockTypes.NORMAL, 600, 1.0, 10, 1, 2020, TransactionTypes.PURCHASE, 1)
+        mixed.add_transaction('stock-x', 15.0, StockTypes.NORMAL, 400, 1.0, 20, 2, 2020, TransactionTypes.SALE, 2)
+        assert mixed.calculate_darf() and mixed.calculate_darf()
+        results = mixed.results
+        assert mixed.result_snapshot.find_stock('stock-x').ammount == 1200 and mixed.stocks[0].ammount == 1000
+        assert mixed.get_position('stock-x', datetime.date(2020, 1, 31)).ammount == 1600
+        assert mixed.calculate_month_darf(2, 2020) and mixed.get_snapshot(2, 2020).find_stock('stock-x').ammount == 1200
+        assert mixed.calculate_darf() and mixed.results == results
+        logging.info('Incremental darf: DARF VALUE of 6-2020: %f', control.darf_value)
+
+# Test4 (save and load the operations in the database)
+#----------------------------------------------------------------------------------------------------------------------
+    def test4(self):
+        logging.debug('Executing test 4')
+        path = os.path.join(tempfile.mkdtemp(), 'darf.db')
+        control = Control(False)
+        self.__add_random_history(control, 4)
+        assert control.calculate_month_darf(4, 2020)
+        expected = self.__results(control)
+        control.remove_transaction(control.transactions[-1].operation_id)
+        assert control.calculate_month_darf(6, 2020)
+        assert control.save_operations(path)
+        loaded = Control(False)
+        assert loaded.load_operations(path)
+        assert len(loaded.transactions) == len(control.transactions)
+        assert loaded.calculate_month_darf(6, 2020)
+        assert self.__results(loaded) == self.__results(control), 'Mismatch after loading the whole history'
+        month = Control(False)
+        assert month.load_operations(path, 6, 2020)
+        assert all(x.operation_date.month == 6 for x in month.transactions)
+        assert month.calculate_month_darf(6, 2020)
+        assert self.__results(month) == self.__results(control), 'Mismatch after loading a single month'
+        assert loaded.calculate_month_darf(4, 2020) and self.__results(loaded) == expected
+        # A month saved after an older snapshot is calculated with the transactions of the months between them
+        path = os.path.join(os.path.dirname(path), 'partial.db')
+        control = Control(False)
+        self.__add_random_history(control, 4)
+        assert control.calculate_month_darf(2, 2020) and control.save_operations(path)
+        assert control.calculate_month_darf(5, 2020)
+        month = Control(False)
+        assert month.load_operations(path, 5, 2020)
+        assert {x.operation_date.month for x in month.transactions} == {3, 4, 5}
+        assert month.calculate_month_darf(5, 2020)
+        assert self.__results(month) == self.__results(control), 'Mismatch after loading a month after old snapshots'
+        # A save writes only the changes: the rows the control did not change are not written again
+        connection = sqlite3.connect(path)
+        with connection:
+            connection.execute("UPDATE transactions SET name = 'untouched' WHERE month = 1")
+            connection.execute('UPDATE month_results SET darf_value = -1 WHERE month = 1')
+        loaded = Control(False)
+        assert loaded.load_operations(path)
+        assert loaded.add_transaction('stock-a', 10.0, StockTypes.NORMAL, 1, 0.0, 2, 5, 2020,
+            TransactionTypes.PURCHASE, 100000)
+        assert loaded.calculate_month_darf(5, 2020) and loaded.save_operations(path)
+        assert connection.execute("SELECT COUNT(*) FROM transactions WHERE month = 1 AND name != 'untouched'"
+            ).fetchone()[0] == 0
+        assert connection.execute('SELECT darf_value FROM month_results WHERE month = 1').fetchone()[0] == -1
+        assert connection.execute('SELECT year, month FROM month_results ORDER BY year, month').fetchall() == [
+            (2020, month) for month in range(1, 6)]
+        assert connection.execute('SELECT COUNT(*) FROM transactions WHERE operation_id = 100000').fetchone()[0] == 1
+        connection.close()
+        logging.info('Database: %d transactions saved and loaded', len(loaded.transactions))
+
+# Test5 (numpy engine against the scalar one)
+#----------------------------------------------------------------------------------------------------------------------
+    def test5(self):
+        logging.debug('Executing test 5')
+        if (not numpy_engine.available()):
+            logging.info('Numpy engine: numpy is not installed, skipping')
+            return
+        # The engine works in units with the roundings of the scalar passes, so the results are the same
+        for seed in range(20):
+            scalar = Control(False)
+            vectorized = Control(False, True)
+            self.__add_random_history(scalar, seed)
+            self.__add_random_history(vectorized, seed)
+            scalar.calculate_darf()
+            vectorized.calculate_darf()
+            assert scalar.result_snapshot.total_due_tax == vectorized.result_snapshot.total_due_tax
+            assert self.__results(scalar) == self.__results(vectorized), 'Mismatch (seed %d)' %seed
+            positions = lambda control: [(x.name, x.ammount, x.price_units, x.paid_fares_units) for x in
+                sorted(control.result_snapshot.stocks.values(), key=lambda x: x.name)]
+            assert positions(scalar) == positions(vectorized), 'Position mismatch (seed %d)' %seed
+            for month in range(1, 7):
+                scalar.calculate_month_darf(month, 2020)
+                vectorized.calculate_month_darf(month, 2020)
+                assert scalar.result_snapshot.darf_value == vectorized.result_snapshot.darf_value
+                assert self.__results(scalar) == self.__results(vectorized), 'Month %d mismatch' %month
+        # The money of the very large positions is kept in python ints instead of overflowing int64
+        scalar = Control(False)
+        vectorized = Control(False, True)
+        for control in (scalar, vectorized):
+            control.add_transaction('stock-a', 123456.78, StockTypes.NORMAL, 9 * 10**6, 1.5, 2, 1, 2020,
+                TransactionTypes.PURCHASE, 1)
+            control.add_transaction('stock-a', 234567.89, StockTypes.NORMAL, 3 * 10**6 + 1, 2.5, 3, 1, 2020,
+                TransactionTypes.SALE, 2)
+            assert control.calculate_darf()
+        assert self.__results(scalar) == self.__results(vectorized)
+        assert positions(scalar) == positions(vectorized)
+        logging.info('Numpy engine: 20 random histories checked')
+
+# Test6 (batch of accounts in a process pool against the sequential calculation)
+#----------------------------------------------------------------------------------------------------------------------
+    def test6(self):
+        logging.debug('Executing test 6')
+        accounts = {}
+        expected = {}
+        for seed in range(8):
+            control = Control(False)
+            self.__add_random_history(control, seed)
+            accounts['account-%d' %seed] = {'transactions': [(x.name, x.price, x.category, x.ammount, x.paid_fares,
+                x.operation_date.day, x.operation_date.month, x.operation_date.year, x.operation_type, x.operation_id)
+                for x in control.transactions]}
+            control.calculate_darf()
+            expected['account-%d' %seed] = control.darf_value
+        accounts['no-position'] = {'transactions': [('stock-a', 10.0, StockTypes.NORMAL, 10, 1.0, 1, 1, 2020,
+            TransactionTypes.SALE, 1)]}
+        accounts['invalid'] = {'transactions': [('stock-a', 10.0)]}
+        results = Batch(2, 3).calculate(accounts)
+        assert list(results) == list(accounts)
+        for account, darf_value in expected.items():
+            assert results[account]['error'] is None and results[account]['darf_value'] == darf_value, account
+        assert results['no-position']['error'] is not None and results['invalid']['error'] is not None
+        # A worker process that dies only fails its own account
+        accounts['killer'] = {'transactions': [WorkerKiller()]}
+        results = Batch(2, 3).calculate(accounts)
+        for account, darf_value in expected.items():
+            assert results[account]['error'] is None and results[account]['darf_value'] == darf_value, account
+        assert results['killer']['error'].startswith('BrokenProcessPool')
+        logging.info('Batch: %d accounts calculated, %d failures isolated', len(expected), 3)
+
+# Test7 (import of a B3 CEI style export against the same transactions added one by one)
+#----------------------------------------------------------------------------------------------------------------------
+    def test7(self):
+        logging.debug('Executing test 7')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'negociacao.csv')
+            with open(path, 'w', encoding='utf-8') as output:
+                output.write('Data do Negócio;Compra/Venda;Código;Quantidade;Preço (R$);Taxas (R$)\n'
+                    '02/01/2020;C;PETR4;100;30,50;1,20\n'
+                    '02/01/2020;C;PETR4F;7;30,60;0,10\n'
+                    '15/01/2020;X;PETR4;10;31,00;0,50\n'
+                    '03/02/2020;V;PETR4;50;1.032,10;2,30\n')
+            control = Control(False)
+            assert importer.import_file(control, path) == 3
+            # The export has no operation ids, so importing it again adds nothing
+            assert importer.import_file(control, path) == 0
+            other = os.path.join(directory, 'other.csv')
+            with open(other, 'w', encoding='utf-8') as output:
+                output.write('Data do Negócio,Compra/Venda,Código,Quantidade,Preço (R$),Taxas (R$)\n'
+                    '10/03/2020,C,VALE3,"1,000",50.25,0.75\n'
+                    '10/03/2020,C,VALE3,"1,000",50.25,0.75\n')
+            with open(path, 'w', encoding='utf-8') as output:
+                output.write('Data do Negócio;Compra/Venda;Código;Quantidade;Preço (R$);Taxas (R$)\n'
+                    '11/03/2020;C;VALE3;1.000;50,25;0,75\n'
+                    '12/03/2020;C;VALE3;10,5;50,25;0,75\n')
+            numbers = Control(False)
+            assert importer.import_file(numbers, other) == 2 and importer.import_file(numbers, path) == 1
+            assert [(x.ammount, x.price) for x in numbers.transactions] == [(1000, 50.25)] * 3
+        expected = Control(False)
+        expected.add_transaction('PETR4', 30.5, StockTypes.NORMAL, 100, 1.2, 2, 1, 2020, TransactionTypes.PURCHASE, 1)
+        expected.add_transaction('PETR4', 30.6, StockTypes.NORMAL, 7, 0.1, 2, 1, 2020, TransactionTypes.PURCHASE, 2)
+        expected.add_transaction('PETR4', 1032.1, StockTypes.NORMAL, 50, 2.3, 3, 2, 2020, TransactionTypes.SALE, 3)
+        key = lambda x: (x.operation_id, x.name, x.price, x.ammount, x.paid_fares, x.operation_date, x.operation_type)
+        assert [key(x) for x in control.transactions] == [key(x) for x in expected.transactions]
+        control.calculate_darf()
+        expected.calculate_darf()
+        assert self.__results(control) == self.__results(expected)
+        logging.info('Importer: %d transactions imported', len(control.transactions))
+
+# Test8 (browser session pool with a stand-in for the web driver)
+#----------------------------------------------------------------------------------------------------------------------
+    def test8(self):
+        logging.debug('Executing test 8')
+        class Session:
+            def __init__(self):
+                self.window_handles = ['form']
+                self.switch_to = self
+                self.broken = False
+                self.quitted = False
+            def window(self, handle):
+                pass
+            def close(self):
+                self.window_handles.pop()
+            def delete_all_cookies(self):
+                if (self.broken):
+                    raise ConnectionError('Browser is dead')
+            def get(self, url):
+                self.window_handles[1:] = []
+            def quit(self):
+                self.quitted = True
+        started = []
+        pool = SessionPool(lambda: started.append(Session()) or started[-1], 2)
+        def bill(number):
+            with pool.session() as session:
+                session.window_handles.append('bill-%d' %number)
+                session.broken = number == 10
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(bill, range(40)))
+        assert len(started) <= 3 and pool.created <= 2
+        assert all(session.window_handles == ['form'] for session in started if not session.broken)
+        assert all(session.quitted == session.broken for session in started)
+        pool.close()
+        assert all(session.quitted for session in started)
+        logging.info('Session pool: 40 bills with %d browser startups', len(started))
+
+# Test9 (http client of SicalcWeb against a local stand-in server)
+#----------------------------------------------------------------------------------------------------------------------
+    def test9(self):
+        logging.debug('Executing test 9')
+        server = SicalcServer()
+        answers = iter(['wrong', 'right', 'right'])
+        pool = sicalc_client.new_pool(1)
+        client = SicalcClient(False, pool, server.endpoint, captcha_solver=lambda image: next(answers))
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                client.set_downloads(directory)
+                record = client.generate('12345678901', datetime.date(2020, 1, 1), 123.45)
+                assert os.path.basename(record['bill']) == 'darf-12345678901-202001.pdf'
+                assert record['fields']['value'] == 123.45 and record['fields']['due_date'] == '28/01/2020'
+                # The record has the masked cpf and the steps of the browser flow
+                assert record['cpf'] == '*********01' and list(record['steps']) == ['navigate', 'state_city', 'code',
+                    'period_value', 'check', 'cpf', 'captcha', 'save']
+                record = client.generate('12345678901', datetime.date(2020, 1, 1), 10.0)
+                assert os.path.basename(record['bill']) == 'darf-12345678901-202001-2.pdf'
+                assert record['fields']['value'] == 10.0 and record['error'] is None
+                archive = os.path.join(directory, 'darfs.zip')
+                assert bill.export_month(directory, 1, 2020, archive) == 2
+                assert bill.export_month(directory, 2, 2020, archive) == 0
+            assert [path for path, _ in server.requests].count('/SicalcWeb/Valida.asp') == 3
+            assert ('/SicalcWeb/Valida.asp', {'Num_Princ': '123456789', 'Num_DV': '01', 'txtTexto_captcha': 'right',
+                'Continuar': 'Continuar'}) in server.requests
+            assert server.connections == 1 and server.sessions == 2
+            # A get closed without an answer is sent again, a form posted is not (the server may have handled it)
+            session = sicalc_client.HttpSession(5.0)
+            server.drop.update(('/SicalcWeb/UF.asp', '/SicalcWeb/Municipio.asp'))
+            url, _, content = session.request('GET', server.endpoint)
+            assert b'name="UF"' in content and server.dropped == ['/SicalcWeb/UF.asp']
+            posted = [path for path, _ in server.requests].count('/SicalcWeb/Municipio.asp')
+            try:
+                session.request('POST', urljoin(url, 'Municipio.asp'), {'UF': 'SP'})
+                assert False, 'The form was posted again'
+            except ConnectionError:
+                pass
+            assert [path for path, _ in server.requests].count('/SicalcWeb/Municipio.asp') == posted + 1
+            session.quit()
+        finally:
+            pool.close()
+            server.stop()
+        logging.info('Sicalc client: 2 bills with %d connection', server.connections)
+
+# Test10 (concurrent darf jobs parked at the captcha step until a stub solver answers them)
+#----------------------------------------------------------------------------------------------------------------------
+    def test10(self):
+        logging.debug('Executing test 10')
+        server = SicalcServer()
+        pool = sicalc_client.new_pool(4)
+        client = SicalcClient(False, pool, server.endpoint)
+        jobs = {'job-%d' %i: ('1234567890%d' %i, datetime.date(2020, i + 1, 1), 100.0 + i) for i in range(4)}
+        captchas = []
+        parked = []
+        async def solver(job, image):
+            captchas.append((job, image))
+            # All the jobs must be parked at the captcha step at the same time before the first answer
+            while (not parked and len(captcha_queue.pending) < len(jobs)):
+                await asyncio.sleep(0.01)
+            parked.append(True)
+            if (job == 'job-3'):
+                raise ValueError('Captcha not recognized')
+            return 'wrong' if captchas.count((job, image)) == 1 and job == 'job-1' else 'right'
+        async def main():
+            solver_task = asyncio.create_task(run_solver(captcha_queue, solver))
+            try:
+                return await DarfPipeline(client, captcha_queue, 4).run(jobs)
+            finally:
+                solver_task.cancel()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                client.set_downloads(directory)
+                captcha_queue = CaptchaQueue()
+                records = asyncio.run(main())
+                for i in range(3):
+                    # Each bill has the period and the value of its job, not the ones of the others
+                    _, date, value = jobs['job-%d' %i]
+                    with open(records['job-%d' %i]['bill'], 'rb') as document:
+                        assert document.read().startswith(b'%PDF-1.4 DARF 6015 ' + date.strftime('%m%Y').encode())
+                    fields = records['job-%d' %i]['fields']
+                    assert fields['value'] == value and fields['barcode'][23:29] == date.strftime('%m%Y')
+                    assert fields['due_date'] == date.strftime('28/%m/%Y')
+            assert records['job-3']['error'] is not None
+            assert sorted(job for job, _ in captchas) == ['job-0', 'job-1', 'job-1', 'job-2', 'job-3']
+        finally:
+            pool.close()
+            server.stop()
+        logging.info('Darf pipeline: %d jobs with %d captchas', len(jobs), len(captchas))
+
+# Test11 (background calculation task streaming the months and being cancelled)
+#----------------------------------------------------------------------------------------------------------------------
+    def test11(self):
+        logging.debug('Executing test 11')
+        control = Control(False)
+        self.__add_random_history(control, 11)
+        months = []
+        progress = []
+        calculation = task.Task(task.calculate_months, control)
+        calculation.connect(lambda done, total: progress.append((done, total)), months.append)
+        with ThreadPoolExecutor(1) as executor:
+            assert executor.submit(calculation.run).result() == 6
+        assert progress == [(i, 6) for i in range(1, 7)] and [period for period, _ in months] == control.periods
+        expected = Control(False)
+        self.__add_random_history(expected, 11)
+        assert expected.calculate_month_darf(6, 2020) and months[-1][1] == expected.results
+        control = Control(False)
+        self.__add_random_history(control, 11)
+        cancelled = task.Task(task.calculate_months, control)
+        cancelled.connect(lambda done, total: cancelled.cancel() if done == 2 else None)
+        try:
+            cancelled.run()
+            assert False, 'Task not cancelled'
+        except task.Cancelled:
+            pass
+        assert control.get_snapshot(3, 2020) is None and control.get_snapshot(2, 2020) is not None
+        logging.info('Background task: %d months streamed, cancelled after 2 months', len(months))
+
+# Test12
+#----------------------------------------------------------------------------------------------------------------------
+    def test12(self):
+        logging.debug('Executing test 12')
+        control = Control(False)
+        self.__add_random_history(control, 12)
+        view = TransactionView(control, batch_size=10)
+        assert view.total_count == len(control.transactions) and view.row_count == 10
+        while (view.can_fetch_more()):
+            first, last = view.fetch_more()
+            assert last - first + 1 <= 10
+        assert view.row_count == view.total_count and view.next_batch() == 0
+        dates = [view.transaction(row).operation_date for row in range(view.row_count)]
+        assert dates == sorted(dates)
+        view.set_filter(2020, 3)
+        expected = [x for x in control.transactions if x.operation_date.month == 3]
+        assert view.total_count == len(expected) and view.row_count == min(10, len(expected))
+        # A month without a year is the month of all the years, and a year alone is the whole year
+        control.add_transaction('stock-c', 10.0, StockTypes.NORMAL, 1, 0.0, 2, 3, 2021, TransactionTypes.PURCHASE,
+            90000)
+        view.set_filter(month=3)
+        assert view.total_count == len(expected) + 1
+        view.set_filter(year=2020)
+        assert view.total_count == len(control.transactions) - 1
+        view.set_filter(month=3, name='nothing')
+        assert view.total_count == 0
+        # The rows of the transactions removed after the last refresh are empty, not errors
+        view.set_filter(2020, 3)
+        removed = view.transaction(0).operation_id
+        control.remove_transaction(removed)
+        assert view.transaction(0) is None and view.value(0, 2) is None
+        view.sort(2)
+        assert view.value(view.total_count - 1, 2) is None
+        view.refresh()
+        assert view.total_count == len(expected) - 1
+        view.set_filter(name='fund-a', category=StockTypes.FI)
+        expected = [x for x in control.transactions if x.name == 'fund-a']
+        assert view.total_count == len(expected)
+        assert all(view.value(row, 2) == 'fund-a' for row in range(view.row_count))
+        view.sort(5, True)
+        prices = [view.transaction(row).price for row in range(view.total_count)]
+        assert prices == sorted(prices, reverse=True)
+        control.add_transaction('fund-a', 1.0, StockTypes.FI, 1, 0.0, 1, 7, 2020, TransactionTypes.PURCHASE, 100000)
+        view.refresh()
+        assert view.total_count == len(expected) + 1 and view.transaction(view.total_count - 1).price == 1.0
+        logging.info('Transaction view: %d transactions, %d of fund-a', len(control.transactions), len(expected))
+
+# Test13
+#----------------------------------------------------------------------------------------------------------------------
+    def test13(self):
+        logging.debug('Executing test 13')
+        root = os.path.dirname(os.path.abspath(__file__)) + '/..'
+        environment = dict(os.environ, PYTHONPATH=root)
+        for module in ('src.cli', 'include.darf', 'include.task'):
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], env=environment,
+                stderr=subprocess.PIPE, universal_newlines=True)
+            imported = [line.split('|')[-1].strip() for line in process.stderr.splitlines()]
+            assert process.returncode == 0 and module in imported, 'Module %s not imported' %module
+            for heavy in ('numpy', 'PySide2', 'selenium', 'openpyxl'):
+                assert heavy not in imported, 'Module %s imports %s' %(module, heavy)
+        control = Control(False)
+        self.__add_random_history(control, 13)
+        expected = Control(False)
+        self.__add_random_history(expected, 13)
+        assert expected.calculate_month_darf(6, 2020)
+        with tempfile.TemporaryDirectory() as directory:
+            assert control.save_operations(os.path.join(directory, 'darf.db'))
+            process = subprocess.run([sys.executable, root + '/src/cli.py', '-d', os.path.join(directory, 'darf.db')],
+                env=environment, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        lines = process.stdout.splitlines()
+        assert len(lines) == 6 and lines[-1].startswith('06/2020')
+        assert lines[-1].endswith('darf ' + money.to_text(expected.darf_value))
+        assert money.to_text(1234567.891) == 'R$ 1.234.567,89' and money.to_text(0.5) == 'R$ 0,50'
+        logging.info('Headless command line: no gui, browser or numpy imported, %d months printed', len(lines))
+
+# Test14
+#----------------------------------------------------------------------------------------------------------------------
+    def test14(self):
+        logging.debug('Executing test 14')
+        expected = Control(False)
+        self.__add_random_history(expected, 14)
+        months = {}
+        for month in range(1, 8):
+            assert expected.calculate_month_darf(month, 2020)
+            months['%02d/2020' %month] = expected.results
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ('first.db', 'second.db', 'broken.csv', 'out')]
+            for path, seed in zip(paths, (14, 15)):
+                control = Control(False)
+                self.__add_random_history(control, seed)
+                assert control.save_operations(path)
+            with open(paths[2], 'w') as output:
+                output.write('Data;Compra/Venda;Codigo;Quantidade;Preco\n01/01/2020;V;stock-a;10;10,00\n')
+            # A month range of one database as json, saving the months for the next run
+            assert cli.main(['-d', paths[0], '--from', '02/2020', '--to', '07/2020', '-f', 'json', '-o', paths[3],
+                '-s']) == 0
+            with open(paths[3]) as output:
+                records = json.load(output)
+            assert [values['period'] for values in records] == ['%02d/2020' %month for month in range(2, 8)]
+            for values in records:
+                results = months[values['period']]
+                assert values['darf_value'] == results['darf_value']
+                assert values['total_sale_normal'] == results['total_sale']['normal']
+                assert values['accumulated_loss_fi'] == results['accumulated_loss']['fi']
+            control = Control(False)
+            assert control.load_operations(paths[0]) and control.get_snapshot(7, 2020) is not None
+            # The next run of a single month starts from the saved snapshot of the previous month
+            assert cli.main(['-d', paths[0], '-m', '6', '-y', '2020', '-f', 'csv', '-o', paths[3]]) == 0
+            with open(paths[3]) as output:
+                rows = list(csv.DictReader(output))
+            assert len(rows) == 1 and float(rows[0]['darf_value']) == months['06/2020']['darf_value']
+            # An import with a single month saved keeps the transactions of the other months of the database
+            database = os.path.join(directory, 'import.db')
+            with open(paths[0], 'rb') as source, open(database, 'wb') as target:
+                target.write(source.read())
+            export = os.path.join(directory, 'export.csv')
+            with open(export, 'w') as output:
+                output.write('Data;Compra/Venda;Codigo;Quantidade;Preco\n10/06/2020;C;stock-c;10;10,00\n')
+            key = lambda x: (x.operation_id, x.name, x.price_units, x.ammount, x.operation_date, x.operation_type)
+            before = sorted(key(x) for x in control.transactions)
+            assert cli.main(['-d', database, '-m', '6', '-y', '2020', '-i', export, '-s', '-o', paths[3]]) == 0
+            saved = Control(False)
+            assert saved.load_operations(database)
+            new = saved.find_transaction(before[-1][0] + 1)
+            assert new is not None and new.name == 'STOCK-C'
+            assert sorted(key(x) for x in saved.transactions if x is not new) == before
+            # The ids of a control loaded with a single month come after the ones of the months not loaded
+            scoped = Control(False)
+            assert scoped.load_operations(database, 6, 2020) and scoped.next_operation_id == before[-1][0] + 2
+            # Many accounts in parallel, one of them failing alone
+            assert cli.main(['-a', paths[0], paths[1], paths[2], '-w', '2', '-f', 'json', '-o', paths[3]]) == 1
+            with open(paths[3]) as output:
+                records = json.load(output)
+        accounts = {}
+        for values in records:
+            accounts.setdefault(values['account'], []).append(values)
+        assert len(accounts['first']) == 6 and accounts['first'][-1]['darf_value'] == months['06/2020']['darf_value']
+        assert len(accounts['second']) == 6 and all(values['error'] is None for values in accounts['second'])
+        assert len(accounts['broken']) == 1 and accounts['broken'][0]['error'] is not None
+        logging.info('Command line: %d records of %d accounts, %s', len(records), len(accounts),
+            accounts['broken'][0]['error'])
+
+# Test15
+#----------------------------------------------------------------------------------------------------------------------
+    def test15(self):
+        logging.debug('Executing test 15')
+        history = list(synthetic_history(3000, 15, tickers=40, years=1))
+        control = Control(False)
+        for transaction in history:
+            control.add_transaction(*transaction)
+        assert control.stats is None
+        laps = []
+        assert control.set_stats(True, True, lambda phase, seconds: laps.append(phase))
+        assert control.calculate_darf()
+        stats = control.stats.as_dict()
+        phases = ('sort', 'day_trade_matching', 'fi_pass', 'day_trade_pass', 'normal_pass', 'calculate_darf')
+        assert all(stats['phases'][phase] >= 0.0 for phase in phases) and laps == list(phases)
+        assert stats['phases']['calculate_darf'] >= sum(stats['phases'][phase] for phase in phases[:-1])
+        counters = stats['counters']
+        assert counters['fills'] == len(history) and counters['day_trade_pairs'] > 0
+        assert 0 < counters['positions_touched'] <= 40 and counters['position_lookups'] <= len(history)
+        assert '__process_transactions' in control.stats.profile_report()
+        expected = Control(False)
+        for transaction in history:
+            expected.add_transaction(*transaction)
+        assert expected.calculate_darf() and expected.results == control.results
+        # The stats are of the last run only
+        control.find_stock('STCK1')
+        assert control.calculate_month_darf(6, 2015)
+        counters = control.stats.counters
+        assert counters['months_replayed'] == 6 and 'stock_lookups' not in counters
+        assert set(control.stats.phases) == set(phases[:-1]) | {'calculate_month_darf'}
+        assert control.set_stats(False) and control.stats is None and control.calculate_month_darf(7, 2015)
+        logging.info('Stats: %d fills, %d day trade pairs, %d positions', stats['counters']['fills'],
+            stats['counters']['day_trade_pairs'], stats['counters']['positions_touched'])
+
+# Test16
+#----------------------------------------------------------------------------------------------------------------------
+    def test16(self):
+        logging.debug('Executing test 16')
+        control = Control(False)
+        self.__add_random_history(control, 16)
+        assert control.calculate_month_darf(3, 2020)
+        results = control.results
+        darf_value = control.darf_value
+        preview = control.preview(6, 2020)
+        assert preview is not None and preview.period == (2020, 6)
+        # The preview does not change the results of the month calculated before it
+        assert control.results == results and control.darf_value == darf_value
+        assert control.result_snapshot.period == (2020, 3)
+        assert control.calculate_month_darf(6, 2020)
+        results = control.results
+        stocks = control.get_snapshot(6, 2020).stocks
+        held = {name: stock.ammount for name, stock in stocks.items()}
+        scenarios = [
+            [('stock-a', 20.0, StockTypes.NORMAL, held.get('stock-a', 0), 3.5, TransactionTypes.SALE)],
+            [('fund-a', 200.0, StockTypes.FI, max(1, held.get('fund-a', 0) // 2), 1.0, TransactionTypes.SALE)],
+            [('stock-b', 30.0, StockTypes.NORMAL, 100, 1.0, TransactionTypes.PURCHASE),
+                ('stock-b', 45.0, StockTypes.NORMAL, 60, 1.0, TransactionTypes.SALE),
+                ('stock-new', 10.0, StockTypes.NORMAL, 10, 0.0, TransactionTypes.PURCHASE)],
+            [('stock-b', 300.0, StockTypes.NORMAL, held.get('stock-b', 0), 0.0, TransactionTypes.SALE)]]
+        scenarios = [orders for orders in scenarios if all(order[3] > 0 for order in orders)]
+        assert len(scenarios) >= 3
+        first = preview.evaluate(scenarios[0])
+        for orders in scenarios:
+            value = preview.evaluate(orders)
+            assert value == preview.evaluate(orders), 'The scenario changed the fork'
+            expected = Control(False)
+            self.__add_random_history(expected, 16)
+            for i, (name, price, category, ammount, paid_fares, operation_type) in enumerate(orders):
+                expected.add_transaction(name, price, category, ammount, paid_fares, 30, 6, 2020, operation_type,
+                    100000 + i)
+            assert expected.calculate_month_darf(6, 2020)
+            assert value['darf_value'] == expected.darf_value, (value['darf_value'], expected.darf_value)
+            for key in ('total_purchase', 'total_sale', 'total_profit', 'total_due_tax', 'accumulated_loss'):
+                assert value['results'][key] == expected.results[key], key
+                assert all(abs(value['delta'][key][category] - (expected.results[key][category] -
+                    results[key][category])) < 1e-6 for category in ('normal', 'day_trade', 'fi')), key
+            assert abs(value['darf_delta'] - (expected.darf_value - results['darf_value'])) < 1e-6
+        assert preview.evaluate([('stock-c', 10.0, StockTypes.NORMAL, 1, 0.0, TransactionTypes.SALE)]) is None
+        assert control.results == results and control.get_snapshot(6, 2020).stocks.keys() == stocks.keys()
+        assert all(control.get_snapshot(6, 2020).find_stock(name).ammount == held[name] for name in held)
+        # The fork keeps its state when the control changes
+        control.add_transaction('stock-a', 10.0, StockTypes.NORMAL, 10, 0.0, 2, 6, 2020, TransactionTypes.PURCHASE,
+            200000)
+        assert preview.evaluate(scenarios[0]) == first
+        start = time.perf_counter()
+        values = preview.evaluate_many([scenarios[i % len(scenarios)] for i in range(1000)])
+        elapsed = time.perf_counter() - start
+        assert len(values) == 1000 and all(value is not None for value in values)
+        logging.info('Preview: %d scenarios in %.1f us per scenario', len(values), elapsed * 1e6 / len(values))
+
+# Replay the transactions of a control up to a date in a new control (return the positions at the end of the date)
+#----------------------------------------------------------------------------------------------------------------------
+    def __positions_until(self, control, date):
+        replay = Control(False)
+        for x in control.transactions:
+            if (x.operation_date <= date):
+                replay.add_transaction(x.name, x.price, x.category, x.ammount, x.paid_fares, x.operation_date.day,
+                    x.operation_date.month, x.operation_date.year, x.operation_type, x.operation_id)
+        assert replay.calculate_darf()
+        return replay.result_snapshot.stocks
+
+# Test17
+#----------------------------------------------------------------------------------------------------------------------
+    def test17(self):
+        logging.debug('Executing test 17')
+        control = Control(False)
+        for transaction in synthetic_history(2000, 17, tickers=30, years=1, first_year=2020):
+            control.add_transaction(*transaction)
+        names = sorted({x.name for x in control.transactions})
+        same = lambda first, second: (first is None and second is None) or (first is not None and second is not None
+            and (first.ammount, first.price_units, first.paid_fares_units) == (second.ammount, second.price_units,
+            second.paid_fares_units))
+        dates = [datetime.date(2020, 3, 14), datetime.date(2020, 8, 1), datetime.date(2019, 12, 31)]
+        for date in dates:
+            expected = self.__positions_until(control, date)
+            assert all(same(control.get_position(name, date), expected.get(name)) for name in names), date
+        for month in range(1, 13):
+            assert control.calculate_month_darf(month, 2020)
+            snapshot = control.get_snapshot(month, 2020)
+            date = datetime.date(2020, month, 28)
+            assert all(same(control.get_position(name, date), snapshot.find_stock(name)) for name in names), month
+        # The ledger is updated with the transactions appended, inserted in the past, edited and removed
+        position = control.get_position(names[0], datetime.date(2020, 12, 28))
+        control.add_transaction(names[0], 10.0, position.category, 10, 1.0, 28, 12, 2020, TransactionTypes.PURCHASE,
+            10000)
+        control.add_transaction(names[1], 10.0, StockTypes.NORMAL if names[1].startswith('STCK') else StockTypes.FI,
+            10, 1.0, 2, 3, 2020, TransactionTypes.PURCHASE, 10001)
+        transaction = [x for x in control.transactions
+            if x.operation_date.month == 5 and x.operation_type == TransactionTypes.PURCHASE][0]
+        assert control.edit_transaction(transaction.operation_id, transaction.name, transaction.price + 1.0,
+            transaction.category, transaction.ammount, transaction.paid_fares, 1, 4, 2020, transaction.operation_type)
+        assert control.remove_transaction(10001)
+        for date in dates + [datetime.date(2020, 12, 28)]:
+            expected = self.__positions_until(control, date)
+            assert all(same(control.get_position(name, date), expected.get(name)) for name in names), date
+        assert control.get_position(names[0], datetime.date(2020, 12, 28)).ammount == position.ammount + 10
+        assert control.get_position('STCK-none', datetime.date(2020, 12, 28)) is None
+        # A sale without position makes the positions invalid only from its day on
+        control.add_transaction(names[0], 10.0, position.category, 10**6, 0.0, 1, 7, 2020, TransactionTypes.SALE,
+            10002)
+        assert control.get_position(names[0], datetime.date(2020, 7, 1)) is None
+        assert same(control.get_position(names[0], datetime.date(2020, 6, 30)),
+            self.__positions_until(control, datetime.date(2020, 6, 30)).get(names[0]))
+        assert control.remove_transaction(10002) and control.get_position(names[0], datetime.date(2020, 7, 1))
+        start = time.perf_counter()
+        for i in range(10000):
+            control.get_position(names[i % len(names)], datetime.date(2020, 1 + i % 12, 1 + i % 28))
+        elapsed = time.perf_counter() - start
+        logging.info('Position ledger: %d stocks, %.1f us per query', len(names), elapsed * 1e6 / 10000)
+# Test18
+#----------------------------------------------------------------------------------------------------------------------
+    def test18(self):
+        logging.debug('Executing test 18')
+        history = list(synthetic_history(2000, 18, tickers=30, years=1, first_year=2020))
+        cache = ResultCache(64)
+        control = Control(False)
+        assert control.cache is None and control.set_cache(cache=cache, account='a') and control.cache is cache
+        for transaction in history:
+            control.add_transaction(*transaction)
+        assert control.calculate_month_darf(12, 2020)
+        results = control.results
+        assert (cache.hits, cache.misses, len(cache)) == (0, 12, 12)
+        # An edit undone is served from the cache, only the months after the edited one are calculated again
+        edited = [x for x in control.transactions
+            if x.operation_date.month == 5 and x.operation_type == TransactionTypes.PURCHASE][0]
+        values = (edited.name, edited.price, edited.category, edited.ammount, edited.paid_fares,
+            edited.operation_date.day, 5, 2020, edited.operation_type)
+        edited = edited.operation_id
+        assert control.edit_transaction(edited, values[0], values[1] + 1.0, *values[2:])
+        assert control.calculate_month_darf(12, 2020) and (cache.hits, cache.misses) == (0, 20)
+        assert control.set_stats(True)
+        assert control.edit_transaction(edited, *values)
+        assert control.calculate_month_darf(12, 2020) and control.results == results
+        assert (cache.hits, cache.misses) == (8, 20) and control.stats.counters['cache_hits'] == 8
+        assert 'months_replayed' not in control.stats.counters
+        # The controls of the same account share the results, the other accounts do not
+        for account, hits, misses in (('a', 20, 20), ('b', 20, 32)):
+            other = Control(False)
+            assert other.set_cache(cache=cache, account=account)
+            for transaction in history:
+                other.add_transaction(*transaction)
+            assert other.calculate_month_darf(12, 2020) and other.results == results
+            assert (cache.hits, cache.misses) == (hits, misses), account
+        # The stock editors change the opening positions of all the months
+        assert control.add_stock('STCK-extra', 10.0, StockTypes.NORMAL, 100, 0.0)
+        assert control.calculate_month_darf(12, 2020) and (cache.hits, cache.misses) == (20, 44)
+        assert control.remove_stock('STCK-extra')
+        assert control.calculate_month_darf(12, 2020) and control.results == results and cache.hits == 32
+        # The whole calculation is served from the cache too and never changes the registered positions
+        expected = Control(False)
+        for transaction in history:
+            expected.add_transaction(*transaction)
+        assert expected.calculate_darf()
+        positions = lambda control: {name: x.ammount for name, x in control.result_snapshot.stocks.items()}
+        for hits in (32, 33):
+            other = Control(False)
+            other.set_cache(cache=cache, account='a')
+            for transaction in history:
+                other.add_transaction(*transaction)
+            assert other.calculate_darf() and other.results == expected.results and cache.hits == hits
+            assert positions(other) == positions(expected)
+        assert other.calculate_darf() and expected.calculate_darf() and cache.hits == 34
+        assert other.results == expected.results and positions(other) == positions(expected) and not other.stocks
+        # The least recently used results are evicted
+        small = ResultCache(4)
+        other = Control(False)
+        other.set_cache(cache=small)
+        for transaction in history:
+            other.add_transaction(*transaction)
+        assert other.calculate_month_darf(12, 2020) and other.results == results
+        assert len(small) == 4 and small.evictions == 8 and small.as_dict()['misses'] == 12
+        # The digests of the keys are the same in another process, with another seed of hash()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join((directory + '/..', directory)), PYTHONHASHSEED='1')
+        process = subprocess.run([sys.executable, '-c', 'from history import synthetic_history\n'
+            'from src.control import Control\ncontrol = Control(False)\ncontrol.set_cache()\n'
+            'for transaction in synthetic_history(2000, 18, tickers=30, years=1, first_year=2020):\n'
+            '    control.add_transaction(*transaction)\ncontrol.calculate_month_darf(12, 2020)\n'
+            'print(control.get_snapshot(12, 2020).digest)'], env=environment, stdout=subprocess.PIPE,
+            universal_newlines=True)
+        assert process.returncode == 0 and process.stdout.strip() == other.get_snapshot(12, 2020).digest
+        start = time.perf_counter()
+        for i in range(100):
+            assert control.edit_transaction(edited, values[0], values[1] + (i + 1) % 2, *values[2:])
+            assert control.calculate_month_darf(12, 2020)
+        elapsed = time.perf_counter() - start
+        assert control.results == results
+        logging.info('Result cache: %d hits, %d misses, %.2f ms per edit undone', cache.hits, cache.misses,
+            elapsed * 1e3 / 100)
+        assert control.set_cache(False) and control.cache is None
+# Test19
+#----------------------------------------------------------------------------------------------------------------------
+    def test19(self):
+        logging.debug('Executing test 19')
+        lock = ReadWriteLock()
+        inside = threading.Barrier(3, timeout=5)
+        def read():
+            with lock.reader:
+                inside.wait()
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for thread in readers:
+            thread.start()
+        # The readers hold the lock together
+        inside.wait()
+        for thread in readers:
+            thread.join()
+        # The writer can read and write again, a reader can not write
+        with lock.writer:
+            with lock.reader, lock.writer:
+                pass
+        with lock.reader:
+            try:
+                with lock.writer:
+                    assert False, 'A reader became a writer'
+            except RuntimeError:
+                pass
+        history = list(synthetic_history(2000, 19, tickers=30, years=1, first_year=2020))
+        control = Control(False)
+        for transaction in history:
+            control.add_transaction(*transaction)
+        edited = [x for x in control.transactions if x.operation_date.month == 2][0]
+        values = (edited.name, edited.price, edited.category, edited.ammount, edited.paid_fares,
+            edited.operation_date.day, 2, 2020, edited.operation_type)
+        edited = edited.operation_id
+        # The valid results are the ones of each month with the transaction edited or not
+        valid = []
+        for price in (values[1], values[1] + 1.0):
+            control.edit_transaction(edited, values[0], price, *values[2:])
+            for month in range(1, 13):
+                assert control.calculate_month_darf(month, 2020)
+                valid.append(control.results)
+        # The readers of the registered operations run during a calculation and the writers wait for it
+        events = []
+        writers = []
+        def read_and_write():
+            reader = threading.Thread(target=lambda: events.append(len(control.periods)))
+            reader.start()
+            reader.join(5)
+            writer = threading.Thread(target=lambda: events.append(control.remove_transaction(edited)))
+            writer.start()
+            writer.join(0.2)
+            events.append(writer.is_alive())
+            writers.append(writer)
+        control.edit_transaction(edited, *values)
+        control.set_stats(True, hook=lambda phase, seconds: phase == 'sort' and not events and read_and_write())
+        assert control.calculate_month_darf(12, 2020) and control.results == valid[11]
+        writers[0].join()
+        assert events == [12, True, True], events
+        assert control.find_transaction(edited) is None and control.results == valid[11]
+        control.set_stats(False)
+        assert control.add_transaction(*[x for x in history if x[9] == edited][0])
+        # The results read while the months are calculated and the transactions edited are always of a single month
+        stop = threading.Event()
+        errors = []
+        def calculate():
+            while (not stop.is_set()):
+                for month in range(1, 13):
+                    if (not control.calculate_month_darf(month, 2020)):
+                        errors.append(month)
+        def edit():
+            for i in range(50):
+                control.edit_transaction(edited, values[0], values[1] + i % 2, *values[2:])
+                time.sleep(0.001)
+        def check():
+            checked = 0
+            while (not stop.is_set()):
+                results = control.results
+                if (results not in valid):
+                    errors.append(results)
+                checked += 1
+            events.append(checked)
+        threads = [threading.Thread(target=function) for function in (calculate, check, check, check)]
+        for thread in threads:
+            thread.start()
+        edit()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors[:1]
+        # The registered objects read are never changed by the editors or the calculation
+        transaction = control.find_transaction(edited)
+        price = transaction.price
+        assert control.edit_transaction(edited, values[0], price + 5.0, *values[2:])
+        assert transaction.price == price and abs(control.find_transaction(edited).price - price - 5.0) < 1e-6
+        assert control.add_stock('STCK-extra', 10.0, StockTypes.NORMAL, 100, 0.0)
+        stock = control.find_stock('STCK-extra')
+        assert control.edit_stock('STCK-extra', 12.0, StockTypes.NORMAL, 200, 0.0) and stock.ammount == 100
+        stock = control.find_stock('STCK-extra')
+        control.calculate_darf()
+        assert stock.ammount == 200 and control.result_snapshot.period == (0, 0)
+        logging.info('Thread safe control: %d results read during the calculations', sum(events[3:]))
 #----------------------------------------------------------------------------------------------------------------------
 
 test = Test(False)
-test.test1()
\ No newline at end of file
+test.test1()
+test.test2()
+test.test3()
+test.test4()
+test.test5()
+test.test6()
+test.test7()
+test.test8()
+test.test9()
+test.test10()
+test.test11()
+test.test12()
+test.test13()
+test.test14()
+test.test15()
+test.test16()
+test.test17()
+test.test18()
+test.test19()